@@ -1,23 +1,129 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-from services.wikipedia_service import WikipediaHelper
+from flask import Flask, render_template, request, redirect, url_for, jsonify, g, make_response, current_app, stream_with_context, abort
+from functools import wraps
+from werkzeug.middleware.proxy_fix import ProxyFix
+from services.wikipedia_service import SPARQL_ENDPOINT, WIKIDATA_ENDPOINT
+from services.helper_pool import WikipediaHelperPool
+from services.async_wikipedia_service import AsyncWikipediaHelper
+from services.admission import AdmissionControl, ClientRateLimiter, ConcurrencyLimiter
+from services.cache import SQLiteCache
+from services.dump_store import DumpStore
+from services.entity_store import EntityRefresher, EntityStore
+from services.event_loop import BackgroundLoop
+from services.http_client import DEFAULT_USER_AGENT, PooledSession
+from services.logging_setup import configure_logging, new_request_id, request_id_var
+from services.output_cache import OutputCache
+from services.random_pool import RandomCharacterPool
+from services.resilience import circuit_breaker, revalidator, start_budget
+from services.suggest_index import DEFAULT_SUGGEST_LIMIT
+from services.thumbnails import FILE_PATH_ENDPOINT, ThumbnailCache, ThumbnailProxy, image_file_name, snap_width, thumbnail_url
+from services.tracing import RequestTrace, current_trace, metrics
+from services.warmup import Warmup, mine_top_queries, read_query_list
+import atexit
+import os
+import json
 import time
 import logging
 import traceback
 import random
 
-# Настраиваем логирование
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
+LOG_FILE = os.environ.get("WHOAMI_LOG_FILE", "app.log")
+
+# Настраиваем логирование: запись в файл и консоль идёт в фоновом потоке через очередь
+configure_logging(
+    level=os.environ.get("WHOAMI_LOG_LEVEL", "INFO"),
+    log_file=LOG_FILE,
+    structured=os.environ.get("WHOAMI_LOG_FORMAT", "text") == "json",
+    body_sample_rate=float(os.environ.get("WHOAMI_LOG_BODY_SAMPLE", "0"))
 )
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-wikipedia_helper = WikipediaHelper()
+
+# Сколько прокси перед приложением добавляют X-Forwarded-For: по нему определяется адрес клиента
+PROXY_COUNT = int(os.environ.get("WHOAMI_PROXY_COUNT", "0"))
+if PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_COUNT)
+
+# Общий для всех воркеров gunicorn кэш ответов Wikidata на диске
+CACHE_PATH = os.environ.get(
+    "WHOAMI_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "wikidata.sqlite3")
+)
+CACHE_MAX_BYTES = int(os.environ.get("WHOAMI_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# Локальный индекс кандидатов для случайного выбора, общий для воркеров
+CANDIDATES_PATH = os.environ.get(
+    "WHOAMI_CANDIDATES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "candidates.json")
+)
+
+# Готовые страницы персонажей с номерами ревизий Wikidata
+ENTITY_STORE_PATH = os.environ.get(
+    "WHOAMI_ENTITY_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "entities.sqlite3")
+)
+
+# Автономный режим: локальный срез дампа Wikidata (python -m services.dump_ingest) вместо API
+OFFLINE_DB = os.environ.get("WHOAMI_OFFLINE_DB")
+offline_store = DumpStore(OFFLINE_DB) if OFFLINE_DB else None
+
+# Языки данных, доступные через ?lang=; первый используется по умолчанию
+LANGUAGES = [lang.strip() for lang in os.environ.get("WHOAMI_LANGUAGES", "ru,en").split(",") if lang.strip()]
+
+wikipedia_helpers = WikipediaHelperPool(
+    LANGUAGES,
+    wikidata_endpoint=os.environ.get("WHOAMI_WIKIDATA_ENDPOINT", WIKIDATA_ENDPOINT),
+    sparql_endpoint=os.environ.get("WHOAMI_SPARQL_ENDPOINT", SPARQL_ENDPOINT),
+    cache=SQLiteCache(CACHE_PATH, max_bytes=CACHE_MAX_BYTES),
+    # Кандидаты, сохранённые из SPARQL, могут отсутствовать в срезе дампа
+    candidates_path=None if offline_store else CANDIDATES_PATH,
+    entity_store=EntityStore(ENTITY_STORE_PATH),
+    offline=offline_store,
+    http=PooledSession(
+        user_agent=os.environ.get("WHOAMI_USER_AGENT", DEFAULT_USER_AGENT),
+        pool_maxsize=int(os.environ.get("WHOAMI_HTTP_POOL_SIZE", "16"))
+    )
+)
+# Помощник основного языка: фоновые задачи и запасные варианты
+wikipedia_helper = wikipedia_helpers.default
+
+# Фоновая проверка ревизий сохранённых персонажей пакетами по 50
+entity_refreshers = [
+    EntityRefresher(
+        helper,
+        interval=float(os.environ.get("WHOAMI_ENTITY_REFRESH_INTERVAL", "600")),
+        revalidate_after=float(os.environ.get("WHOAMI_ENTITY_REVALIDATE_AFTER", "3600"))
+    )
+    for helper in wikipedia_helpers
+]
+
+# Миниатюры изображений персонажей на диске, общие для воркеров
+THUMBNAIL_DIR = os.environ.get(
+    "WHOAMI_THUMBNAIL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "thumbnails")
+)
+thumbnails = ThumbnailProxy(
+    ThumbnailCache(THUMBNAIL_DIR, max_bytes=int(os.environ.get("WHOAMI_THUMBNAIL_MAX_MB", "512")) * 1024 * 1024),
+    wikipedia_helper.http,
+    endpoint=os.environ.get("WHOAMI_COMMONS_FILE_ENDPOINT", FILE_PATH_ENDPOINT),
+    offline=offline_store is not None
+)
+# Сколько браузеры и прокси хранят миниатюру без перепроверки (в секундах)
+IMAGE_MAX_AGE = int(os.environ.get("WHOAMI_IMAGE_MAX_AGE", str(7 * 24 * 3600)))
+
+# Кэш готовых страниц поиска, общий для воркеров
+output_cache = OutputCache(
+    wikipedia_helper.cache,
+    ttl=float(os.environ.get("WHOAMI_PAGE_TTL", "600"))
+)
+
+# Заранее подготовленные случайные персонажи, пополняются в фоне
+random_pool = RandomCharacterPool(
+    wikipedia_helper,
+    size=int(os.environ.get("WHOAMI_RANDOM_POOL_SIZE", "20"))
+)
+# Сколько /api/random ждёт пополнения пустого пула перед запасным вариантом
+RANDOM_POOL_WAIT = float(os.environ.get("WHOAMI_RANDOM_POOL_WAIT", "2"))
 
 # Список известных персонажей для использования в качестве запасного варианта
 FALLBACK_CHARACTERS = {
@@ -37,17 +143,297 @@ FALLBACK_CHARACTERS = {
     ]
 }
 
+# Панель с обращениями к Wikidata внизу HTML-страниц, включается параметром ?debug=1
+DEBUG_PANEL = os.environ.get("WHOAMI_DEBUG_PANEL", "0") == "1"
+# Страница результатов поиска загружает их потоком из /api/search/stream
+STREAM_SEARCH = os.environ.get("WHOAMI_STREAM_SEARCH", "1") == "1"
+
+def build_warmup():
+    """Warm-up of fallback characters, a query list file and the most popular queries from the log"""
+    top = int(os.environ.get("WHOAMI_WARMUP_TOP", "20"))
+    queries, entity_ids = mine_top_queries(LOG_FILE, top) if LOG_FILE and top else ([], [])
+    queries_file = os.environ.get("WHOAMI_WARMUP_QUERIES")
+    if queries_file:
+        queries = read_query_list(queries_file) + queries
+    fallback_ids = [char['id'] for chars in FALLBACK_CHARACTERS.values() for char in chars]
+    return Warmup(wikipedia_helper, fallback_ids + entity_ids, queries,
+                  workers=int(os.environ.get("WHOAMI_WARMUP_WORKERS", "8")))
+
+# Прогрев кэшей в фоне при старте; балансировщик ждёт готовности по /ready.
+# Выключенный прогрев не собирается вовсе: разбор лога запросов занимает время импорта
+WARMUP_ENABLED = os.environ.get("WHOAMI_WARMUP", "1") == "1"
+warmup = build_warmup() if WARMUP_ENABLED else None
+
+def start_background():
+    """Start the background threads of this process: revision checks, random pool refills and the warm-up"""
+    for refresher in entity_refreshers:
+        refresher.start()
+    random_pool.start()
+    if WARMUP_ENABLED:
+        warmup.start()
+
+# Под gunicorn с preload_app потоки не переживут fork: их запускает post_fork в каждом воркере (gunicorn.conf.py)
+if os.environ.get("WHOAMI_DEFER_BACKGROUND", "0") != "1":
+    start_background()
+
+@app.cli.command('warmup')
+def warmup_command():
+    """Preload the shared caches and wait until the warm-up is done"""
+    cli_warmup = warmup or build_warmup()
+    cli_warmup.wait()
+    print(cli_warmup.status())
+
+# Сколько секунд запрос может суммарно ждать Wikidata; затем обращения отклоняются без сети
+REQUEST_BUDGET = float(os.environ.get("WHOAMI_REQUEST_BUDGET", "8"))
+# Пакетному запросу нужно больше времени, чем одной странице
+ROUTE_BUDGETS = {
+    'api_entities': float(os.environ.get("WHOAMI_BATCH_REQUEST_BUDGET", "60")),
+}
+
+@app.before_request
+def assign_request_id():
+    # Идентификатор запроса для связи записей лога; берём из заголовка прокси, если он есть
+    request_id_var.set(request.headers.get('X-Request-ID') or new_request_id())
+    current_trace.set(RequestTrace())
+    start_budget(ROUTE_BUDGETS.get(request.endpoint, REQUEST_BUDGET))
+
+# Дорогие маршруты: поиск расходится в десятки запросов к Wikidata, случайный персонаж
+# и пакетный запрос занимают поток на секунды, миниатюра при промахе качается с Commons
+ADMISSION_GROUPS = {
+    'search_character': 'search',
+    'async_search_character': 'search',
+    'api_search_stream': 'search',
+    'api_random_character': 'random',
+    'async_api_random_character': 'random',
+    'api_entities': 'batch',
+    'image_thumbnail': 'thumbnail',
+}
+
+def concurrency_limiter(group, limit, queue_size):
+    """Limiter of a route group, sized by WHOAMI_<GROUP>_CONCURRENCY and WHOAMI_<GROUP>_QUEUE"""
+    return ConcurrencyLimiter(
+        group,
+        limit=int(os.environ.get(f"WHOAMI_{group.upper()}_CONCURRENCY", limit)),
+        queue_size=int(os.environ.get(f"WHOAMI_{group.upper()}_QUEUE", queue_size)),
+        queue_timeout=float(os.environ.get("WHOAMI_QUEUE_TIMEOUT", "2"))
+    )
+
+# Частота дорогих запросов одного клиента: в среднем CLIENT_RATE в секунду, всплеск до CLIENT_BURST.
+# По умолчанию выключено: клиент определяется по remote_addr, и за прокси без WHOAMI_PROXY_COUNT
+# все пользователи делили бы одно ведро
+CLIENT_RATE = float(os.environ.get("WHOAMI_CLIENT_RATE", "0"))
+if CLIENT_RATE and not PROXY_COUNT:
+    logger.warning("WHOAMI_CLIENT_RATE is set without WHOAMI_PROXY_COUNT: clients are told apart by the socket address")
+admission = AdmissionControl(
+    {
+        'search': concurrency_limiter('search', 8, 16),
+        'random': concurrency_limiter('random', 4, 8),
+        'batch': concurrency_limiter('batch', 2, 2),
+        'thumbnail': concurrency_limiter('thumbnail', 4, 8),
+    },
+    clients=ClientRateLimiter(CLIENT_RATE, float(os.environ.get("WHOAMI_CLIENT_BURST", "20"))) if CLIENT_RATE else None,
+    retry_after=float(os.environ.get("WHOAMI_SHED_RETRY_AFTER", "1"))
+)
+# Дорогие маршруты вместе с очередями должны оставлять потоки воркера дешёвым страницам (/, /ready, /metrics)
+ADMISSION_THREADS = sum(limiter.limit + limiter.queue_size for limiter in admission.limiters.values())
+if ADMISSION_THREADS >= int(os.environ.get("GUNICORN_THREADS", ADMISSION_THREADS + 1)):
+    logger.warning("Expensive routes may hold %s threads, GUNICORN_THREADS=%s leaves none for other pages",
+                   ADMISSION_THREADS, os.environ["GUNICORN_THREADS"])
+
+@app.before_request
+def admit_request():
+    # Лишние дорогие запросы сразу получают отказ, а не занимают все потоки воркера.
+    # Страницы с кэшем вывода проходят контроль в cached_page и только при промахе
+    group = ADMISSION_GROUPS.get(request.endpoint)
+    if group is None or getattr(app.view_functions.get(request.endpoint), 'output_cached', False):
+        return None
+    return admit(group)
+
+def admit(group):
+    """Admit a request of an expensive route group; the shed response if it is refused"""
+    status, retry_after = admission.admit(group, request.remote_addr or 'unknown')
+    if status is None:
+        g.admission_group = group
+        return None
+    logger.warning("Shedding %s request from %s with %s", group, request.remote_addr, status)
+    if status == 429:
+        message = "Слишком много запросов. Пожалуйста, попробуйте через несколько секунд."
+    else:
+        message = "Сервис перегружен. Пожалуйста, попробуйте через несколько секунд."
+    if request.path.startswith('/api/'):
+        response = make_response(jsonify({"error": message}), status)
+    else:
+        response = make_response(render_template('not_found.html', query=request.args.get('query', ''),
+                                                 error_message=message), status)
+    response.headers['Retry-After'] = str(retry_after)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.teardown_request
+def release_admission(exc):
+    # Потоковый ответ держит место до конца передачи
+    group = g.pop('admission_group', None)
+    if group is not None:
+        admission.release(group)
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    return response
+
+@app.after_request
+def add_upstream_timing(response):
+    trace = current_trace.get()
+    if trace is None:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    status = response.status_code
+    if response.is_streamed:
+        # Тело потокового ответа (NDJSON) формируется уже после after_request: длительность
+        # и вызовы Wikidata записываются по закрытии потока, а Server-Timing не отправляется,
+        # потому что заголовки уходят раньше, чем сделан первый вызов
+        def record_stream():
+            metrics.record_request(endpoint, status, trace.elapsed(), len(trace.calls))
+        response.call_on_close(record_stream)
+        return response
+    metrics.record_request(endpoint, status, trace.elapsed(), len(trace.calls))
+    response.headers['Server-Timing'] = trace.server_timing()
+    if DEBUG_PANEL and request.args.get('debug') and response.status_code == 200 \
+            and response.mimetype == 'text/html' and not response.direct_passthrough:
+        inject_debug_panel(response, trace)
+    return response
+
+def inject_debug_panel(response, trace):
+    """Append the list of upstream calls of this request to an HTML page"""
+    panel = render_template('debug_panel.html', trace=trace,
+                            calls=[call.as_dict() for call in trace.calls],
+                            page_cache=g.get('page_cache'))
+    body = response.get_data(as_text=True)
+    position = body.rfind('</body>')
+    position = position if position != -1 else len(body)
+    response.set_data(body[:position] + panel + body[position:])
+    # Страница с панелью отличается от закэшированной, валидаторы к ней не подходят
+    response.headers.pop('ETag', None)
+    response.headers['Cache-Control'] = 'no-store'
+
+def current_helper():
+    """Helper for the language requested with ?lang=, or the default one"""
+    return wikipedia_helpers.get(request.args.get('lang'))
+
+@app.context_processor
+def inject_lang():
+    # Ссылки на страницах сохраняют выбранный язык; для основного языка параметр не нужен
+    lang = current_helper().lang
+    return {"lang": lang if lang != wikipedia_helpers.default_lang else None}
+
+def stream_search_requested():
+    """Whether /search answers with the page that loads results from /api/search/stream"""
+    return STREAM_SEARCH and request.endpoint == 'search_character' and request.args.get('stream') != '0'
+
+def search_cache_key():
+    """Output cache key for /search: (lang, query|stream|id)"""
+    entity_id = request.args.get('id', '')
+    query = request.args.get('query', '').strip()
+    if entity_id:
+        return output_cache.key(current_helper().lang, "id", entity_id)
+    if query:
+        # Страница-оболочка потокового поиска и готовая страница результатов кэшируются отдельно
+        return output_cache.key(current_helper().lang, "stream" if stream_search_requested() else "query", query)
+    return None
+
+def cached_page(key_func):
+    """Serve a view from the output cache, with ETag/Last-Modified and 304 support"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = key_func()
+            if key is None:
+                return run_admitted(view, *args, **kwargs)
+            
+            entry = output_cache.lookup(key)
+            g.page_cache = 'miss' if entry is None else 'hit'
+            if entry is None:
+                response = make_response(run_admitted(view, *args, **kwargs))
+                # Кэшируем только успешно найденные результаты, но не страницы ошибок
+                if response.status_code != 200 or not g.get('cacheable'):
+                    # Отказ контроля допуска уже помечен no-store
+                    response.headers.setdefault('Cache-Control', 'no-cache')
+                    return response
+                entry = output_cache.store(key, response.get_data(as_text=True), response.mimetype)
+            else:
+                response = make_response(entry['body'])
+                response.mimetype = entry['mimetype']
+            
+            response.headers.update(output_cache.cache_headers(entry))
+            return response.make_conditional(request)
+        wrapper.output_cached = True
+        return wrapper
+    return decorator
+
+def run_admitted(view, *args, **kwargs):
+    """Run a view, first passing admission control if its route is an expensive one"""
+    group = ADMISSION_GROUPS.get(request.endpoint)
+    shed = admit(group) if group is not None else None
+    if shed is not None:
+        return shed
+    return current_app.ensure_sync(view)(*args, **kwargs)
+
+def no_store(view):
+    """Forbid caching of responses that must differ on every request"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(current_app.ensure_sync(view)(*args, **kwargs))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return wrapper
+
 @app.route('/')
 def index():
     logger.info("Rendering index page")
     return render_template('index.html')
 
+def render_entity_result(character_info, entity_id, query):
+    """Render the character page for an ID lookup"""
+    if character_info and character_info.get('status') == 'ok':
+        logger.info("Successfully fetched character: %s", character_info.get('name', 'Unknown'))
+        g.cacheable = True
+        return render_template('character.html', character=character_info)
+    else:
+        logger.warning("Failed to get character info for ID: %s", entity_id)
+        return render_template('not_found.html', 
+                            query=query or "персонаж",
+                            error_message="Не удалось получить информацию о персонаже.")
+
+def render_search_result(character_info, query):
+    """Render the page for a free-text search result"""
+    if character_info['status'] == "multiple_results":
+        logger.info("Found multiple results for query: %s", query)
+        g.cacheable = True
+        return render_template('multiple_search.html', 
+                            results=character_info['results'],
+                            query=query)
+    elif character_info['status'] == "ok":
+        logger.info("Found single result for query: %s", query)
+        g.cacheable = True
+        return render_template('character.html', 
+                            character=character_info)
+    elif character_info['status'] == "error":
+        logger.warning("Error in search results for query: %s", query)
+        return render_template('not_found.html', 
+                            query=query,
+                            error_message=character_info.get('summary', 'Произошла ошибка при поиске.'))
+    else:
+        logger.warning("No results found for query: %s", query)
+        return render_template('not_found.html', 
+                            query=query)
+
 @app.route('/search')
+@cached_page(search_cache_key)
 def search_character():
     query = request.args.get('query', '').strip()
     entity_id = request.args.get('id', '')
     
-    logger.info(f"Search request - query: '{query}', entity_id: '{entity_id}'")
+    logger.info("Search request - query: '%s', entity_id: '%s'", query, entity_id)
     
     if not query and not entity_id:
         logger.info("Empty search request, redirecting to index")
@@ -56,129 +442,339 @@ def search_character():
     # Если указан ID, получаем информацию о конкретном персонаже
     if entity_id:
         try:
-            logger.info(f"Fetching entity by ID: {entity_id}")
-            character_info = wikipedia_helper.get_entity_by_id(entity_id)
-            if character_info and character_info.get('status') == 'ok':
-                logger.info(f"Successfully fetched character: {character_info.get('name', 'Unknown')}")
-                return render_template('character.html', character=character_info)
-            else:
-                logger.warning(f"Failed to get character info for ID: {entity_id}")
-                return render_template('not_found.html', 
-                                    query=query or "персонаж",
-                                    error_message="Не удалось получить информацию о персонаже.")
+            logger.info("Fetching entity by ID: %s", entity_id)
+            character_info = current_helper().get_entity_by_id(entity_id)
+            return render_entity_result(character_info, entity_id, query)
         except Exception as e:
-            logger.error(f"Error getting entity by ID: {e}")
+            logger.error("Error getting entity by ID: %s", e)
             logger.error(traceback.format_exc())
             return render_template('not_found.html', 
                                 query=query or "персонаж",
                                 error_message="Произошла ошибка при получении данных.")
         
-    # Иначе выполняем поиск по запросу
+    # Иначе выполняем поиск по запросу; результаты подгружаются на странице по мере готовности
+    if stream_search_requested():
+        logger.info("Rendering streamed search page for: %s", query)
+        g.cacheable = True
+        return render_template('multiple_search.html', query=query, stream=True)
     try:
-        logger.info(f"Searching for character: {query}")
-        character_info = wikipedia_helper.get_wikipedia_info(query)
-        
-        if character_info['status'] == "multiple_results":
-            logger.info(f"Found multiple results for query: {query}")
-            return render_template('multiple_search.html', 
-                                results=character_info['results'],
-                                query=query)
-        elif character_info['status'] == "ok":
-            logger.info(f"Found single result for query: {query}")
-            return render_template('character.html', 
-                                character=character_info)
-        elif character_info['status'] == "error":
-            logger.warning(f"Error in search results for query: {query}")
-            return render_template('not_found.html', 
-                                query=query,
-                                error_message=character_info.get('summary', 'Произошла ошибка при поиске.'))
-        else:
-            logger.warning(f"No results found for query: {query}")
+        logger.info("Searching for character: %s", query)
+        character_info = current_helper().get_wikipedia_info(query)
+        return render_search_result(character_info, query)
+    except Exception as e:
+        logger.error("Error during search: %s", e)
+        logger.error(traceback.format_exc())
+        return render_template('not_found.html', 
+                            query=query,
+                            error_message="Произошла ошибка при выполнении поиска.")
+
+# Async-обработчики выполняются в одном долгоживущем event loop воркера, поэтому их помощники
+# держат keep-alive соединения к Wikidata и ограничение запросов на хост между запросами
+background_loop = BackgroundLoop()
+app.async_to_sync = background_loop.async_to_sync
+
+# Async-помощники по языкам, общие с синхронными кэшем, индексами и настройками
+async_helpers = {
+    helper.lang: AsyncWikipediaHelper(helper.lang,
+                                      languages=helper.languages,
+                                      cache=helper.cache,
+                                      http=helper.http,
+                                      inflight=helper.inflight,
+                                      suggestions=helper.suggestions,
+                                      entity_store=helper.entity_store,
+                                      offline=helper.offline,
+                                      candidates=helper.candidates,
+                                      wikidata_endpoint=helper.wikidata_endpoint,
+                                      sparql_endpoint=helper.sparql_endpoint)
+    for helper in wikipedia_helpers
+}
+
+@atexit.register
+def stop_background_loop():
+    # Закрываем httpx-клиенты в том цикле, где они созданы
+    background_loop.stop(*(helper.aclose for helper in async_helpers.values()))
+
+def async_helper():
+    """Async helper for the language of the request"""
+    return async_helpers[current_helper().lang]
+
+@app.route('/async/search')
+@cached_page(search_cache_key)
+async def async_search_character():
+    query = request.args.get('query', '').strip()
+    entity_id = request.args.get('id', '')
+    
+    logger.info("Async search request - query: '%s', entity_id: '%s'", query, entity_id)
+    
+    if not query and not entity_id:
+        logger.info("Empty search request, redirecting to index")
+        return redirect(url_for('index'))
+    
+    helper = async_helper()
+    if entity_id:
+        try:
+            logger.info("Fetching entity by ID: %s", entity_id)
+            character_info = await helper.get_entity_by_id(entity_id)
+            return render_entity_result(character_info, entity_id, query)
+        except Exception as e:
+            logger.error("Error getting entity by ID: %s", e)
+            logger.error(traceback.format_exc())
             return render_template('not_found.html', 
-                                query=query)
+                                query=query or "персонаж",
+                                error_message="Произошла ошибка при получении данных.")
+    
+    try:
+        logger.info("Searching for character: %s", query)
+        character_info = await helper.get_wikipedia_info(query)
+        return render_search_result(character_info, query)
     except Exception as e:
-        logger.error(f"Error during search: {e}")
+        logger.error("Error during search: %s", e)
         logger.error(traceback.format_exc())
         return render_template('not_found.html', 
                             query=query,
                             error_message="Произошла ошибка при выполнении поиска.")
 
+@app.route('/api/suggest')
+def api_suggest():
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', DEFAULT_SUGGEST_LIMIT, type=int), 20))
+    if not query:
+        return jsonify({"query": query, "suggestions": []})
+    
+    try:
+        suggestions = current_helper().suggest(query, limit)
+    except Exception as e:
+        logger.error("Error building suggestions for '%s': %s", query, e)
+        suggestions = []
+    response = jsonify({"query": query, "suggestions": suggestions})
+    # Подсказки меняются только по мере пополнения индекса, короткое кэширование безопасно
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+@app.route('/api/search/stream')
+@no_store
+def api_search_stream():
+    """Stream classified search hits one JSON object per line as they resolve"""
+    query = request.args.get('query', '').strip()
+    if not query:
+        return jsonify({"error": "Пустой запрос"}), 400
+    
+    helper = current_helper()
+    logger.info("Streamed search request - query: '%s'", query)
+    
+    def generate():
+        for result in helper.search_stream(query):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Сколько имён или QID можно передать в одном пакетном запросе
+BATCH_MAX_ITEMS = int(os.environ.get("WHOAMI_BATCH_MAX_ITEMS", "500"))
+
+@app.route('/api/entities', methods=['POST'])
+@no_store
+def api_entities():
+    """Resolve many QIDs or names at once, streaming one JSON object per line"""
+    payload = request.get_json(silent=True)
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+        return jsonify({"error": "Ожидается JSON вида {\"items\": [\"Q42\", \"Шерлок Холмс\"]}"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Не больше {BATCH_MAX_ITEMS} элементов за запрос"}), 413
+    
+    helper = current_helper()
+    logger.info("Batch request for %s items", len(items))
+    
+    def generate():
+        for result in helper.get_entities_by_ids(items):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/img/<qid>/<int:n>')
+def image_thumbnail(qid, n):
+    """Thumbnail of the n-th image of a character, ?w= is snapped to a served width"""
+    width = snap_width(request.args.get('w', type=int))
+    character = current_helper().get_entity_by_id(qid) if qid[:1] == 'Q' and qid[1:].isdigit() else None
+    images = (character or {}).get('images') or []
+    if n >= len(images):
+        abort(404)
+    file_name = image_file_name(images[n]['url'])
+    if file_name is None:
+        abort(404)
+    
+    thumb = thumbnails.get(file_name, width)
+    if thumb is None:
+        # Не удалось получить миниатюру: браузер загрузит её с Commons сам
+        response = redirect(thumbnail_url(file_name, width))
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    response = make_response(thumb['content'])
+    response.mimetype = thumb['content_type']
+    response.set_etag(thumb['etag'])
+    response.last_modified = thumb['created_at']
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE
+    return response.make_conditional(request)
+
 @app.route('/random/<type>')
 def random_character(type):
-    logger.info(f"Request for random character of type: {type}")
+    logger.info("Request for random character of type: %s", type)
     # Показываем анимацию загрузки
     return render_template('loading.html', type=type)
 
+def fallback_character_info(fallback_char):
+    """Build minimal character info from a FALLBACK_CHARACTERS entry"""
+    return {
+        "status": "ok",
+        "name": fallback_char['name'],
+        "type": fallback_char['type'],
+        "summary": fallback_char['description'],
+        "url": f"https://www.wikidata.org/wiki/{fallback_char['id']}",
+        "wikidata_id": fallback_char['id']
+    }
+
 @app.route('/api/random/<type>')
+@no_store
 def api_random_character(type):
-    logger.info(f"API request for random character of type: {type}")
+    logger.info("API request for random character of type: %s", type)
     start_time = time.time()
     
     try:
-        # Имитируем задержку для демонстрации анимации
-        time.sleep(1.5)
-        
-        logger.info(f"Fetching random character of type: {type}")
-        character_info = wikipedia_helper.get_random(type)
+        logger.info("Fetching random character of type: %s", type)
+        helper = current_helper()
+        character_info = random_pool.get(type, timeout=RANDOM_POOL_WAIT)
+        if character_info and helper is not wikipedia_helper:
+            # Пул готовит персонажей на основном языке; данные сущности общие,
+            # для другого языка догружаются только метки
+            character_info = helper.get_entity_by_id(character_info['wikidata_id']) or character_info
         
         if not character_info:
-            logger.warning(f"No random character found for type: {type}, using fallback")
+            logger.warning("No random character found for type: %s, using fallback", type)
             # Используем запасной вариант, если не удалось получить случайного персонажа
             if type in FALLBACK_CHARACTERS:
                 fallback_char = random.choice(FALLBACK_CHARACTERS[type])
-                logger.info(f"Using fallback character: {fallback_char['name']}")
+                logger.info("Using fallback character: %s", fallback_char['name'])
                 
                 # Получаем детали для запасного персонажа
-                character_info = wikipedia_helper.get_entity_by_id(fallback_char['id'])
+                character_info = helper.get_entity_by_id(fallback_char['id'])
                 
                 if not character_info or character_info.get('status') != 'ok':
                     # Если не удалось получить детали, создаем базовую информацию
-                    character_info = {
-                        "status": "ok",
-                        "name": fallback_char['name'],
-                        "type": fallback_char['type'],
-                        "summary": fallback_char['description'],
-                        "url": f"https://www.wikidata.org/wiki/{fallback_char['id']}",
-                        "wikidata_id": fallback_char['id']
-                    }
+                    character_info = fallback_character_info(fallback_char)
             else:
                 return jsonify({"error": "Не удалось найти персонажа"}), 404
         
         elapsed_time = time.time() - start_time
-        logger.info(f"Successfully fetched random character: {character_info.get('name', 'Unknown')} in {elapsed_time:.2f} seconds")
+        logger.info("Successfully fetched random character: %s in %.2f seconds", character_info.get('name', 'Unknown'), elapsed_time)
         return jsonify(character_info)
     except Exception as e:
-        logger.error(f"Error fetching random character: {e}")
+        logger.error("Error fetching random character: %s", e)
         logger.error(traceback.format_exc())
         
         # Используем запасной вариант в случае ошибки
         if type in FALLBACK_CHARACTERS:
             fallback_char = random.choice(FALLBACK_CHARACTERS[type])
-            logger.info(f"Using fallback character after error: {fallback_char['name']}")
+            logger.info("Using fallback character after error: %s", fallback_char['name'])
             
             # Создаем базовую информацию
-            character_info = {
-                "status": "ok",
-                "name": fallback_char['name'],
-                "type": fallback_char['type'],
-                "summary": fallback_char['description'],
-                "url": f"https://www.wikidata.org/wiki/{fallback_char['id']}",
-                "wikidata_id": fallback_char['id']
-            }
+            return jsonify(fallback_character_info(fallback_char))
+        
+        return jsonify({"error": "Произошла ошибка при генерации персонажа"}), 500
+
+@app.route('/api/async/random/<type>')
+@no_store
+async def async_api_random_character(type):
+    logger.info("Async API request for random character of type: %s", type)
+    start_time = time.time()
+    
+    try:
+        helper = async_helper()
+        character_info = random_pool.get(type)
+        if character_info and helper.lang != wikipedia_helper.lang:
+            character_info = await helper.get_entity_by_id(character_info['wikidata_id']) or character_info
+        character_info = character_info or await helper.get_random(type)
+        
+        if not character_info:
+            logger.warning("No random character found for type: %s, using fallback", type)
+            if type not in FALLBACK_CHARACTERS:
+                return jsonify({"error": "Не удалось найти персонажа"}), 404
             
-            return jsonify(character_info)
+            fallback_char = random.choice(FALLBACK_CHARACTERS[type])
+            logger.info("Using fallback character: %s", fallback_char['name'])
+            character_info = await helper.get_entity_by_id(fallback_char['id'])
+            
+            if not character_info or character_info.get('status') != 'ok':
+                character_info = fallback_character_info(fallback_char)
+        
+        elapsed_time = time.time() - start_time
+        logger.info("Successfully fetched random character: %s in %.2f seconds", character_info.get('name', 'Unknown'), elapsed_time)
+        return jsonify(character_info)
+    except Exception as e:
+        logger.error("Error fetching random character: %s", e)
+        logger.error(traceback.format_exc())
+        
+        if type in FALLBACK_CHARACTERS:
+            fallback_char = random.choice(FALLBACK_CHARACTERS[type])
+            logger.info("Using fallback character after error: %s", fallback_char['name'])
+            return jsonify(fallback_character_info(fallback_char))
         
         return jsonify({"error": "Произошла ошибка при генерации персонажа"}), 500
 
+@app.route('/ready')
+@no_store
+def readiness():
+    """Readiness probe: 503 until the warm-up has finished"""
+    if warmup is None:
+        return jsonify({"ready": True}), 200
+    status = warmup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route('/metrics')
+@no_store
+def metrics_endpoint():
+    """Prometheus metrics of this worker process"""
+    cache_stats = wikipedia_helper.cache_stats()
+    thumbnail_stats = thumbnails.cache.stats()
+    page_stats = output_cache.stats()
+    gauges = {
+        "whoami_cache_hits": cache_stats["hits"],
+        "whoami_cache_misses": cache_stats["misses"],
+        "whoami_cache_entries": cache_stats.get("entries", 0),
+        "whoami_cache_bytes": cache_stats.get("bytes", 0),
+        "whoami_page_cache_hits": page_stats["hits"],
+        "whoami_page_cache_misses": page_stats["misses"],
+        "whoami_upstream_in_flight": wikipedia_helper.inflight.in_flight(),
+        "whoami_entity_store_entries": wikipedia_helper.entity_store.stats().get("entries", 0),
+        "whoami_revalidations_pending": revalidator.pending(),
+        "whoami_thumbnail_cache_entries": thumbnail_stats.get("entries", 0),
+        "whoami_thumbnail_cache_bytes": thumbnail_stats.get("bytes", 0),
+    }
+    for name, endpoint in (("wikidata", wikipedia_helper.wikidata_endpoint),
+                           ("sparql", wikipedia_helper.sparql_endpoint)):
+        breaker = circuit_breaker(endpoint)
+        gauges[f"whoami_circuit_open_{name}"] = int(breaker.state != breaker.CLOSED)
+        gauges[f"whoami_circuit_rejected_{name}"] = breaker.rejected
+    for group, stats in admission.stats().items():
+        gauges[f"whoami_admission_active_{group}"] = stats["active"]
+        gauges[f"whoami_admission_queued_{group}"] = stats["queued"]
+        gauges[f"whoami_admission_shed_{group}"] = stats["shed"]
+    if admission.clients is not None:
+        gauges["whoami_admission_rate_limited"] = admission.clients.limited
+    for type, size in random_pool.stats().items():
+        gauges[f"whoami_random_pool_size_{type}"] = size
+    return current_app.response_class(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def page_not_found(e):
-    logger.warning(f"Page not found: {request.path}")
+    logger.warning("Page not found: %s", request.path)
     return render_template('not_found.html', 
                          query=request.path), 404
 
 @app.errorhandler(500)
 def internal_server_error(e):
-    logger.error(f"Internal server error: {e}")
+    logger.error("Internal server error: %s", e)
     logger.error(traceback.format_exc())
     return render_template('not_found.html', 
                          query="произошла ошибка",
@@ -0,0 +1,416 @@
+"""Local stand-in for the Wikidata API and SPARQL endpoint.
+
+Answers wbsearchentities, wbgetclaims, wbgetentities and the candidate
+SPARQL query from an entity snapshot, with configurable injected latency,
+and counts upstream calls per action so benchmarks can report them.
+Commons Special:FilePath is stood in for by placeholder images sized like
+real JPEGs: a few MB for the original, proportional to ?width= for
+thumbnails.
+
+The snapshot is either recorded from live Wikidata:
+
+    python -m benchmarks.fixture_server record --query Эйнштейн --id Q937 -o fixtures.json
+
+or, when no file is given, generated deterministically in memory.
+
+Serve it with:
+
+    python -m benchmarks.fixture_server serve --fixtures fixtures.json --latency 0.1
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+LIVE_ENDPOINT = "https://www.wikidata.org/w/api.php"
+USER_AGENT = "whoami-helpers-benchmarks/1.0 (https://github.com/mygrood/whoami-helpers)"
+
+FICTIONAL_TYPES = ["Q15632617", "Q15632618", "Q95074", "Q4167410"]
+
+FIRST_NAMES = ["Александр", "Мария", "Иван", "Анна", "Пётр", "Елена", "Сергей", "Ольга",
+               "Николай", "Татьяна", "Михаил", "Наталья", "Дмитрий", "Ирина", "Лев", "Вера"]
+LAST_NAMES = ["Пушкин", "Толстой", "Менделеев", "Павлов", "Королёв", "Гагарин", "Чехов",
+              "Тургенев", "Лобачевский", "Циолковский", "Бунин", "Глинка", "Репин", "Шишкин"]
+HERO_NAMES = ["Гарри Поттер", "Шерлок Холмс", "Джеймс Бонд", "Дарт Вейдер", "Бэтмен",
+              "Фродо Бэггинс", "Эркюль Пуаро", "Остап Бендер", "Винни-Пух", "Чебурашка"]
+
+# Размер заглушки исходного изображения и байт на квадратный пиксель миниатюры
+ORIGINAL_IMAGE_BYTES = 3 * 1024 * 1024
+THUMB_BYTES_PER_PIXEL = 0.25
+
+
+def _item_snak(prop: str, qid: str) -> Dict:
+    return {"mainsnak": {"snaktype": "value", "property": prop,
+                         "datavalue": {"value": {"entity-type": "item", "id": qid},
+                                       "type": "wikibase-entityid"}},
+            "type": "statement", "rank": "normal"}
+
+
+def _time_snak(prop: str, value: str) -> Dict:
+    return {"mainsnak": {"snaktype": "value", "property": prop,
+                         "datavalue": {"value": {"time": value, "precision": 11},
+                                       "type": "time"}},
+            "type": "statement", "rank": "normal"}
+
+
+def _string_snak(prop: str, value: str) -> Dict:
+    return {"mainsnak": {"snaktype": "value", "property": prop,
+                         "datavalue": {"value": value, "type": "string"}},
+            "type": "statement", "rank": "normal"}
+
+
+def _labelled(qid: str, label: str, description: str = "") -> Dict:
+    entity = {"id": qid, "type": "item", "lastrevid": 1,
+              "labels": {"ru": {"language": "ru", "value": label},
+                         "en": {"language": "en", "value": label}}}
+    if description:
+        entity["descriptions"] = {"ru": {"language": "ru", "value": description}}
+    return entity
+
+
+def synthetic_fixtures(count: int = 300, seed: int = 42) -> Dict:
+    """Generate a deterministic snapshot shaped like real Wikidata payloads"""
+    rnd = random.Random(seed)
+    entities = {}
+    # Справочные сущности, на которые ссылаются утверждения персонажей
+    reference = {}
+    for prefix, base, amount in (("occupation", 1000000, 60), ("country", 1100000, 40),
+                                 ("place", 1200000, 200), ("language", 1300000, 30),
+                                 ("award", 1400000, 120), ("work", 1500000, 80)):
+        reference[prefix] = []
+        for i in range(amount):
+            qid = f"Q{base + i}"
+            entities[qid] = _labelled(qid, f"{prefix} {i}")
+            reference[prefix].append(qid)
+    for qid, label in (("Q6581097", "мужской пол"), ("Q6581072", "женский пол")):
+        entities[qid] = _labelled(qid, label)
+
+    for i in range(count):
+        qid = f"Q{2000000 + i}"
+        fictional = i % 3 == 0
+        other = i % 7 == 0
+        if fictional:
+            name = f"{HERO_NAMES[i % len(HERO_NAMES)]} {i}"
+        else:
+            name = f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[i % len(LAST_NAMES)]} {i}"
+
+        claims = {}
+        if other:
+            claims["P31"] = [_item_snak("P31", "Q515")]
+        elif fictional:
+            claims["P31"] = [_item_snak("P31", FICTIONAL_TYPES[i % len(FICTIONAL_TYPES)])]
+            claims["P1441"] = [_item_snak("P1441", rnd.choice(reference["work"]))]
+        else:
+            claims["P31"] = [_item_snak("P31", "Q5")]
+            year = 1700 + rnd.randrange(280)
+            claims["P569"] = [_time_snak("P569", f"+{year}-0{rnd.randrange(1, 10)}-1{rnd.randrange(10)}T00:00:00Z")]
+            if year < 1940:
+                claims["P570"] = [_time_snak("P570", f"+{year + 60}-01-01T00:00:00Z")]
+            claims["P27"] = [_item_snak("P27", rnd.choice(reference["country"]))]
+            claims["P19"] = [_item_snak("P19", rnd.choice(reference["place"]))]
+            claims["P20"] = [_item_snak("P20", rnd.choice(reference["place"]))]
+            claims["P1412"] = [_item_snak("P1412", q) for q in rnd.sample(reference["language"], 2)]
+            claims["P166"] = [_item_snak("P166", q) for q in rnd.sample(reference["award"], rnd.randrange(6))]
+        claims["P21"] = [_item_snak("P21", rnd.choice(["Q6581097", "Q6581072"]))]
+        claims["P106"] = [_item_snak("P106", q) for q in rnd.sample(reference["occupation"], 3)]
+        claims["P18"] = [_string_snak("P18", f"Portrait {i}.jpg")]
+        # Неиспользуемые свойства, чтобы объём ответа был похож на настоящий
+        for p in range(40):
+            claims[f"P{3000 + p}"] = [_string_snak(f"P{3000 + p}", f"value-{i}-{p}" * 4)]
+
+        entity = _labelled(qid, name, "" if i % 4 == 0 else f"описание персонажа {i}")
+        entity["claims"] = claims
+        entity["aliases"] = {"ru": [{"language": "ru", "value": name.split()[0]}]}
+        entity["sitelinks"] = {"ruwiki": {"site": "ruwiki", "title": name}}
+        entities[qid] = entity
+
+    return {"entities": entities, "searches": {}}
+
+
+def record_fixtures(queries: List[str], ids: List[str], lang: str = "ru") -> Dict:
+    """Record a snapshot from live Wikidata for the given searches and entity ids"""
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+
+    def get(params: Dict) -> Dict:
+        response = session.get(LIVE_ENDPOINT, params=dict(params, format="json"), timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    searches = {}
+    wanted = list(ids)
+    for query in queries:
+        hits = get({"action": "wbsearchentities", "search": query, "language": lang,
+                    "type": "item", "limit": 20}).get("search", [])
+        searches[query] = [hit["id"] for hit in hits]
+        wanted.extend(searches[query])
+
+    entities = {}
+    while wanted:
+        chunk = [qid for qid in dict.fromkeys(wanted) if qid not in entities][:50]
+        wanted = [qid for qid in wanted if qid not in entities and qid not in chunk]
+        if not chunk:
+            break
+        result = get({"action": "wbgetentities", "ids": "|".join(chunk), "languages": f"{lang}|en",
+                      "props": "info|labels|descriptions|claims|sitelinks|aliases"})
+        for qid, entity in result.get("entities", {}).items():
+            entities[qid] = entity
+            # Для персонажей дописываем сущности, метки которых показываются на странице
+            if qid in ids or any(qid in hits for hits in searches.values()):
+                for claims in entity.get("claims", {}).values():
+                    for claim in claims:
+                        value = claim["mainsnak"].get("datavalue", {}).get("value")
+                        if isinstance(value, dict) and value.get("entity-type") == "item":
+                            wanted.append(value["id"])
+    return {"entities": entities, "searches": searches}
+
+
+class FixtureStore:
+    """Builds API responses from an entity snapshot"""
+
+    def __init__(self, fixtures: Dict):
+        self.entities = fixtures["entities"]
+        self.searches = fixtures.get("searches", {})
+
+    def _type_of(self, entity: Dict) -> Optional[str]:
+        instance_of = [claim["mainsnak"].get("datavalue", {}).get("value", {}).get("id")
+                       for claim in entity.get("claims", {}).get("P31", [])]
+        if "Q5" in instance_of:
+            return "real"
+        if any(q in FICTIONAL_TYPES for q in instance_of):
+            return "fictional"
+        return None
+
+    def _label(self, entity: Dict, lang: str) -> Optional[str]:
+        label = entity.get("labels", {}).get(lang)
+        return label["value"] if label else None
+
+    def wbsearchentities(self, params: Dict) -> Dict:
+        query = params.get("search", "")
+        lang = params.get("language", "ru")
+        limit = int(params.get("limit", 7))
+        if query in self.searches:
+            ids = self.searches[query]
+        else:
+            needle = query.casefold()
+            ids = [qid for qid, entity in self.entities.items()
+                   if "claims" in entity and needle in (self._label(entity, lang) or "").casefold()]
+        hits = []
+        for qid in ids[:limit]:
+            entity = self.entities.get(qid, {})
+            hit = {"id": qid, "title": qid, "label": self._label(entity, lang) or qid}
+            description = entity.get("descriptions", {}).get(lang)
+            if description:
+                hit["description"] = description["value"]
+            hits.append(hit)
+        return {"searchinfo": {"search": query}, "search": hits, "success": 1}
+
+    def wbgetclaims(self, params: Dict) -> Dict:
+        entity = self.entities.get(params.get("entity"), {})
+        claims = entity.get("claims", {})
+        prop = params.get("property")
+        if prop:
+            claims = {prop: claims[prop]} if prop in claims else {}
+        return {"claims": claims}
+
+    def wbgetentities(self, params: Dict) -> Dict:
+        props = params.get("props", "info|sitelinks|aliases|labels|descriptions|claims|datatype").split("|")
+        languages = params.get("languages")
+        languages = languages.split("|") if languages else None
+        result = {}
+        for qid in params.get("ids", "").split("|"):
+            entity = self.entities.get(qid)
+            if entity is None:
+                result[qid] = {"id": qid, "missing": ""}
+                continue
+            projected = {"id": qid, "type": "item"}
+            if "info" in props:
+                projected["lastrevid"] = entity.get("lastrevid", 1)
+            for prop in ("labels", "descriptions", "aliases", "claims", "sitelinks"):
+                if prop not in props or prop not in entity:
+                    continue
+                value = entity[prop]
+                if languages and prop in ("labels", "descriptions", "aliases"):
+                    value = {lang: v for lang, v in value.items() if lang in languages}
+                projected[prop] = value
+            result[qid] = projected
+        return {"entities": result, "success": 1}
+
+    def sparql(self, params: Dict) -> Dict:
+        query = params.get("query", "")
+        wanted = "real" if "wd:Q5 " in query or "wd:Q5\n" in query else "fictional"
+        match = re.search(r"LIMIT\s+(\d+)", query)
+        limit = int(match.group(1)) if match else 100
+        bindings = []
+        for qid, entity in self.entities.items():
+            if len(bindings) >= limit:
+                break
+            label = self._label(entity, "ru")
+            if label and self._type_of(entity) == wanted:
+                bindings.append({
+                    "item": {"type": "uri", "value": f"http://www.wikidata.org/entity/{qid}"},
+                    "itemLabel": {"xml:lang": "ru", "type": "literal", "value": label}
+                })
+        return {"head": {"vars": ["item", "itemLabel"]}, "results": {"bindings": bindings}}
+
+
+class FixtureServer:
+    """Threaded HTTP server replaying a FixtureStore with injected latency"""
+
+    def __init__(self, fixtures: Optional[Dict] = None, latency: float = 0.0, jitter: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.store = FixtureStore(fixtures or synthetic_fixtures())
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = self._handle_error
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def wikidata_endpoint(self) -> str:
+        return f"{self.base_url}/w/api.php"
+
+    @property
+    def sparql_endpoint(self) -> str:
+        return f"{self.base_url}/sparql"
+
+    @property
+    def file_path_endpoint(self) -> str:
+        return f"{self.base_url}/wiki/Special:FilePath/"
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+    def start(self) -> "FixtureServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fixture-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handle_error(self, request, client_address) -> None:
+        # Клиент, завершённый посреди keep-alive соединения (например, воркер gunicorn), — не ошибка стенда
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self.httpd, request, client_address)
+
+    def _image(self, params: Dict) -> bytes:
+        width = int(params.get("width", 0))
+        size = int(width * width * THUMB_BYTES_PER_PIXEL) if width else ORIGINAL_IMAGE_BYTES
+        # Сигнатура JPEG, остальное — нули
+        return b"\xff\xd8\xff\xe0" + bytes(max(0, size - 4))
+
+    def _respond(self, path: str, params: Dict):
+        if path.startswith("/wiki/Special:FilePath/"):
+            action, handler = "thumbnail", self._image
+        elif path.endswith("/sparql"):
+            action, handler = "sparql", self.store.sparql
+        elif path.endswith("/w/api.php"):
+            action = params.get("action", "")
+            handler = getattr(self.store, action, None)
+        elif path == "/__stats":
+            with self._lock:
+                return dict(self.calls)
+        else:
+            return None
+
+        if handler is None:
+            return {"error": {"code": "badvalue", "info": f"Unrecognized action {action}"}}
+        with self._lock:
+            self.calls[action] += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        return handler(params)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                body = server._respond(url.path, dict(parse_qsl(url.query)))
+                if body is None:
+                    self.send_error(404)
+                    return
+                if isinstance(body, bytes):
+                    data, content_type = body, "image/jpeg"
+                else:
+                    data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                    content_type = "application/json; charset=utf-8"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="serve a snapshot over HTTP")
+    serve.add_argument("--fixtures", help="snapshot recorded with the record command")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8099)
+    serve.add_argument("--latency", type=float, default=0.0, help="injected latency per call, seconds")
+    serve.add_argument("--jitter", type=float, default=0.0, help="extra random latency, seconds")
+
+    record = commands.add_parser("record", help="record a snapshot from live Wikidata")
+    record.add_argument("--query", action="append", default=[], help="search query to record")
+    record.add_argument("--id", action="append", default=[], help="entity id to record")
+    record.add_argument("-o", "--output", required=True)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        fixtures = record_fixtures(args.query, args.id)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(fixtures, f, ensure_ascii=False)
+        print(f"Recorded {len(fixtures['entities'])} entities to {args.output}")
+        return
+
+    fixtures = None
+    if args.fixtures:
+        with open(args.fixtures, encoding="utf-8") as f:
+            fixtures = json.load(f)
+    server = FixtureServer(fixtures, latency=args.latency, jitter=args.jitter, host=args.host, port=args.port)
+    print(f"Serving fixtures on {server.base_url} (WHOAMI_WIKIDATA_ENDPOINT={server.wikidata_endpoint},"
+          f" WHOAMI_SPARQL_ENDPOINT={server.sparql_endpoint})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
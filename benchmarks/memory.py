@@ -0,0 +1,103 @@
+"""Memory footprint of cached Wikidata responses, raw versus compacted.
+
+Builds the wbgetentities responses the app caches for every character of
+a snapshot (synthetic by default, or recorded with
+benchmarks.fixture_server record) and reports the Python heap, measured
+with tracemalloc, needed to keep them as decoded objects (how responses
+used to be cached) and as encoded JSON in a MemoryCache, each raw and as
+the compact projection.
+
+    python -m benchmarks.memory
+    python -m benchmarks.memory --fixtures snapshot.json --copies 20
+
+Synthetic entities carry no references or qualifiers, so real snapshots
+show a larger difference.
+"""
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from typing import Callable, Dict, List
+
+from benchmarks.fixture_server import FixtureStore, synthetic_fixtures
+from services.cache import MemoryCache
+from services.wikipedia_service import WikipediaHelper
+
+CACHE_BUDGET_BYTES = 256 * 1024 * 1024
+
+
+def build_responses(fixtures: Dict, helper: WikipediaHelper, copies: int) -> List[str]:
+    """Raw JSON bodies of entity fetches, as received from the API"""
+    store = FixtureStore(fixtures)
+    bodies = []
+    for entity_id, entity in fixtures["entities"].items():
+        if "claims" not in entity:
+            continue
+        params = json.loads(helper._entity_details_params(entity_id))
+        bodies.append(json.dumps(store.wbgetentities(params), ensure_ascii=False))
+    return bodies * copies
+
+
+def measure(bodies: List[str], transform: Callable[[Dict, Dict], Dict], encoded: bool = True) -> Dict:
+    params = {"action": "wbgetentities"}
+    cache = MemoryCache(max_bytes=sys.maxsize)
+    decoded = {}
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i, body in enumerate(bodies):
+        # Каждый ответ декодируется заново, как при настоящем запросе
+        value = transform(params, json.loads(body))
+        if encoded:
+            cache.set(f"entity:{i}", value, 3600)
+        else:
+            decoded[f"entity:{i}"] = value
+    gc.collect()
+    heap = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {
+        "entries": len(bodies),
+        "heap_bytes": heap,
+        "heap_per_entry": heap / len(bodies),
+        "entries_per_budget": int(CACHE_BUDGET_BYTES / (heap / len(bodies))),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="snapshot recorded with benchmarks.fixture_server record")
+    parser.add_argument("--copies", type=int, default=10, help="store every response this many times")
+    parser.add_argument("--languages", default="ru,en")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        with open(args.fixtures, encoding="utf-8") as f:
+            fixtures = json.load(f)
+    else:
+        fixtures = synthetic_fixtures()
+
+    languages = args.languages.split(",")
+    helper = WikipediaHelper(languages[0], languages=languages)
+    bodies = build_responses(fixtures, helper, args.copies)
+
+    identity = lambda params, result: result
+    results = {
+        "decoded raw": measure(bodies, identity, encoded=False),
+        "decoded compact": measure(bodies, helper._compact, encoded=False),
+        "encoded raw": measure(bodies, identity),
+        "encoded compact": measure(bodies, helper._compact),
+    }
+    header = f"{'variant':<18}{'entries':>9}{'heap MiB':>11}{'KiB/entry':>11}{'entries/256MiB':>16}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<18}{r['entries']:>9}{r['heap_bytes'] / 2 ** 20:>11.1f}{r['heap_per_entry'] / 1024:>11.1f}"
+              f"{r['entries_per_budget']:>16}")
+    ratio = results["decoded raw"]["heap_bytes"] / results["encoded compact"]["heap_bytes"]
+    print(f"\nEncoded compact entries: {ratio:.1f}x more entities than decoded raw responses in the same heap")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""Offline load scenarios against app.py.
+
+Starts the fixture server (benchmarks.fixture_server) with injected
+latency, points the app at it through WHOAMI_* environment variables and
+runs cold/warm search, streamed search, character page, portrait
+thumbnail and random scenarios over real HTTP. Reports p50/p95/p99 latency, requests/s and
+upstream calls per request; for the streamed search latency is the time
+to the first result, the rest of the stream is still read.
+
+    python -m benchmarks.run --latency 0.05 --requests 40 --concurrency 8
+    python -m benchmarks.run --json current.json --baseline baseline.json --max-regression 0.25
+
+With --baseline the run exits with status 1 when p95 latency or upstream
+calls per request regress by more than --max-regression, so it can gate
+performance changes in CI-like local runs.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from benchmarks.fixture_server import FixtureServer, synthetic_fixtures
+
+SCENARIOS = ("cold_search", "warm_search", "stream_search", "character_page", "thumbnail", "random")
+# Для потоковых сценариев задержка измеряется до первой строки ответа
+STREAMING_SCENARIOS = ("stream_search",)
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def start_app(fixture_server: FixtureServer, workdir: str):
+    """Import app.py configured against the fixture server and serve it on a free port"""
+    os.environ.update({
+        "WHOAMI_WIKIDATA_ENDPOINT": fixture_server.wikidata_endpoint,
+        "WHOAMI_SPARQL_ENDPOINT": fixture_server.sparql_endpoint,
+        "WHOAMI_CACHE_PATH": os.path.join(workdir, "wikidata.sqlite3"),
+        "WHOAMI_CANDIDATES_PATH": os.path.join(workdir, "candidates.json"),
+        "WHOAMI_ENTITY_STORE_PATH": os.path.join(workdir, "entities.sqlite3"),
+        "WHOAMI_COMMONS_FILE_ENDPOINT": fixture_server.file_path_endpoint,
+        "WHOAMI_THUMBNAIL_DIR": os.path.join(workdir, "thumbnails"),
+        "WHOAMI_LOG_FILE": "",
+        "WHOAMI_WARMUP": "0",
+        # Вся нагрузка идёт с одного адреса, ограничение частоты клиента её бы отсекло
+        "WHOAMI_CLIENT_RATE": "0",
+        "WHOAMI_LOG_LEVEL": os.environ.get("WHOAMI_LOG_LEVEL", "WARNING"),
+    })
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    # Журнал доступа werkzeug искажает замеры и засоряет отчёт
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    httpd = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, name="bench-app", daemon=True).start()
+    return app_module, httpd, f"http://127.0.0.1:{httpd.server_port}"
+
+
+def reset_caches(app_module) -> None:
+    """Drop every cache layer so the next scenario starts cold"""
+    app_module.wikipedia_helper.cache.clear()
+    app_module.wikipedia_helper.entity_store.clear()
+    app_module.thumbnails.cache.clear()
+
+
+def run_scenario(name: str, urls: List[str], concurrency: int, fixture_server: FixtureServer,
+                 prepare: Optional[Callable[[], None]] = None, first_line: bool = False) -> Dict:
+    if prepare is not None:
+        prepare()
+    session = requests.Session()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def fetch(url: str) -> None:
+        nonlocal errors
+        started = time.perf_counter()
+        elapsed = None
+        try:
+            response = session.get(url, timeout=60, stream=first_line)
+            ok = response.status_code < 500
+            if first_line:
+                for line in response.iter_lines():
+                    if line and elapsed is None:
+                        elapsed = time.perf_counter() - started
+        except requests.RequestException:
+            ok = False
+        if elapsed is None:
+            elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    calls_before = fixture_server.total_calls()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fetch, urls))
+    wall = time.perf_counter() - started
+    upstream = fixture_server.total_calls() - calls_before
+
+    return {
+        "scenario": name,
+        "requests": len(urls),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rps": len(urls) / wall if wall else 0.0,
+        "upstream_per_request": upstream / len(urls) if urls else 0.0,
+    }
+
+
+def build_scenarios(base_url: str, fixtures: Dict, count: int) -> Dict[str, List[str]]:
+    characters = [(qid, entity["labels"]["ru"]["value"]) for qid, entity in fixtures["entities"].items()
+                  if "claims" in entity and "ru" in entity.get("labels", {})]
+    queries = [label.split()[-2] + " " + label.split()[-1] for _, label in characters][:count]
+    ids = [qid for qid, _ in characters][-count:]
+    return {
+        "cold_search": [f"{base_url}/search?query={q}&stream=0" for q in queries],
+        "warm_search": [f"{base_url}/search?query={q}&stream=0" for q in queries],
+        "stream_search": [f"{base_url}/api/search/stream?query={q}" for q in queries],
+        "character_page": [f"{base_url}/search?id={qid}" for qid in ids],
+        # Миниатюры персонажей, открытых в предыдущем сценарии: первая загрузка с Commons
+        "thumbnail": [f"{base_url}/img/{qid}/0?w=250" for qid in ids],
+        "random": [f"{base_url}/api/random/{('real', 'fictional')[i % 2]}" for i in range(count)],
+    }
+
+
+def print_report(results: List[Dict]) -> None:
+    header = f"{'scenario':<16}{'req':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'upstream/req':>14}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<16}{r['requests']:>6}{r['errors']:>5}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['rps']:>9.1f}{r['upstream_per_request']:>14.2f}")
+
+
+def check_regressions(results: List[Dict], baseline: List[Dict], max_regression: float) -> List[str]:
+    by_name = {r["scenario"]: r for r in baseline}
+    failures = []
+    for r in results:
+        base = by_name.get(r["scenario"])
+        if base is None:
+            continue
+        # Небольшой абсолютный допуск, чтобы не падать на шуме в пару миллисекунд
+        if r["p95_ms"] > base["p95_ms"] * (1 + max_regression) + 5:
+            failures.append(f"{r['scenario']}: p95 {r['p95_ms']:.1f} ms vs baseline {base['p95_ms']:.1f} ms")
+        if r["upstream_per_request"] > base["upstream_per_request"] * (1 + max_regression) + 0.01:
+            failures.append(f"{r['scenario']}: {r['upstream_per_request']:.2f} upstream calls/request"
+                            f" vs baseline {base['upstream_per_request']:.2f}")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="snapshot recorded with benchmarks.fixture_server record")
+    parser.add_argument("--latency", type=float, default=0.05, help="injected upstream latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these scenarios")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.fixtures:
+        with open(args.fixtures, encoding="utf-8") as f:
+            fixtures = json.load(f)
+    else:
+        fixtures = synthetic_fixtures()
+
+    fixture_server = FixtureServer(fixtures, latency=args.latency, jitter=args.jitter).start()
+    workdir = tempfile.mkdtemp(prefix="whoami-bench-")
+    app_module, httpd, base_url = start_app(fixture_server, workdir)
+    urls = build_scenarios(base_url, fixtures, args.requests)
+
+    results = []
+    for name in args.scenario or SCENARIOS:
+        prepare = None
+        if name in ("cold_search", "stream_search", "character_page"):
+            prepare = lambda: reset_caches(app_module)
+        results.append(run_scenario(name, urls[name], args.concurrency, fixture_server, prepare,
+                                    first_line=name in STREAMING_SCENARIOS))
+
+    httpd.shutdown()
+    fixture_server.stop()
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures = check_regressions(results, json.load(f), args.max_regression)
+        if failures:
+            print("\nPerformance regressions:")
+            for failure in failures:
+                print(f"  {failure}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Cold start of app.py: import time, first-request latency and gunicorn boot.
+
+Each measurement runs in a fresh process against the fixture server
+(benchmarks.fixture_server) with injected latency and empty cache
+directories, so nothing is warm:
+
+- import: seconds to import app.py in a new interpreter;
+- first/second request: latency of the first and the repeated request of
+  a few routes through the Flask test client right after the import;
+- gunicorn: seconds from spawning the server until / answers, and the
+  resident and proportional memory of the master and workers, for the
+  shipped profile (gunicorn.conf.py) and for plain gunicorn defaults.
+
+    python -m benchmarks.startup --latency 0.05
+    python -m benchmarks.startup --skip-gunicorn --runs 5
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from benchmarks.fixture_server import FixtureServer, synthetic_fixtures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Выполняется в новом интерпретаторе: импорт приложения и первые запросы к нему
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+client = app.app.test_client()
+timings = {}
+for path in sys.argv[1:]:
+    runs = []
+    for _ in range(2):
+        started = time.perf_counter()
+        client.get(path)
+        runs.append(time.perf_counter() - started)
+    timings[path] = runs
+print(json.dumps({"import": imported, "requests": timings}))
+"""
+
+
+def app_env(fixture_server: FixtureServer, workdir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "WHOAMI_WIKIDATA_ENDPOINT": fixture_server.wikidata_endpoint,
+        "WHOAMI_SPARQL_ENDPOINT": fixture_server.sparql_endpoint,
+        "WHOAMI_COMMONS_FILE_ENDPOINT": fixture_server.file_path_endpoint,
+        "WHOAMI_CACHE_PATH": os.path.join(workdir, "wikidata.sqlite3"),
+        "WHOAMI_CANDIDATES_PATH": os.path.join(workdir, "candidates.json"),
+        "WHOAMI_ENTITY_STORE_PATH": os.path.join(workdir, "entities.sqlite3"),
+        "WHOAMI_THUMBNAIL_DIR": os.path.join(workdir, "thumbnails"),
+        "WHOAMI_LOG_FILE": "",
+        "WHOAMI_LOG_LEVEL": "WARNING",
+        "WHOAMI_CLIENT_RATE": "0",
+        "PYTHONPATH": ROOT,
+    })
+    return env
+
+
+def probe(fixture_server: FixtureServer, paths: List[str]) -> Dict:
+    """Import the app and request paths twice in a new interpreter with empty caches"""
+    workdir = tempfile.mkdtemp(prefix="whoami-startup-")
+    try:
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, *paths], cwd=workdir, env=app_env(fixture_server, workdir),
+            capture_output=True, text=True, check=True
+        ).stdout
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def memory(pid: int) -> Dict[str, int]:
+    """Rss and Pss of a process in KiB from /proc (zeros where unavailable)"""
+    values = {"Rss": 0, "Pss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in values:
+                    values[name] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def boot_gunicorn(fixture_server: FixtureServer, workers: int, config: Optional[str],
+                  timeout: float = 60) -> Dict:
+    """Start gunicorn, wait until / answers and measure the processes; config None means gunicorn defaults"""
+    workdir = tempfile.mkdtemp(prefix="whoami-gunicorn-")
+    port = free_port()
+    if config is None:
+        # Пустой файл настроек: синхронные воркеры без preload, как в прежнем Procfile
+        config = os.path.join(workdir, "defaults.conf.py")
+        open(config, "w").close()
+    command = [sys.executable, "-m", "gunicorn", "wsgi:application", "--config", config,
+               "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--chdir", ROOT]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=workdir, env=app_env(fixture_server, workdir),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while time.perf_counter() - started < timeout and process.poll() is None:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                    ready = time.perf_counter() - started
+                    break
+            except requests.RequestException:
+                time.sleep(0.02)
+        # Ждём, пока поднимутся все воркеры, затем измеряем память
+        deadline = time.perf_counter() + 10
+        while len(children(process.pid)) < workers and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.5)
+        pids = [process.pid] + children(process.pid)
+        usage = [memory(pid) for pid in pids]
+        return {
+            "ready_s": ready,
+            "processes": len(pids),
+            "rss_kib": sum(u["Rss"] for u in usage),
+            "pss_kib": sum(u["Pss"] for u in usage),
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="injected upstream latency, seconds")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters for the import probe")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--skip-gunicorn", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    fixtures = synthetic_fixtures()
+    fixture_server = FixtureServer(fixtures, latency=args.latency).start()
+    entity_id = next(qid for qid, entity in fixtures["entities"].items() if "claims" in entity)
+    paths = ["/", f"/search?id={entity_id}", "/api/random/real"]
+
+    probes = [probe(fixture_server, paths) for _ in range(args.runs)]
+    imports = sorted(p["import"] for p in probes)
+    results = {"import_s": imports[len(imports) // 2], "requests": {}}
+    print(f"import app: median {results['import_s'] * 1000:.0f} ms over {len(imports)} runs")
+    print(f"\n{'path':<32}{'first ms':>10}{'second ms':>11}")
+    for path in paths:
+        first = sorted(p["requests"][path][0] for p in probes)[len(probes) // 2]
+        second = sorted(p["requests"][path][1] for p in probes)[len(probes) // 2]
+        results["requests"][path] = {"first_ms": first * 1000, "second_ms": second * 1000}
+        print(f"{path:<32}{first * 1000:>10.1f}{second * 1000:>11.1f}")
+
+    if not args.skip_gunicorn:
+        results["gunicorn"] = {
+            "profile": boot_gunicorn(fixture_server, args.workers, os.path.join(ROOT, "gunicorn.conf.py")),
+            "defaults": boot_gunicorn(fixture_server, args.workers, None),
+        }
+        print(f"\n{'gunicorn':<12}{'ready ms':>10}{'procs':>7}{'RSS MiB':>10}{'PSS MiB':>10}")
+        for name, r in results["gunicorn"].items():
+            ready = f"{r['ready_s'] * 1000:.0f}" if r["ready_s"] is not None else "-"
+            print(f"{name:<12}{ready:>10}{r['processes']:>7}{r['rss_kib'] / 1024:>10.1f}{r['pss_kib'] / 1024:>10.1f}")
+
+    fixture_server.stop()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
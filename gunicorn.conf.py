@@ -0,0 +1,50 @@
+"""Production gunicorn profile, picked up automatically from the working directory.
+
+    gunicorn wsgi:application
+
+The app is imported once in the master (preload_app), so the fallback
+characters, the suggestion and candidate indexes and the imported code
+are shared by the workers copy-on-write, and a broken deploy fails before
+any worker starts. Threads do not survive fork: the log writer and the
+background refills, revision checks and warm-up are started in each
+worker by post_fork. Wikidata calls are I/O-bound, so each worker runs
+many threads (gthread); the admission limits in app.py are per worker
+and sized below the thread count, so cheap pages always find a thread.
+
+Every setting can be overridden on the command line or through
+GUNICORN_CMD_ARGS.
+"""
+import multiprocessing
+import os
+
+# Приложение, загруженное мастером, не должно запускать потоки до fork
+os.environ.setdefault("WHOAMI_DEFER_BACKGROUND", "1")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+preload_app = True
+
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", max(2, multiprocessing.cpu_count())))
+# Запросы в основном ждут Wikidata. Дорогие маршруты вместе с очередями занимают до 52 потоков
+# (ADMISSION_GROUPS и admission в app.py), остальные страницы обслуживаются оставшимися
+threads = int(os.environ.get("GUNICORN_THREADS", "64"))
+
+# В gthread тайм-аут следит за живостью воркера, а не за длительностью запроса;
+# длительность ограничивают бюджет запроса и тайм-ауты обращений к Wikidata
+timeout = 30
+graceful_timeout = 30
+# За балансировщиком соединения переиспользуются
+keepalive = 5
+
+# Файл пульса воркера в памяти, а не на диске контейнера
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+
+def post_fork(server, worker):
+    from services.logging_setup import restart_listener
+    import app
+
+    restart_listener()
+    app.start_background()
+    server.log.info("Worker %s started background threads", worker.pid)
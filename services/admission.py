@@ -0,0 +1,132 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Сколько клиентов помнит ограничитель частоты; самые давние забываются
+DEFAULT_MAX_CLIENTS = 10000
+
+
+class ConcurrencyLimiter:
+    """At most limit requests of a route group at once, with a bounded wait queue.
+
+    A request that finds every slot taken waits in the queue for up to
+    queue_timeout seconds; when the queue is full too, or the wait runs
+    out, it is shed right away instead of occupying a worker thread.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if needed; False if the request is shed"""
+        with self._cond:
+            if self.active < self.limit and self.waiting == 0:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue_size:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        # Уведомление release могло достаться этому ожидающему вместе с таймаутом:
+                        # передаём его дальше, чтобы освободившийся слот не простаивал
+                        self._cond.notify()
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+class TokenBucket:
+    """Tokens left to one client and when they were last topped up"""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+
+class ClientRateLimiter:
+    """Per-client token buckets, keyed by client address"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = DEFAULT_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, client: str) -> Tuple[bool, float]:
+        """Spend a token of client; (False, seconds until the next token) when there is none"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return True, 0.0
+            self.limited += 1
+            return False, (1 - bucket.tokens) / self.rate
+
+
+class AdmissionControl:
+    """Admission of expensive requests: a per-client rate limit, then a per-group concurrency limit.
+
+    Limits are per worker process, like the rest of the in-memory state;
+    with several gunicorn workers the host admits workers times as many.
+    """
+
+    def __init__(self, limiters: Dict[str, ConcurrencyLimiter], clients: Optional[ClientRateLimiter] = None,
+                 retry_after: float = 1.0):
+        self.limiters = limiters
+        self.clients = clients
+        self.retry_after = retry_after
+
+    def admit(self, group: str, client: str) -> Tuple[Optional[int], int]:
+        """(None, 0) if admitted, else (HTTP status, Retry-After seconds); admitted requests must release()"""
+        if self.clients is not None:
+            allowed, wait = self.clients.allow(client)
+            if not allowed:
+                return 429, max(1, math.ceil(wait))
+        if not self.limiters[group].acquire():
+            return 503, max(1, math.ceil(self.retry_after))
+        return None, 0
+
+    def release(self, group: str) -> None:
+        self.limiters[group].release()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {"active": limiter.active, "queued": limiter.waiting, "shed": limiter.shed}
+            for name, limiter in self.limiters.items()
+        }
@@ -0,0 +1,449 @@
+import asyncio
+import json
+import logging
+import ssl
+import time
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import certifi
+import httpx
+
+from services.http_client import MAX_RETRY_AFTER, RETRY_STATUSES
+from services.logging_setup import log_response_body
+from services.suggest_index import DEFAULT_SUGGEST_LIMIT
+from services.resilience import CircuitOpenError, circuit_breaker, remaining_budget, upstream_timeout
+from services.tracing import record_upstream_call
+from services.wikipedia_service import (BATCH_WORKERS, LEASE_POLL_INTERVAL, LEASE_TTL, REQUEST_TIMEOUT,
+                                        SPARQL_TIMEOUT, STREAM_CHUNK_SIZE, WikipediaHelper)
+
+logger = logging.getLogger(__name__)
+
+# Сколько запросов к одному хосту может выполняться одновременно
+DEFAULT_PER_HOST_LIMIT = 8
+
+
+@lru_cache(maxsize=1)
+def _ssl_context() -> ssl.SSLContext:
+    # Загрузка корневых сертификатов занимает ~0.2 с, поэтому контекст
+    # создаётся один раз на процесс и переиспользуется всеми клиентами
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+class AsyncWikipediaHelper(WikipediaHelper):
+    """asyncio variant of WikipediaHelper that runs independent requests concurrently.
+
+    Request building, response parsing and the response cache are shared with
+    the synchronous helper, so both variants produce the same results and hit
+    the same cache entries. The httpx client and the per-host semaphores
+    belong to the event loop that created them: a helper used on one
+    long-lived loop (see services.event_loop) keeps its connections and
+    limits across all callers; used on a new loop, it builds new ones.
+    Close it with aclose(), or use it as an async context manager, on the
+    loop it ran on.
+    """
+
+    def __init__(self, lang: str = "ru", per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 max_retries: int = 3, backoff_factor: float = 0.5, **kwargs):
+        super().__init__(lang, **kwargs)
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._client = None
+        self._client_loop = None
+        self._host_limits = {}
+
+    async def __aenter__(self) -> "AsyncWikipediaHelper":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            # Соединения и семафоры нельзя использовать в другом event loop
+            self._client_loop = loop
+            self._host_limits = {}
+            self._client = httpx.AsyncClient(
+                verify=_ssl_context(),
+                headers={
+                    "User-Agent": self.http.user_agent,
+                    "Accept": "application/json"
+                },
+                limits=httpx.Limits(
+                    max_connections=self.per_host_limit * 2,
+                    max_keepalive_connections=self.per_host_limit * 2
+                )
+            )
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return upstream_timeout(min(float(retry_after), MAX_RETRY_AFTER))
+        return upstream_timeout(self.backoff_factor * (2 ** attempt))
+
+    async def _fetch_response(self, url: str, params: Dict, timeout: float) -> httpx.Response:
+        """GET a successful response, retrying on 429/5xx under the per-host limit and the request budget"""
+        client = self._get_client()
+        for attempt in range(self.max_retries + 1):
+            async with self._host_limit(url):
+                response = await client.get(url, params=params, timeout=upstream_timeout(timeout))
+            retry = attempt < self.max_retries and remaining_budget() != 0
+            if response.status_code in RETRY_STATUSES and retry:
+                await asyncio.sleep(self._retry_delay(response, attempt))
+                continue
+            response.raise_for_status()
+            return response
+
+    async def _make_request(self, endpoint: str, params_str: str) -> Dict:
+        """Make a cached request to the API endpoint"""
+        if self.offline is not None:
+            return self._offline_request(endpoint, params_str)
+        cache_key = f"{endpoint}?{params_str}"
+        started = time.perf_counter()
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self._record_call(endpoint, params_str, "hit", 0, started)
+            return cached
+
+        stale = self._stale(cache_key)
+        if stale is not None:
+            self._revalidate(endpoint, params_str, cache_key)
+            self._record_call(endpoint, params_str, "stale", 0, started)
+            return stale
+
+        leader = False
+
+        async def fetch() -> Dict:
+            nonlocal leader
+            leader = True
+            return await self._fetch_shared(endpoint, params_str, cache_key)
+
+        result = await self.inflight.do_async(cache_key, fetch)
+        if not leader:
+            self._record_call(endpoint, params_str, "coalesced", 0, started)
+        return result
+
+    async def _fetch_shared(self, endpoint: str, params_str: str, cache_key: str) -> Dict:
+        """Fetch a response once across workers, using a lease in the shared cache"""
+        leased = self.cache.acquire_lease(cache_key, LEASE_TTL)
+        if not leased:
+            started = time.perf_counter()
+            result = await self._wait_for_peer(cache_key)
+            if result is not None:
+                self._record_call(endpoint, params_str, "peer", 0, started)
+                return result
+        try:
+            return await self._fetch(endpoint, params_str, cache_key)
+        finally:
+            if leased:
+                self.cache.release_lease(cache_key)
+
+    async def _wait_for_peer(self, cache_key: str) -> Optional[Dict]:
+        """Wait for another worker holding the lease to store the response"""
+        deadline = time.monotonic() + upstream_timeout(LEASE_TTL)
+        while time.monotonic() < deadline:
+            result = self.cache.peek(cache_key)
+            if result is not None or not self.cache.lease_active(cache_key):
+                return result
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+        return None
+
+    async def _fetch(self, endpoint: str, params_str: str, cache_key: str) -> Dict:
+        """Send the request and store the response in the cache"""
+        params = json.loads(params_str)
+        started = time.perf_counter()
+        size = 0
+        breaker = circuit_breaker(endpoint)
+        try:
+            probe = breaker.check()
+        except CircuitOpenError as e:
+            logger.warning("Skipping request to %s: %s", endpoint, e)
+            self._record_call(endpoint, params_str, "rejected", 0, started)
+            return {"error": str(e)}
+        try:
+            logger.info("Making request to %s with params: %s", endpoint, params)
+            response = await self._fetch_response(endpoint, params, timeout=REQUEST_TIMEOUT)
+            size = len(response.content)
+            result = response.json()
+            log_response_body(logger, "Response received", result)
+            result = self._compact(params, result)
+            breaker.record_success()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error("Error making request: %s", e)
+            self._record_failure(breaker, e)
+            result = {"error": str(e)}
+        finally:
+            if probe:
+                breaker.abandon_probe()
+        self._record_call(endpoint, params_str, "miss", size, started)
+
+        if "error" in result and self._stale(cache_key) is not None:
+            return result
+        self.cache.set(cache_key, result, self._cache_ttl(params, result))
+        return result
+
+    async def _make_sparql_request(self, query: str, timeout: float = SPARQL_TIMEOUT) -> Dict:
+        """Make a request to the SPARQL endpoint"""
+        started = time.perf_counter()
+        size = 0
+        outcome = "miss"
+        breaker = circuit_breaker(self.sparql_endpoint)
+        probe = False
+        try:
+            probe = breaker.check()
+            logger.info("Making SPARQL request: %s", query)
+            response = await self._fetch_response(
+                self.sparql_endpoint,
+                {"format": "json", "query": query},
+                timeout=timeout
+            )
+            size = len(response.content)
+            result = response.json()
+            log_response_body(logger, "SPARQL response received", result)
+            breaker.record_success()
+            return result
+        except CircuitOpenError as e:
+            logger.warning("Skipping SPARQL request: %s", e)
+            outcome = "rejected"
+            return {"error": str(e)}
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error("Error making SPARQL request: %s", e)
+            self._record_failure(breaker, e)
+            return {"error": str(e)}
+        finally:
+            if probe:
+                breaker.abandon_probe()
+            record_upstream_call(self.sparql_endpoint, "sparql", 0, outcome, size, time.perf_counter() - started)
+
+    async def search(self, query: str) -> List[Dict]:
+        """Search for entities using Wikidata"""
+        if not query or not query.strip():
+            logger.warning("Empty search query")
+            return []
+
+        results = await self._make_request(self.wikidata_endpoint, self._search_params(query))
+        hit_ids = self._search_hit_ids(query, results)
+        if not hit_ids:
+            return []
+
+        entity_types = await self._get_entity_types(hit_ids)
+        return self._build_search_results(query, results, entity_types)
+
+    async def search_stream(self, query: str, max_workers: int = BATCH_WORKERS) -> AsyncIterator[Dict]:
+        """Yield real and fictional search hits as soon as each one is classified"""
+        if not query or not query.strip():
+            logger.warning("Empty search query")
+            return
+
+        results = await self._make_request(self.wikidata_endpoint, self._search_params(query))
+        hits = self._stream_hits(query, results)
+        if not hits:
+            return
+
+        known = self._known_types(list(hits))
+        for result in self._stream_results(hits, known):
+            yield result
+        pending = self._chunk_ids([entity_id for entity_id in hits if entity_id not in known], STREAM_CHUNK_SIZE)
+        limit = asyncio.Semaphore(max_workers)
+
+        async def classify(chunk):
+            async with limit:
+                return await self._get_entity_types(chunk)
+
+        for future in asyncio.as_completed([classify(chunk) for chunk in pending]):
+            for result in self._stream_results(hits, await future):
+                yield result
+
+    async def suggest(self, query: str, limit: int = DEFAULT_SUGGEST_LIMIT) -> List[Dict]:
+        """Autocomplete suggestions from the local index, or from one wbsearchentities call"""
+        suggestions = self.suggestions.lookup(query, limit)
+        if suggestions or not query.strip():
+            return suggestions
+        results = await self._make_request(self.wikidata_endpoint, self._search_params(query.strip()))
+        return self._suggestions_from_search(query, results, limit)
+
+    async def _get_entity_types(self, entity_ids: List[str]) -> Dict[str, str]:
+        """Determine types for many entities, fetching all chunks concurrently"""
+        chunks = self._chunk_ids(entity_ids)
+        results = await asyncio.gather(*[
+            self._make_request(self.wikidata_endpoint, self._entity_types_params(chunk))
+            for chunk in chunks
+        ])
+        entity_types = {}
+        for chunk, result in zip(chunks, results):
+            entity_types.update(self._parse_entity_types(chunk, result))
+        return entity_types
+
+    async def get_entities_by_ids(self, items: List[str],
+                                  max_workers: int = BATCH_WORKERS) -> AsyncIterator[Dict]:
+        """Resolve QIDs or names, yielding one result per distinct input as soon as it is ready"""
+        entity_ids, names = self._batch_inputs(items)
+        limit = asyncio.Semaphore(max_workers)
+
+        async def bounded(coroutine):
+            async with limit:
+                return await coroutine
+
+        for future in asyncio.as_completed([bounded(self._resolve_name(name)) for name in names]):
+            name, entity_id = await future
+            if entity_id is None:
+                yield self._batch_not_found(name)
+            else:
+                entity_ids.setdefault(entity_id, []).append(name)
+
+        for entity_id in list(entity_ids):
+            stored = self._stored_details(entity_id)
+            if stored is not None:
+                for result in self._batch_results(entity_ids.pop(entity_id), stored):
+                    yield result
+        chunks = [bounded(self._fetch_chunk_details(chunk)) for chunk in self._chunk_ids(list(entity_ids))]
+        for future in asyncio.as_completed(chunks):
+            chunk, details = await future
+            for entity_id in chunk:
+                for result in self._batch_results(entity_ids[entity_id], details.get(entity_id)):
+                    yield result
+
+    async def _resolve_name(self, name: str):
+        results = await self.search(name)
+        return name, results[0]["id"] if results else None
+
+    async def _fetch_chunk_details(self, chunk: List[str]):
+        result = await self._make_request(self.wikidata_endpoint, self._entity_details_params("|".join(chunk)))
+        entities = self._chunk_entities(chunk, result)
+        if self._chunk_failed(result):
+            return chunk, self._chunk_errors(chunk)
+        return chunk, self._chunk_details(entities, await self._get_labels_map(self._chunk_label_ids(entities)))
+
+    async def _get_labels_map(self, entity_ids: List[str]) -> Dict[str, str]:
+        """Fetch labels for all given ids, fetching all chunks concurrently"""
+        chunks = self._chunk_ids(entity_ids)
+        results = await asyncio.gather(*[
+            self._make_request(self.wikidata_endpoint, self._labels_params(chunk))
+            for chunk in chunks
+        ])
+        labels = {}
+        for chunk, result in zip(chunks, results):
+            labels.update(self._parse_labels(chunk, result))
+        return labels
+
+    async def _get_entity_details(self, entity: Dict, result: Optional[Dict] = None) -> Dict:
+        """Get detailed information about a specific entity"""
+        if result is None:
+            stored = self._stored_details(entity["id"])
+            if stored is not None:
+                return stored
+            result = await self._make_request(self.wikidata_endpoint, self._entity_details_params(entity["id"]))
+        entity_data = self._entity_data(entity, result)
+        if entity_data is None:
+            return self._details_error(entity)
+
+        referenced_ids = self._collect_label_ids(entity_data.get("claims", {}))
+        labels = await self._get_labels_map([entity_id for ids in referenced_ids.values() for entity_id in ids])
+        return self._remember_details(entity_data, self._build_entity_details(entity, entity_data, referenced_ids, labels))
+
+    async def get_revisions(self, entity_ids: List[str]) -> Dict[str, Optional[int]]:
+        """Current lastrevid of up to 50 entities (None for deleted ones), bypassing the cache"""
+        params_str = self._revisions_params(entity_ids)
+        result = await self._fetch(self.wikidata_endpoint, params_str, f"{self.wikidata_endpoint}?{params_str}")
+        return self._parse_revisions(result)
+
+    async def refresh_entities(self, entity_ids: List[str]) -> int:
+        """Rebuild stored details of up to 50 changed entities with one batched fetch"""
+        params_str = self._entity_details_params("|".join(entity_ids))
+        result = await self._fetch(self.wikidata_endpoint, params_str, f"{self.wikidata_endpoint}?{params_str}")
+        entities = self._chunk_entities(entity_ids, result)
+        self._chunk_details(entities, await self._get_labels_map(self._chunk_label_ids(entities)))
+        return len(entities)
+
+    async def get_wikipedia_info(self, query: str) -> Dict:
+        """Get detailed information about an entity"""
+        if not query or not query.strip():
+            logger.warning("Empty query in get_wikipedia_info")
+            return {
+                "status": "not_found",
+                "name": "",
+                "summary": "Пожалуйста, введите поисковый запрос."
+            }
+
+        search_results = await self.search(query)
+
+        if not search_results:
+            logger.warning("No results found for query: %s", query)
+            return {
+                "status": "not_found",
+                "name": query,
+                "summary": "Информация не найдена."
+            }
+
+        if len(search_results) == 1:
+            try:
+                return await self._get_entity_details(search_results[0])
+            except Exception as e:
+                logger.error("Error getting entity details: %s", e)
+                return {
+                    "status": "error",
+                    "name": search_results[0].get("name", query),
+                    "summary": "Ошибка при получении данных."
+                }
+        else:
+            return {
+                "status": "multiple_results",
+                "results": search_results
+            }
+
+    async def get_random(self, type: str) -> Optional[Dict]:
+        """Get a random entity of specified type"""
+        logger.info("Getting random entity of type: %s", type)
+
+        if type not in ["fictional", "real"]:
+            logger.error("Invalid entity type: %s", type)
+            return None
+
+        # Выборка идёт из локального индекса; при пустом индексе он загружается
+        # синхронно, поэтому выполняем её в отдельном потоке
+        entities = await asyncio.to_thread(self.candidates.sample, type, 1)
+        if not entities:
+            return None
+
+        return await self._get_entity_details(entities[0])
+
+    async def get_entity_by_id(self, entity_id: str) -> Optional[Dict]:
+        """Get detailed information about an entity by its ID"""
+        logger.info("Getting entity details by ID: %s", entity_id)
+
+        try:
+            stored = self._stored_details(entity_id)
+            if stored is not None:
+                return stored
+
+            # Тип определяется по утверждениям из того же ответа wbgetentities
+            result = await self._make_request(self.wikidata_endpoint, self._entity_details_params(entity_id))
+            entity = self._base_entity(entity_id, result.get("entities", {}).get(entity_id, {}))
+
+            result = await self._get_entity_details(entity, result)
+
+            if result and result.get("status") == "ok":
+                self.suggestions.add(entity_id, result["name"], entity["type"], result.get("description", ""))
+                return result
+            else:
+                logger.warning("Failed to get entity details for ID: %s", entity_id)
+                return None
+
+        except Exception as e:
+            logger.error("Error getting entity by ID: %s", e)
+            return None
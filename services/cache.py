@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Ограничение размера кэша по умолчанию (в байтах сериализованных значений)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Сколько секунд после истечения срока ответ ещё можно отдать, пока он обновляется
+DEFAULT_STALE_FOR = 24 * 60 * 60
+# Время последнего обращения к записи на диске обновляется не чаще раза в столько секунд:
+# для вытеснения такой точности хватает, а чтения не превращаются в записи
+TOUCH_INTERVAL = 60
+
+
+class CacheBackend:
+    """Base class for response caches used by WikipediaHelper"""
+
+    def __init__(self, stale_for: float = DEFAULT_STALE_FOR):
+        self.stale_for = stale_for
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return a cached value or None if it is missing or expired"""
+        value = self.peek(key)
+        self._record(value is not None)
+        return value
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Like get, but without touching the hit/miss counters"""
+        raise NotImplementedError
+
+    def peek_stale(self, key: str) -> Optional[Any]:
+        """Return a value even if it expired less than stale_for seconds ago"""
+        return None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store a value for ttl seconds"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Drop all cached values"""
+        raise NotImplementedError
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        """Try to become the only process fetching key; True if the caller should fetch it"""
+        return True
+
+    def release_lease(self, key: str) -> None:
+        """Release a lease taken with acquire_lease"""
+
+    def lease_active(self, key: str) -> bool:
+        """Whether some process currently holds an unexpired lease on key"""
+        return False
+
+    def _record(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters of this process"""
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache bounded by the total size of stored values.
+
+    Values are kept as compact UTF-8 JSON rather than decoded objects:
+    a decoded response takes roughly ten times more heap than its
+    encoding, and every reader gets its own copy it may safely modify.
+    Expired values stay for stale_for seconds for peek_stale.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, stale_for: float = DEFAULT_STALE_FOR):
+        super().__init__(stale_for)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, encoded value)
+        self._lock = threading.Lock()
+
+    def peek(self, key: str) -> Optional[Any]:
+        return self._read(key, 0)
+
+    def peek_stale(self, key: str) -> Optional[Any]:
+        return self._read(key, self.stale_for)
+
+    def _read(self, key: str, stale_for: float) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] + self.stale_for < now:
+                self._remove(key)
+                entry = None
+            if entry is not None and entry[0] + stale_for < now:
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        return json.loads(entry[2]) if entry is not None else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + ttl, size, data)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats.update({"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes})
+        return stats
+
+
+class SQLiteCache(CacheBackend):
+    """On-disk cache shared by all worker processes on the host"""
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, stale_for: float = DEFAULT_STALE_FOR):
+        super().__init__(stale_for)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            # Суммарный размер записей ведут триггеры, чтобы не считать SUM(size) при каждой записи
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_size ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " total INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache"
+                " BEGIN UPDATE cache_size SET total = total + NEW.size; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON cache"
+                " BEGIN UPDATE cache_size SET total = total + NEW.size - OLD.size; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache"
+                " BEGIN UPDATE cache_size SET total = total - OLD.size; END"
+            )
+            # Для кэша, созданного до появления триггеров, итог считается один раз
+            conn.execute("INSERT OR IGNORE INTO cache_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM cache")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                " key TEXT PRIMARY KEY,"
+                " expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение создаётся отдельно для каждого потока и процесса (после fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def peek(self, key: str) -> Optional[Any]:
+        return self._read(key, 0)
+
+    def peek_stale(self, key: str) -> Optional[Any]:
+        return self._read(key, self.stale_for)
+
+    def _read(self, key: str, stale_for: float) -> Optional[Any]:
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] + self.stale_for < now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+            if row is not None and row[1] + stale_for < now:
+                row = None
+            if row is not None and row[2] + TOUCH_INTERVAL < now:
+                conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.error("Error reading from cache %s: %s", self.path, e)
+            row = None
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            conn = self._connect()
+            # REPLACE удаляет старую строку без срабатывания триггеров, поэтому обновляем её на месте
+            conn.execute(
+                "INSERT INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,"
+                " expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (key, data, size, now + ttl, now)
+            )
+            self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.error("Error writing to cache %s: %s", self.path, e)
+
+    def _total(self, conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT total FROM cache_size").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        if self._total(conn) <= self.max_bytes:
+            return
+        # Сначала удаляем записи, которые нельзя отдать даже устаревшими, затем давно не использовавшиеся
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (now - self.stale_for,))
+        total = self._total(conn)
+        while total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM cache ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM cache")
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        try:
+            conn = self._connect()
+            # Просроченная аренда означает, что её владелец упал или завис
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)", (key, now + ttl)
+            )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.error("Error acquiring cache lease %s: %s", self.path, e)
+            return True
+
+    def release_lease(self, key: str) -> None:
+        try:
+            self._connect().execute("DELETE FROM leases WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.error("Error releasing cache lease %s: %s", self.path, e)
+
+    def lease_active(self, key: str) -> bool:
+        try:
+            row = self._connect().execute(
+                "SELECT 1 FROM leases WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+            return row is not None
+        except sqlite3.Error as e:
+            logger.error("Error reading cache lease %s: %s", self.path, e)
+            return False
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        try:
+            conn = self._connect()
+            entries = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            size = self._total(conn)
+            stats.update({"entries": entries, "bytes": size, "max_bytes": self.max_bytes})
+        except sqlite3.Error as e:
+            logger.error("Error reading cache stats %s: %s", self.path, e)
+        return stats
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from array import array
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Как часто обновлять список кандидатов из SPARQL (в секундах)
+DEFAULT_REFRESH_INTERVAL = 24 * 60 * 60
+# Пауза перед повторной загрузкой после неудачи, чтобы не блокировать запросы на каждом вызове
+REFRESH_RETRY_INTERVAL = 60
+
+
+class CandidateIndex:
+    """Locally cached set of random-pick candidates per entity type.
+
+    Candidates are stored compactly as an array of numeric QIDs plus a
+    parallel list of labels, so sampling is O(1) per pick. The set is
+    loaded with a single SPARQL dump (via loader) or from a local JSON
+    file, and refreshed in the background once it is older than
+    refresh_interval; the old set keeps being served meanwhile.
+    """
+
+    def __init__(self, loader: Callable[[str], List[Dict]], path: Optional[str] = None,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 on_update: Optional[Callable[[str, List[Dict]], None]] = None):
+        self.loader = loader
+        self.path = path
+        self.refresh_interval = refresh_interval
+        # Вызывается с типом и списком кандидатов после каждой загрузки
+        self.on_update = on_update
+        self._candidates = {}  # type -> (refreshed_at, array of QID numbers, labels)
+        self._file_mtime = None
+        self._refreshing = set()
+        self._retry_at = {}
+        self._lock = threading.Lock()
+        self._initial_lock = threading.Lock()
+        self._load_file()
+
+    def sample(self, type: str, count: int = 1) -> List[Dict]:
+        """Return up to count distinct random candidates of the given type"""
+        self._load_file()
+        candidates = self._candidates.get(type)
+        if candidates is None:
+            # Первый запуск без локального файла: загружаем синхронно один раз
+            with self._initial_lock:
+                if type not in self._candidates and time.time() >= self._retry_at.get(type, 0):
+                    self.refresh(type)
+            candidates = self._candidates.get(type)
+            if candidates is None:
+                return []
+        elif time.time() - candidates[0] > self.refresh_interval and time.time() >= self._retry_at.get(type, 0):
+            self._schedule_refresh(type)
+
+        _, ids, labels = candidates
+        if not ids:
+            return []
+        return [
+            {"id": f"Q{ids[i]}", "name": labels[i], "type": type, "description": ""}
+            for i in random.sample(range(len(ids)), min(count, len(ids)))
+        ]
+
+    def size(self, type: str) -> int:
+        candidates = self._candidates.get(type)
+        return len(candidates[1]) if candidates else 0
+
+    def refresh(self, type: str) -> bool:
+        """Reload candidates of the given type from the loader"""
+        entities = self.loader(type)
+        if not entities:
+            logger.warning("Candidate refresh for '%s' returned nothing, keeping old set", type)
+            self._retry_at[type] = time.time() + REFRESH_RETRY_INTERVAL
+            return False
+
+        ids = array("L")
+        labels = []
+        for entity in entities:
+            try:
+                ids.append(int(entity["id"].lstrip("Q")))
+            except ValueError:
+                continue
+            labels.append(entity["name"])
+
+        self._candidates[type] = (time.time(), ids, labels)
+        logger.info("Loaded %s random candidates for '%s'", len(ids), type)
+        self._save_file()
+        self._notify(type)
+        return True
+
+    def entries(self, type: str) -> List[Dict]:
+        """All loaded candidates of the given type"""
+        candidates = self._candidates.get(type)
+        if candidates is None:
+            return []
+        _, ids, labels = candidates
+        return [{"id": f"Q{qid}", "name": label, "type": type} for qid, label in zip(ids, labels)]
+
+    def _notify(self, type: str) -> None:
+        if self.on_update is None:
+            return
+        try:
+            self.on_update(type, self.entries(type))
+        except Exception as e:
+            logger.error("Error handling candidate update for '%s': %s", type, e)
+
+    def _schedule_refresh(self, type: str) -> None:
+        with self._lock:
+            if type in self._refreshing:
+                return
+            self._refreshing.add(type)
+
+        def run():
+            try:
+                self.refresh(type)
+            except Exception as e:
+                logger.error("Error refreshing candidates for '%s': %s", type, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(type)
+
+        threading.Thread(target=run, name=f"candidates-{type}", daemon=True).start()
+
+    def _load_file(self) -> None:
+        # Файл общий для всех воркеров: перечитываем его, если другой процесс его обновил
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self._file_mtime:
+                return
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            for type, entry in data.items():
+                current = self._candidates.get(type)
+                if current is None or current[0] < entry["refreshed_at"]:
+                    self._candidates[type] = (entry["refreshed_at"], array("L", entry["ids"]), entry["labels"])
+                    self._notify(type)
+            self._file_mtime = mtime
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Error loading candidates from %s: %s", self.path, e)
+
+    def _save_file(self) -> None:
+        if not self.path:
+            return
+        data = {
+            type: {"refreshed_at": refreshed_at, "ids": ids.tolist(), "labels": labels}
+            for type, (refreshed_at, ids, labels) in self._candidates.items()
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._file_mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.error("Error saving candidates to %s: %s", self.path, e)
@@ -0,0 +1,77 @@
+from typing import Any, Dict, Iterable, List
+
+# Поля результата wbsearchentities, которые читает WikipediaHelper
+SEARCH_FIELDS = ("id", "label", "description", "aliases")
+
+
+def _compact_terms(terms: Dict, languages: List[str]) -> Dict:
+    return {lang: {"value": terms[lang]["value"]} for lang in languages if lang in terms}
+
+
+def _compact_aliases(aliases: Dict, languages: List[str]) -> Dict:
+    return {lang: [{"value": alias["value"]} for alias in aliases[lang]]
+            for lang in languages if lang in aliases}
+
+
+def _compact_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "id" in value:
+            return {"id": value["id"]}
+        if "time" in value:
+            return {"time": value["time"]}
+    return value
+
+
+def compact_claims(claims: Dict, properties: Iterable[str]) -> Dict:
+    """Keep only the used properties and only the main value of each statement"""
+    compacted = {}
+    for prop in properties:
+        if prop not in claims:
+            continue
+        statements = []
+        for claim in claims[prop]:
+            datavalue = claim.get("mainsnak", {}).get("datavalue")
+            if datavalue is None:
+                statements.append({"mainsnak": {}})
+            else:
+                statements.append({"mainsnak": {"datavalue": {"value": _compact_value(datavalue["value"])}}})
+        compacted[prop] = statements
+    return compacted
+
+
+def compact_entity(entity: Dict, properties: Iterable[str], languages: List[str]) -> Dict:
+    """Project a wbgetentities entity onto the fields used to build character pages"""
+    compacted = {key: entity[key] for key in ("id", "lastrevid", "missing") if key in entity}
+    if "labels" in entity:
+        compacted["labels"] = _compact_terms(entity["labels"], languages)
+    if "descriptions" in entity:
+        compacted["descriptions"] = _compact_terms(entity["descriptions"], languages)
+    if "aliases" in entity:
+        compacted["aliases"] = _compact_aliases(entity["aliases"], languages)
+    if "sitelinks" in entity:
+        compacted["sitelinks"] = {
+            f"{lang}wiki": {"title": entity["sitelinks"][f"{lang}wiki"]["title"]}
+            for lang in languages if f"{lang}wiki" in entity["sitelinks"]
+        }
+    if "claims" in entity:
+        compacted["claims"] = compact_claims(entity["claims"], properties)
+    return compacted
+
+
+def compact_response(action: str, result: Dict, properties: Iterable[str], languages: List[str]) -> Dict:
+    """Compact projection of an API response, shaped like the original for the parsers"""
+    if "error" in result:
+        return result
+    if action == "wbgetentities" and "entities" in result:
+        return {"entities": {
+            entity_id: compact_entity(entity, properties, languages)
+            for entity_id, entity in result["entities"].items()
+        }}
+    if action == "wbgetclaims" and "claims" in result:
+        return {"claims": compact_claims(result["claims"], properties)}
+    if action == "wbsearchentities" and "search" in result:
+        return {"search": [
+            {field: item[field] for field in SEARCH_FIELDS if field in item}
+            for item in result["search"]
+        ]}
+    return result
@@ -0,0 +1,137 @@
+"""Build a DumpStore from a Wikidata JSON dump.
+
+Reads latest-all.json.gz / .bz2 (or an uncompressed file) line by line,
+so memory stays bounded by one batch whatever the dump size. Real and
+fictional characters are stored as compact payloads with a name index;
+every other entity only contributes its labels in the served languages,
+which is what character pages need for places, occupations and works.
+
+    python -m services.dump_ingest latest-all.json.gz --db data/offline.sqlite3 --languages ru,en
+    WHOAMI_OFFLINE_DB=data/offline.sqlite3 flask run
+"""
+import argparse
+import bz2
+import gzip
+import json
+import logging
+import sys
+import time
+from typing import Dict, IO, Iterator, List, Optional
+
+from services.compact import compact_entity
+from services.dump_store import DumpStore
+from services.suggest_index import normalize, word_tails
+from services.wikipedia_service import USED_PROPERTIES, classify_entity
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+# Как часто сообщать о ходе загрузки (в обработанных строках дампа)
+PROGRESS_EVERY = 100000
+
+
+def open_dump(path: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_entities(lines: Iterator[str]) -> Iterator[Dict]:
+    """Entities of a dump: one JSON object per line inside a top-level array"""
+    for line in lines:
+        line = line.strip().rstrip(",")
+        if not line or line in ("[", "]"):
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            logger.warning("Skipping malformed dump line: %s", e)
+
+
+class DumpIngester:
+    """Stream dump entities into a DumpStore in batches"""
+
+    def __init__(self, store: DumpStore, languages: List[str], batch_size: int = DEFAULT_BATCH_SIZE):
+        self.store = store
+        self.languages = languages
+        self.batch_size = batch_size
+        self.counts = {"lines": 0, "real": 0, "fictional": 0, "labels": 0}
+        self._entities, self._labels, self._names = [], [], []
+
+    def ingest(self, path: str, limit: Optional[int] = None) -> Dict:
+        started = time.time()
+        with open_dump(path) as f:
+            for entity in iter_entities(f):
+                self.add(entity)
+                if self.counts["lines"] % PROGRESS_EVERY == 0:
+                    logger.info("Ingested %s dump entities: %s", self.counts["lines"], self.counts)
+                if limit is not None and self.counts["lines"] >= limit:
+                    break
+        self.flush()
+        self.store.set_meta({
+            "source": path,
+            "languages": ",".join(self.languages),
+            "built_at": str(int(time.time())),
+        })
+        logger.info("Dump ingested in %.0f s: %s", time.time() - started, self.counts)
+        return dict(self.counts)
+
+    def add(self, entity: Dict) -> None:
+        self.counts["lines"] += 1
+        if entity.get("type") != "item":
+            return
+        qid = entity["id"]
+        for lang in self.languages:
+            label = entity.get("labels", {}).get(lang)
+            if label:
+                self._labels.append((qid, lang, label["value"]))
+                self.counts["labels"] += 1
+
+        type = classify_entity(entity)
+        if type in ("real", "fictional"):
+            compacted = compact_entity(entity, USED_PROPERTIES, self.languages)
+            data = json.dumps(compacted, ensure_ascii=False, separators=(",", ":"))
+            self._entities.append((qid, type, len(entity.get("sitelinks", {})), data))
+            self._names.extend(self._entity_names(qid, compacted))
+            self.counts[type] += 1
+
+        if len(self._labels) + len(self._entities) >= self.batch_size:
+            self.flush()
+
+    def _entity_names(self, qid: str, entity: Dict) -> List[tuple]:
+        names = set()
+        for lang in self.languages:
+            values = [entity.get("labels", {}).get(lang, {}).get("value", "")]
+            values += [alias["value"] for alias in entity.get("aliases", {}).get(lang, [])]
+            for value in values:
+                normalized = normalize(value)
+                if normalized:
+                    names.update((lang, tail, qid) for tail in word_tails(normalized))
+        return list(names)
+
+    def flush(self) -> None:
+        if self._entities or self._labels or self._names:
+            self.store.write_batch(self._entities, self._labels, self._names)
+        self._entities, self._labels, self._names = [], [], []
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dump", help="Wikidata JSON dump, .json, .json.gz or .json.bz2")
+    parser.add_argument("--db", required=True, help="DumpStore file to create or extend")
+    parser.add_argument("--languages", default="ru,en")
+    parser.add_argument("--limit", type=int, help="stop after this many dump entities")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    ingester = DumpIngester(DumpStore(args.db), args.languages.split(","), batch_size=args.batch_size)
+    ingester.ingest(args.dump, limit=args.limit)
+    print(json.dumps(ingester.store.stats(), ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
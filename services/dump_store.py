@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.suggest_index import normalize
+
+logger = logging.getLogger(__name__)
+
+# Сколько совпадений имени по префиксу просматривать перед ранжированием:
+# время поиска не зависит от размера среза
+SEARCH_SCAN_LIMIT = 1000
+DEFAULT_SEARCH_LIMIT = 7
+
+
+class DumpStore:
+    """Local source of Wikidata answers built from a JSON dump subset.
+
+    Holds the compact payloads of real and fictional characters, labels
+    of every dump entity in the served languages and a word-prefix index
+    of character names. respond() answers the wbsearchentities and
+    wbgetentities calls WikipediaHelper makes, in the shapes of the API,
+    so the app can run with no network at all. Filled by
+    services.dump_ingest.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entities ("
+            " qid TEXT PRIMARY KEY,"
+            " type TEXT NOT NULL,"
+            " sitelinks INTEGER NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entities_type ON entities (type, sitelinks)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            " qid TEXT NOT NULL,"
+            " lang TEXT NOT NULL,"
+            " label TEXT NOT NULL,"
+            " PRIMARY KEY (qid, lang)) WITHOUT ROWID"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS names ("
+            " lang TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " qid TEXT NOT NULL,"
+            " PRIMARY KEY (lang, name, qid)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение создаётся отдельно для каждого потока и процесса (после fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def write_batch(self, entities: List[Tuple[str, str, int, str]], labels: List[Tuple[str, str, str]],
+                    names: List[Tuple[str, str, str]]) -> None:
+        """Insert (qid, type, sitelinks, data), (qid, lang, label) and (lang, name, qid) rows in one transaction"""
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO entities (qid, type, sitelinks, data) VALUES (?, ?, ?, ?)",
+                             entities)
+            conn.executemany("INSERT OR REPLACE INTO labels (qid, lang, label) VALUES (?, ?, ?)", labels)
+            conn.executemany("INSERT OR IGNORE INTO names (lang, name, qid) VALUES (?, ?, ?)", names)
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def set_meta(self, values: Dict[str, str]) -> None:
+        self._connect().executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", values.items())
+
+    def meta(self) -> Dict[str, str]:
+        return dict(self._connect().execute("SELECT key, value FROM meta").fetchall())
+
+    def stats(self) -> Dict:
+        conn = self._connect()
+        stats = {"entities": {}, "labels": conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0]}
+        for type, count in conn.execute("SELECT type, COUNT(*) FROM entities GROUP BY type"):
+            stats["entities"][type] = count
+        return stats
+
+    def respond(self, params: Dict) -> Dict:
+        """Answer a Wikidata API call from the local data"""
+        action = params.get("action")
+        try:
+            if action == "wbsearchentities":
+                return self.wbsearchentities(params)
+            if action == "wbgetentities":
+                return self.wbgetentities(params)
+        except sqlite3.Error as e:
+            logger.error("Error reading offline data %s: %s", self.path, e)
+            return {"error": str(e)}
+        return {"error": f"action {action} is not available offline"}
+
+    def wbsearchentities(self, params: Dict) -> Dict:
+        """Characters whose label or alias has a word starting with the query, most linked first"""
+        query = normalize(params.get("search", ""))
+        lang = params.get("language", "ru")
+        limit = int(params.get("limit", DEFAULT_SEARCH_LIMIT))
+        if not query:
+            return {"searchinfo": {"search": ""}, "search": [], "success": 1}
+        rows = self._connect().execute(
+            "SELECT e.qid, e.data FROM"
+            " (SELECT qid, MAX(name = ?) AS exact FROM"
+            "   (SELECT qid, name FROM names WHERE lang = ? AND name >= ? AND name < ? LIMIT ?)"
+            "  GROUP BY qid) AS n"
+            " JOIN entities AS e ON e.qid = n.qid"
+            " ORDER BY n.exact DESC, e.sitelinks DESC LIMIT ?",
+            (query, lang, query, query + "\uffff", SEARCH_SCAN_LIMIT, limit)
+        ).fetchall()
+        hits = []
+        for qid, data in rows:
+            entity = json.loads(data)
+            hit = {"id": qid, "label": self._term(entity, "labels", lang) or qid}
+            description = self._term(entity, "descriptions", lang)
+            if description:
+                hit["description"] = description
+            aliases = [alias["value"] for alias in entity.get("aliases", {}).get(lang, [])]
+            if aliases:
+                hit["aliases"] = aliases
+            hits.append(hit)
+        return {"searchinfo": {"search": params.get("search", "")}, "search": hits, "success": 1}
+
+    def _term(self, entity: Dict, field: str, lang: str) -> Optional[str]:
+        term = entity.get(field, {}).get(lang)
+        return term["value"] if term else None
+
+    def wbgetentities(self, params: Dict) -> Dict:
+        """Stored character payloads, or bare labels for any other dump entity"""
+        ids = [qid for qid in params.get("ids", "").split("|") if qid]
+        props = params.get("props", "info|labels|descriptions|aliases|claims|sitelinks").split("|")
+        languages = params.get("languages")
+        languages = languages.split("|") if languages else None
+        conn = self._connect()
+        placeholders = ",".join("?" * len(ids))
+        stored = {}
+        if props != ["labels"] and ids:
+            stored = dict(conn.execute(f"SELECT qid, data FROM entities WHERE qid IN ({placeholders})", ids))
+        labels: Dict[str, Dict] = {}
+        if ids and any(qid not in stored for qid in ids):
+            for qid, lang, label in conn.execute(
+                f"SELECT qid, lang, label FROM labels WHERE qid IN ({placeholders})", ids
+            ):
+                if languages is None or lang in languages:
+                    labels.setdefault(qid, {})[lang] = {"value": label}
+
+        entities = {}
+        for qid in ids:
+            if qid in stored:
+                entities[qid] = self._project(json.loads(stored[qid]), props, languages)
+            elif qid in labels and "labels" in props and "claims" not in props:
+                # Для прочих сущностей среза хранятся только метки
+                entities[qid] = {"id": qid, "labels": labels[qid]}
+            else:
+                entities[qid] = {"id": qid, "missing": ""}
+        return {"entities": entities, "success": 1}
+
+    def _project(self, entity: Dict, props: Iterable[str], languages: Optional[List[str]]) -> Dict:
+        projected = {"id": entity["id"]}
+        if "info" in props and "lastrevid" in entity:
+            projected["lastrevid"] = entity["lastrevid"]
+        for prop in ("labels", "descriptions", "aliases", "claims", "sitelinks"):
+            if prop not in props or prop not in entity:
+                continue
+            value = entity[prop]
+            if languages and prop in ("labels", "descriptions", "aliases"):
+                value = {lang: terms for lang, terms in value.items() if lang in languages}
+            projected[prop] = value
+        return projected
+
+    def candidates(self, type: str, lang: str, limit: int) -> List[Dict]:
+        """Most linked characters of a type that have a label in lang, shaped like SPARQL candidates"""
+        try:
+            rows = self._connect().execute(
+                "SELECT e.qid, l.label FROM entities AS e"
+                " JOIN labels AS l ON l.qid = e.qid AND l.lang = ?"
+                " WHERE e.type = ? ORDER BY e.sitelinks DESC LIMIT ?",
+                (lang, type, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error reading offline candidates %s: %s", self.path, e)
+            return []
+        return [{"id": qid, "name": label, "type": type, "description": ""} for qid, label in rows]
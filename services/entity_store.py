@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from services.cache import TOUCH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 50000
+# Как часто фоновый поток проверяет ревизии и через сколько запись считается непроверенной (в секундах)
+DEFAULT_REFRESH_INTERVAL = 10 * 60
+DEFAULT_REVALIDATE_AFTER = 60 * 60
+# Сколько самых популярных записей проверять за один проход
+DEFAULT_REFRESH_LIMIT = 500
+
+
+class EntityStore:
+    """On-disk store of built character pages keyed by (QID, language).
+
+    Each record is the normalized output of _get_entity_details together
+    with the Wikidata lastrevid it was built from, so popular pages survive
+    restarts and cache eviction and can be revalidated by revision id
+    instead of being refetched. Shared by all worker processes on the host.
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        # Обращения, ещё не записанные на диск: (QID, язык) -> число
+        self._pending_hits: Dict[Tuple[str, str], int] = {}
+        self._pending_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entities ("
+                " qid TEXT NOT NULL,"
+                " lang TEXT NOT NULL,"
+                " lastrevid INTEGER NOT NULL,"
+                " data TEXT NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0,"
+                " accessed_at REAL NOT NULL,"
+                " validated_at REAL NOT NULL,"
+                " PRIMARY KEY (qid, lang))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entities_validated_at ON entities (validated_at)")
+            # Число записей ведут триггеры, чтобы не считать COUNT(*) при каждой записи
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entities_count ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " total INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entities_count_insert AFTER INSERT ON entities"
+                " BEGIN UPDATE entities_count SET total = total + 1; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entities_count_delete AFTER DELETE ON entities"
+                " BEGIN UPDATE entities_count SET total = total - 1; END"
+            )
+            conn.execute("INSERT OR IGNORE INTO entities_count (id, total) SELECT 0, COUNT(*) FROM entities")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение создаётся отдельно для каждого потока и процесса (после fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, qid: str, lang: str) -> Optional[Dict]:
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT data, accessed_at FROM entities WHERE qid = ? AND lang = ?", (qid, lang)
+            ).fetchone()
+            if row is not None:
+                self._touch(conn, qid, lang, row[1])
+        except sqlite3.Error as e:
+            logger.error("Error reading entity %s from %s: %s", qid, self.path, e)
+            return None
+        return json.loads(row[0]) if row is not None else None
+
+    def _touch(self, conn: sqlite3.Connection, qid: str, lang: str, accessed_at: float) -> None:
+        # Обращения копятся в памяти и записываются вместе со временем не чаще раза в TOUCH_INTERVAL
+        now = time.time()
+        with self._pending_lock:
+            hits = self._pending_hits.pop((qid, lang), 0) + 1
+            if accessed_at + TOUCH_INTERVAL >= now:
+                self._pending_hits[(qid, lang)] = hits
+                return
+        conn.execute(
+            "UPDATE entities SET hits = hits + ?, accessed_at = ? WHERE qid = ? AND lang = ?",
+            (hits, now, qid, lang)
+        )
+
+    def put(self, qid: str, lang: str, details: Dict, lastrevid: int) -> None:
+        now = time.time()
+        data = json.dumps(details, ensure_ascii=False, separators=(",", ":"))
+        try:
+            conn = self._connect()
+            # Счётчик обращений сохраняется при обновлении записи
+            conn.execute(
+                "INSERT INTO entities (qid, lang, lastrevid, data, accessed_at, validated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (qid, lang) DO UPDATE SET"
+                " lastrevid = excluded.lastrevid, data = excluded.data, validated_at = excluded.validated_at",
+                (qid, lang, lastrevid, data, now, now)
+            )
+            self._evict(conn)
+        except sqlite3.Error as e:
+            logger.error("Error writing entity %s to %s: %s", qid, self.path, e)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        excess = conn.execute("SELECT total FROM entities_count").fetchone()[0] - self.max_entries
+        if excess > 0:
+            # Удаляем наименее популярные и давно не открывавшиеся страницы
+            conn.execute(
+                "DELETE FROM entities WHERE rowid IN"
+                " (SELECT rowid FROM entities ORDER BY hits, accessed_at LIMIT ?)",
+                (excess,)
+            )
+
+    def due(self, lang: str, validated_before: float, limit: int) -> List[Tuple[str, int]]:
+        """Most viewed records not revalidated since validated_before, as (qid, lastrevid)"""
+        try:
+            rows = self._connect().execute(
+                "SELECT qid, lastrevid FROM entities"
+                " WHERE lang = ? AND validated_at < ? ORDER BY hits DESC LIMIT ?",
+                (lang, validated_before, limit)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error listing entities in %s: %s", self.path, e)
+            return []
+        return rows
+
+    def mark_validated(self, qids: List[str], lang: str) -> None:
+        if not qids:
+            return
+        try:
+            self._connect().executemany(
+                "UPDATE entities SET validated_at = ? WHERE qid = ? AND lang = ?",
+                [(time.time(), qid, lang) for qid in qids]
+            )
+        except sqlite3.Error as e:
+            logger.error("Error updating entities in %s: %s", self.path, e)
+
+    def delete(self, qid: str, lang: str) -> None:
+        try:
+            self._connect().execute("DELETE FROM entities WHERE qid = ? AND lang = ?", (qid, lang))
+        except sqlite3.Error as e:
+            logger.error("Error deleting entity %s from %s: %s", qid, self.path, e)
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM entities")
+
+    def stats(self) -> Dict:
+        try:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM entities"
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Error reading entity store stats %s: %s", self.path, e)
+            return {}
+        return {"entries": entries, "bytes": size, "max_entries": self.max_entries}
+
+
+class EntityRefresher:
+    """Background revalidation of stored entities by revision id.
+
+    Every interval the most viewed records older than revalidate_after are
+    checked in batches of 50 with one wbgetentities props=info call each;
+    only entities whose lastrevid changed are rebuilt, again in one batched
+    call per chunk.
+    """
+
+    def __init__(self, helper, interval: float = DEFAULT_REFRESH_INTERVAL,
+                 revalidate_after: float = DEFAULT_REVALIDATE_AFTER,
+                 limit: int = DEFAULT_REFRESH_LIMIT):
+        self.helper = helper
+        self.interval = interval
+        self.revalidate_after = revalidate_after
+        self.limit = limit
+        self._stop = threading.Event()
+        self._pid = None
+
+    def start(self) -> None:
+        # Потоки не переживают fork, поэтому в каждом воркере запускаем поток заново;
+        # в автономном режиме сверять ревизии не с чем
+        if self._pid == os.getpid() or self.helper.entity_store is None or self.helper.offline is not None:
+            return
+        self._pid = os.getpid()
+        self._stop.clear()
+        threading.Thread(target=self._run, name=f"entity-refresher-{self.helper.lang}", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh_once()
+            except Exception as e:
+                logger.error("Error revalidating stored entities: %s", e)
+
+    def refresh_once(self) -> int:
+        """Revalidate one round of due records; return the number of rebuilt entities"""
+        store = self.helper.entity_store
+        lang = self.helper.lang
+        # Проход выполняет один воркер: аренда в общем кэше ответов
+        if not self.helper.cache.acquire_lease(f"entity-refresher:{lang}", self.interval / 2):
+            return 0
+        due = store.due(lang, time.time() - self.revalidate_after, self.limit)
+        rebuilt = 0
+        known = dict(due)
+        for chunk in self.helper._chunk_ids(list(known)):
+            revisions = self.helper.get_revisions(chunk)
+            changed = []
+            for qid in chunk:
+                if qid not in revisions:
+                    # Ошибка запроса: проверим запись в следующий проход
+                    continue
+                if revisions[qid] is None:
+                    store.delete(qid, lang)
+                elif revisions[qid] != known[qid]:
+                    changed.append(qid)
+            store.mark_validated([qid for qid in chunk if revisions.get(qid) == known[qid]], lang)
+            if changed:
+                rebuilt += self.helper.refresh_entities(changed)
+        if due:
+            logger.info("Revalidated %s stored entities, rebuilt %s", len(due), rebuilt)
+        return rebuilt
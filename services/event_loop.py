@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд ждать закрытия клиентов при остановке цикла
+STOP_TIMEOUT = 5
+
+
+class BackgroundLoop:
+    """One long-lived asyncio event loop per process, running in a daemon thread.
+
+    By default Flask runs every async view in a fresh event loop, so httpx
+    clients and semaphores created inside a view die with the request.
+    Views submitted here share one loop, so async helpers keep their
+    keep-alive connections and per-host limits across requests. The
+    caller's context variables (Flask request context, trace, budget) are
+    carried into the coroutine.
+    """
+
+    def __init__(self, name: str = "asyncio"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        # Поток цикла не переживает fork, поэтому в каждом процессе он запускается заново
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True).start()
+            return self._loop
+
+    def run(self, coro: Awaitable) -> Any:
+        """Run a coroutine on the loop and block the calling thread until it is done"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def async_to_sync(self, func: Callable[..., Awaitable]) -> Callable[..., Any]:
+        """Drop-in for Flask.async_to_sync that runs views on this loop"""
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+        return wrapper
+
+    def stop(self, *closers: Callable[[], Awaitable]) -> None:
+        """Await the closers (e.g. helper.aclose) on the loop, then stop it"""
+        with self._lock:
+            loop = self._loop if self._pid == os.getpid() else None
+            self._loop = None
+        if loop is None:
+            return
+        for close in closers:
+            try:
+                asyncio.run_coroutine_threadsafe(close(), loop).result(STOP_TIMEOUT)
+            except Exception as e:
+                logger.warning("Error closing %s on the %s loop: %s", close, self.name, e)
+        loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,59 @@
+import os
+from typing import Dict, Iterator, List, Optional
+
+from services.cache import CacheBackend, MemoryCache
+from services.http_client import PooledSession
+from services.singleflight import SingleFlight
+from services.wikipedia_service import WikipediaHelper
+
+
+class WikipediaHelperPool:
+    """Per-language WikipediaHelper instances sharing language-independent state.
+
+    All helpers use one response cache, HTTP pool, in-flight table and
+    entity store, and request entity data for every served language at
+    once, so claims, types and images are fetched and cached a single time.
+    Only search, label lookups, suggestions and random candidates are kept
+    per language.
+    """
+
+    def __init__(self, languages: List[str], default: Optional[str] = None,
+                 cache: Optional[CacheBackend] = None, http: Optional[PooledSession] = None,
+                 candidates_path: Optional[str] = None, **kwargs):
+        self.languages = list(dict.fromkeys(languages))
+        self.default_lang = default or self.languages[0]
+        if self.default_lang not in self.languages:
+            self.languages.insert(0, self.default_lang)
+        cache = cache if cache is not None else MemoryCache()
+        http = http if http is not None else PooledSession()
+        inflight = SingleFlight()
+        self._helpers: Dict[str, WikipediaHelper] = {
+            lang: WikipediaHelper(
+                lang,
+                languages=self.languages,
+                cache=cache,
+                http=http,
+                inflight=inflight,
+                candidates_path=self._candidates_path(candidates_path, lang),
+                **kwargs
+            )
+            for lang in self.languages
+        }
+
+    def _candidates_path(self, path: Optional[str], lang: str) -> Optional[str]:
+        # Метки кандидатов зависят от языка; файл основного языка сохраняет прежнее имя
+        if not path or lang == self.default_lang:
+            return path
+        root, ext = os.path.splitext(path)
+        return f"{root}.{lang}{ext}"
+
+    @property
+    def default(self) -> WikipediaHelper:
+        return self._helpers[self.default_lang]
+
+    def get(self, lang: Optional[str] = None) -> WikipediaHelper:
+        """Helper for lang, or the default helper for unknown or missing languages"""
+        return self._helpers.get(lang) or self.default
+
+    def __iter__(self) -> Iterator[WikipediaHelper]:
+        return iter(self._helpers.values())
@@ -0,0 +1,98 @@
+import os
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from services.resilience import remaining_budget, upstream_timeout
+
+DEFAULT_USER_AGENT = "whoami-helpers/1.0 (https://github.com/mygrood/whoami-helpers)"
+
+# Коды ответов, при которых имеет смысл повторить запрос
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Не ждём дольше этого времени, даже если сервер просит больший Retry-After,
+# чтобы не блокировать воркер на минуты
+MAX_RETRY_AFTER = 10
+
+
+class CappedRetry(Retry):
+    """Retry policy that honors Retry-After but never sleeps longer than MAX_RETRY_AFTER.
+
+    Inside a request with an upstream budget (services.resilience) retries
+    stop once the budget is spent and never sleep past it.
+    """
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return upstream_timeout(min(retry_after, MAX_RETRY_AFTER))
+
+    def get_backoff_time(self) -> float:
+        return upstream_timeout(super().get_backoff_time())
+
+    def is_exhausted(self) -> bool:
+        return super().is_exhausted() or remaining_budget() == 0
+
+
+class PooledSession:
+    """Lazily created keep-alive requests.Session, one per worker process"""
+
+    def __init__(self, user_agent: str = DEFAULT_USER_AGENT, pool_connections: int = 4,
+                 pool_maxsize: int = 16, max_retries: int = 3, backoff_factor: float = 0.5):
+        self.user_agent = user_agent
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _build(self) -> requests.Session:
+        session = requests.Session()
+        retry = CappedRetry(
+            total=self.max_retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            backoff_factor=self.backoff_factor,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "User-Agent": self.user_agent,
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive"
+        })
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        # Соединения нельзя разделять между процессами, поэтому после fork
+        # (например, gunicorn с preload) создаём новую сессию
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._build()
+                    self._pid = pid
+        return self._session
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.session.get(url, **kwargs)
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
@@ -0,0 +1,103 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import uuid
+from contextvars import ContextVar
+from typing import Any, List, Optional
+
+# Идентификатор входящего запроса, добавляется ко всем записям лога
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# Доля ответов API, тела которых пишутся в лог на уровне INFO (на DEBUG пишутся все)
+_body_sample_rate = 0.0
+_listener = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request id to every log record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(level: str = "INFO", log_file: Optional[str] = "app.log",
+                      structured: bool = False, body_sample_rate: float = 0.0) -> None:
+    """Route all logging through a queue so file and console writes happen off the request thread"""
+    global _body_sample_rate, _listener
+    _body_sample_rate = body_sample_rate
+
+    formatter = JsonFormatter() if structured else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if _listener is not None:
+        _listener.stop()
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+
+def restart_listener() -> None:
+    """Start a new writer thread in a forked child: the parent's thread does not exist there"""
+    global _listener
+    if _listener is None:
+        return
+    # Записи, оставшиеся в унаследованной очереди, допишет родительский процесс
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+@atexit.register
+def _stop_listener() -> None:
+    # Дописываем оставшиеся в очереди записи при завершении процесса
+    if _listener is not None:
+        _listener.stop()
+
+
+def log_response_body(logger: logging.Logger, label: str, body: Any) -> None:
+    """Log an API response body at DEBUG, or at INFO for a sampled share of responses"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s: %s", label, json.dumps(body, ensure_ascii=False))
+    elif _body_sample_rate and random.random() < _body_sample_rate and logger.isEnabledFor(logging.INFO):
+        logger.info("%s (sampled): %s", label, json.dumps(body, ensure_ascii=False))
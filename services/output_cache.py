@@ -0,0 +1,72 @@
+import hashlib
+import json
+import threading
+import time
+from email.utils import formatdate
+from typing import Dict, Optional
+
+from services.cache import CacheBackend
+
+# Время жизни готовых страниц на сервере и в браузере/CDN (в секундах)
+DEFAULT_PAGE_TTL = 10 * 60
+DEFAULT_BROWSER_MAX_AGE = 60
+
+
+class OutputCache:
+    """Cache of rendered HTML/JSON responses with HTTP validators.
+
+    Entries are stored in a CacheBackend under a "page:" prefix, so the
+    shared SQLite cache makes a page rendered by one worker available to
+    all of them. Each entry keeps its ETag and Last-Modified time so that
+    conditional requests can be answered with 304. Lookups are counted
+    separately from the backend's own hit/miss counters.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = DEFAULT_PAGE_TTL,
+                 max_age: int = DEFAULT_BROWSER_MAX_AGE):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def key(self, *parts: str) -> str:
+        return "page:" + json.dumps(parts, ensure_ascii=False)
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        # peek не трогает счётчики кэша ответов Wikidata: страницы считаются отдельно
+        entry = self.backend.peek(key)
+        with self._stats_lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def store(self, key: str, body: str, mimetype: str) -> Dict:
+        entry = {
+            "body": body,
+            "mimetype": mimetype,
+            "etag": hashlib.sha1(body.encode("utf-8")).hexdigest(),
+            "last_modified": time.time()
+        }
+        self.backend.set(key, entry, self.ttl)
+        return entry
+
+    def cache_headers(self, entry: Dict) -> Dict[str, str]:
+        """HTTP headers that let browsers and CDN edges reuse the entry"""
+        return {
+            "ETag": f'"{entry["etag"]}"',
+            "Last-Modified": formatdate(entry["last_modified"], usegmt=True),
+            "Cache-Control": f"public, max-age={self.max_age}, s-maxage={int(self.ttl)}"
+        }
+
+    def stats(self) -> Dict:
+        """Return page hit/miss counters of this process"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
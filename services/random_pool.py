@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+from services.wikipedia_service import WikipediaHelper
+
+logger = logging.getLogger(__name__)
+
+CHARACTER_TYPES = ("real", "fictional")
+
+# Пауза перед повторным пополнением после неудачной попытки (в секундах)
+REFILL_RETRY_INTERVAL = 5
+
+
+class RandomCharacterPool:
+    """Background-filled pool of ready-to-serve random characters per type.
+
+    Each refill samples a batch of random entities from the helper's
+    candidate index and resolves their details with batched wbgetentities
+    calls, so /api/random only has to pop a prepared dict. Resolving
+    the details also warms the response cache for the /search?id= page the
+    client is redirected to.
+    """
+
+    def __init__(self, helper: WikipediaHelper, size: int = 20, low_watermark: int = 5,
+                 batch_size: int = 30):
+        self.helper = helper
+        self.size = size
+        self.low_watermark = low_watermark
+        self.batch_size = batch_size
+        self._pools = {type: deque() for type in CHARACTER_TYPES}
+        self._refilling = set()
+        self._retry_at = {}
+        self._condition = threading.Condition()
+        self._pid = None
+
+    def start(self) -> None:
+        """Start filling the pools in the background"""
+        # Потоки не переживают fork, поэтому в каждом воркере запускаем их заново
+        self._pid = os.getpid()
+        with self._condition:
+            self._refilling.clear()
+        for type in CHARACTER_TYPES:
+            self._schedule_refill(type)
+
+    def get(self, type: str, timeout: float = 0) -> Optional[Dict]:
+        """Pop a prepared character, waiting up to timeout seconds if the pool is empty"""
+        if type not in self._pools:
+            return None
+        if self._pid != os.getpid():
+            self.start()
+
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            pool = self._pools[type]
+            while not pool:
+                self._schedule_refill(type)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or type not in self._refilling:
+                    return None
+                self._condition.wait(remaining)
+            character = pool.popleft()
+            if len(pool) < self.low_watermark:
+                self._schedule_refill(type)
+            return character
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {type: len(pool) for type, pool in self._pools.items()}
+
+    def _schedule_refill(self, type: str) -> None:
+        with self._condition:
+            if type in self._refilling or time.monotonic() < self._retry_at.get(type, 0):
+                return
+            self._refilling.add(type)
+        thread = threading.Thread(target=self._refill, args=(type,),
+                                  name=f"random-pool-{type}", daemon=True)
+        thread.start()
+
+    def _refill(self, type: str) -> None:
+        added = 0
+        try:
+            with self._condition:
+                seen = {character["wikidata_id"] for character in self._pools[type]}
+            entities = self.helper.get_random_entities(type, self.batch_size)
+            logger.info("Refilling random pool '%s' from %s candidates", type, len(entities))
+
+            entity_ids = list(dict.fromkeys(entity["id"] for entity in entities if entity["id"] not in seen))
+            for character in self._prepare(entity_ids):
+                with self._condition:
+                    if len(self._pools[type]) >= self.size:
+                        break
+                    self._pools[type].append(character)
+                    self._condition.notify_all()
+                added += 1
+        except Exception as e:
+            logger.error("Error refilling random pool '%s': %s", type, e)
+        finally:
+            with self._condition:
+                self._refilling.discard(type)
+                if not added:
+                    self._retry_at[type] = time.monotonic() + REFILL_RETRY_INTERVAL
+                self._condition.notify_all()
+
+    def _prepare(self, entity_ids: List[str]) -> Iterator[Dict]:
+        """Details of the found entities: stored ones first, the rest fetched 50 per wbgetentities call"""
+        missing = []
+        for entity_id in entity_ids:
+            stored = self.helper._stored_details(entity_id)
+            if stored is None:
+                missing.append(entity_id)
+            elif stored.get("status") == "ok":
+                yield stored
+        for chunk in self.helper._chunk_ids(missing):
+            # Метки всех сущностей пакета тоже запрашиваются вместе
+            _, details = self.helper._fetch_chunk_details(chunk)
+            for entity_id in chunk:
+                character = details.get(entity_id)
+                if character is not None and character.get("status") == "ok":
+                    yield character
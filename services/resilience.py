@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько ошибок подряд размыкают цепь и через сколько секунд пробуем снова
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+# Сколько фоновых обновлений устаревших ответов выполняется одновременно
+DEFAULT_REVALIDATE_WORKERS = 2
+
+# Момент (time.monotonic), после которого входящий запрос больше не ждёт Wikidata
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+def start_budget(seconds: Optional[float]) -> None:
+    """Give the current request seconds of upstream time; None removes the limit"""
+    request_deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left of the current request's budget, or None outside a budgeted request"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def upstream_timeout(timeout: float) -> float:
+    """Timeout for the next upstream call: timeout, cut down to the remaining budget"""
+    remaining = remaining_budget()
+    return timeout if remaining is None else min(timeout, remaining)
+
+
+def is_upstream_failure(status: Optional[int]) -> bool:
+    """Whether a failed call says something about the endpoint's health (no response, 5xx or 429)"""
+    return status is None or status >= 500 or status == 429
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open or when the budget is spent"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one upstream endpoint.
+
+    After failure_threshold failed calls in a row the circuit opens and
+    calls are rejected without touching the network for reset_timeout
+    seconds; then a single probe call is let through and its outcome
+    closes the circuit or opens it again. A probe that ends without an
+    outcome (an unexpected exception) must call abandon_probe().
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.rejected = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go to the network now"""
+        return self._admit() is not None
+
+    def _admit(self) -> Optional[bool]:
+        """None if the call is rejected, else whether it is the half-open probe"""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return False
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return None
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Circuit for %s closed", self.name)
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probing:
+                    logger.warning("Circuit for %s opened after %s failures", self.name, self.failures)
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def abandon_probe(self) -> None:
+        """The probe ended without recording an outcome: keep the circuit open for another reset_timeout"""
+        with self._lock:
+            if self._probing:
+                logger.warning("Circuit for %s probe failed unexpectedly, staying open", self.name)
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def check(self) -> bool:
+        """Raise CircuitOpenError unless a call may go out within the request budget; True for the probe"""
+        if remaining_budget() == 0:
+            raise CircuitOpenError(f"request budget exhausted before calling {self.name}")
+        probe = self._admit()
+        if probe is None:
+            raise CircuitOpenError(f"circuit for {self.name} is open")
+        return probe
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """Process-wide breaker of an endpoint, shared by all helpers"""
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+def circuit_breakers() -> Dict[str, CircuitBreaker]:
+    with _breakers_lock:
+        return dict(_breakers)
+
+
+class Revalidator:
+    """Bounded background refresh of expired responses, one task per key at a time"""
+
+    def __init__(self, workers: int = DEFAULT_REVALIDATE_WORKERS):
+        self.workers = workers
+        self._pending = set()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, refresh: Callable[[], None]) -> bool:
+        """Schedule refresh() unless key is already being refreshed; True if scheduled"""
+        with self._lock:
+            # Пул потоков не переживает fork, в каждом воркере создаём свой
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="revalidate")
+                self._pid = os.getpid()
+                self._pending.clear()
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        self._executor.submit(self._run, key, refresh)
+        return True
+
+    def _run(self, key: str, refresh: Callable[[], None]) -> None:
+        try:
+            refresh()
+        except Exception as e:
+            logger.error("Error revalidating %s: %s", key, e)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+
+revalidator = Revalidator()
@@ -0,0 +1,137 @@
+import bisect
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Сколько подсказок возвращать по умолчанию
+DEFAULT_SUGGEST_LIMIT = 8
+# Сколько совпадений по префиксу просматривать перед ранжированием
+SCAN_FACTOR = 4
+# Сколько сущностей помнит индекс; при переполнении давно не встречавшиеся вытесняются пачкой
+DEFAULT_MAX_ENTITIES = 100000
+EVICT_FRACTION = 0.1
+
+
+def normalize(text: str) -> str:
+    return text.casefold().replace("ё", "е").strip()
+
+
+def word_tails(normalized: str) -> List[str]:
+    """The string itself and its tails starting at every following word"""
+    tails = [normalized]
+    for i, char in enumerate(normalized):
+        if char in " -" and i + 1 < len(normalized):
+            tails.append(normalized[i + 1:].lstrip(" -"))
+    return tails
+
+
+class SuggestIndex:
+    """In-memory prefix index of entity labels and aliases for autocomplete.
+
+    Keys are normalized label tails starting at every word, kept in a
+    sorted list, so "эйнш" finds "Альберт Эйнштейн" with one bisect and a
+    short forward scan. Each entity keeps its last known real/fictional
+    type; entities seen without classification have type None. At most
+    max_entities entities are kept, the least recently added or suggested
+    ones are evicted first.
+    """
+
+    def __init__(self, max_entities: int = DEFAULT_MAX_ENTITIES):
+        self.max_entities = max_entities
+        self._keys: List[Tuple[str, str]] = []  # (normalized tail, QID), sorted
+        # QID -> {"id", "label", "description", "type"}, от давно не встречавшихся к недавним
+        self._entities: "OrderedDict[str, Dict]" = OrderedDict()
+        self._indexed: Dict[str, set] = {}  # QID -> indexed normalized labels
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def add(self, entity_id: str, label: str, type: Optional[str] = None,
+            description: str = "", aliases: Iterable[str] = ()) -> None:
+        self.add_many([(entity_id, label, type, description, aliases)])
+
+    def add_many(self, entries: Iterable[Tuple]) -> None:
+        """Add (id, label, type, description, aliases) tuples; known entities are updated"""
+        new_keys = []
+        with self._lock:
+            for entity_id, label, type, description, aliases in entries:
+                if not label:
+                    continue
+                entity = self._entities.get(entity_id)
+                if entity is None:
+                    entity = self._entities[entity_id] = {
+                        "id": entity_id, "label": label, "description": description, "type": type
+                    }
+                else:
+                    # Не затираем известный тип и описание пустыми значениями
+                    entity["type"] = type or entity["type"]
+                    entity["description"] = description or entity["description"]
+                    self._entities.move_to_end(entity_id)
+                indexed = self._indexed.setdefault(entity_id, set())
+                for name in (label, *aliases):
+                    normalized = normalize(name)
+                    if not normalized or normalized in indexed:
+                        continue
+                    indexed.add(normalized)
+                    new_keys.extend((tail, entity_id) for tail in word_tails(normalized))
+            if new_keys:
+                self._merge_keys(new_keys)
+            if len(self._entities) > self.max_entities:
+                self._evict()
+
+    def _merge_keys(self, new_keys: List[Tuple[str, str]]) -> None:
+        if len(new_keys) < 16:
+            for key in new_keys:
+                bisect.insort(self._keys, key)
+            return
+        # Пачку вклеиваем между срезами старого списка: бинарный поиск места и копирование, без сортировки
+        new_keys.sort()
+        merged = []
+        start = 0
+        for key in new_keys:
+            i = bisect.bisect_left(self._keys, key, start)
+            merged += self._keys[start:i]
+            merged.append(key)
+            start = i
+        merged += self._keys[start:]
+        self._keys = merged
+
+    def _evict(self) -> None:
+        evicted = set()
+        target = int(self.max_entities * (1 - EVICT_FRACTION))
+        while len(self._entities) > target:
+            entity_id, _ = self._entities.popitem(last=False)
+            self._indexed.pop(entity_id, None)
+            evicted.add(entity_id)
+        self._keys = [key for key in self._keys if key[1] not in evicted]
+
+    def types(self, entity_ids: Iterable[str]) -> Dict[str, str]:
+        """Known real/fictional types of the given entities"""
+        with self._lock:
+            return {entity_id: self._entities[entity_id]["type"] for entity_id in entity_ids
+                    if entity_id in self._entities and self._entities[entity_id]["type"] is not None}
+
+    def lookup(self, prefix: str, limit: int = DEFAULT_SUGGEST_LIMIT) -> List[Dict]:
+        """Return up to limit entities whose label or alias has a word starting with prefix"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        matches: Dict[str, Tuple] = {}
+        with self._lock:
+            keys = self._keys
+            i = bisect.bisect_left(keys, (prefix, ""))
+            while i < len(keys) and len(matches) < limit * SCAN_FACTOR:
+                tail, entity_id = keys[i]
+                if not tail.startswith(prefix):
+                    break
+                entity = self._entities[entity_id]
+                # Выше: начало всей метки, затем классифицированные, затем короткие
+                rank = (not normalize(entity["label"]).startswith(prefix), entity["type"] is None,
+                        len(entity["label"]))
+                if entity_id not in matches or rank < matches[entity_id][0]:
+                    matches[entity_id] = (rank, dict(entity))
+                i += 1
+            for entity_id in matches:
+                self._entities.move_to_end(entity_id)
+        return [entity for _, entity in sorted(matches.values(), key=lambda m: m[0])[:limit]]
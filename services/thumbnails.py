@@ -0,0 +1,263 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import quote, unquote
+
+import requests
+
+from services.cache import TOUCH_INTERVAL
+from services.resilience import CircuitOpenError, circuit_breaker, is_upstream_failure, upstream_timeout
+from services.singleflight import SingleFlight
+from services.tracing import record_upstream_call
+
+logger = logging.getLogger(__name__)
+
+# Special:FilePath отдаёт перенаправление на готовую миниатюру нужной ширины на upload.wikimedia.org
+FILE_PATH_ENDPOINT = "https://commons.wikimedia.org/wiki/Special:FilePath/"
+# Ширины, которые мы запрашиваем у Commons: произвольные ?w= приводятся к ближайшей большей,
+# чтобы число вариантов одного файла в кэше было ограничено
+THUMB_WIDTHS = (120, 250, 330, 500, 960)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+THUMB_TIMEOUT = 10
+# Ответ больше этого размера — не миниатюра (например, исходник векторного файла)
+MAX_THUMB_BYTES = 5 * 1024 * 1024
+
+
+def snap_width(width: Optional[int]) -> int:
+    """Smallest served width not narrower than width (the largest one for wider requests)"""
+    if not width:
+        return THUMB_WIDTHS[1]
+    for allowed in THUMB_WIDTHS:
+        if allowed >= width:
+            return allowed
+    return THUMB_WIDTHS[-1]
+
+
+def image_file_name(url: str) -> Optional[str]:
+    """Commons file name of an image URL built by _get_entity_details"""
+    if not url.startswith(FILE_PATH_ENDPOINT):
+        return None
+    return unquote(url[len(FILE_PATH_ENDPOINT):]).replace(" ", "_")
+
+
+def thumbnail_url(file_name: str, width: int) -> str:
+    """Direct Commons URL of a sized thumbnail, for clients when the proxy can't fetch it"""
+    return f"{FILE_PATH_ENDPOINT}{quote(file_name)}?width={width}"
+
+
+class ThumbnailCache:
+    """Size-bounded LRU of image thumbnails on local disk.
+
+    Image bytes are kept in files named by the hash of the key, the index
+    (content type, size, ETag, access time) in SQLite next to them, so all
+    worker processes on the host share one cache. Files are written to a
+    temporary name and renamed, so readers never see a partial image.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails ("
+            " key TEXT PRIMARY KEY,"
+            " file TEXT NOT NULL,"
+            " content_type TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " etag TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._connect().execute("CREATE INDEX IF NOT EXISTS thumbnails_accessed_at ON thumbnails (accessed_at)")
+        # Суммарный размер миниатюр ведут триггеры, чтобы не считать SUM(size) при каждой записи
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails_size ("
+            " id INTEGER PRIMARY KEY CHECK (id = 0),"
+            " total INTEGER NOT NULL)"
+        )
+        self._connect().execute(
+            "CREATE TRIGGER IF NOT EXISTS thumbnails_size_insert AFTER INSERT ON thumbnails"
+            " BEGIN UPDATE thumbnails_size SET total = total + NEW.size; END"
+        )
+        self._connect().execute(
+            "CREATE TRIGGER IF NOT EXISTS thumbnails_size_update AFTER UPDATE OF size ON thumbnails"
+            " BEGIN UPDATE thumbnails_size SET total = total + NEW.size - OLD.size; END"
+        )
+        self._connect().execute(
+            "CREATE TRIGGER IF NOT EXISTS thumbnails_size_delete AFTER DELETE ON thumbnails"
+            " BEGIN UPDATE thumbnails_size SET total = total - OLD.size; END"
+        )
+        self._connect().execute(
+            "INSERT OR IGNORE INTO thumbnails_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM thumbnails"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение создаётся отдельно для каждого потока и процесса (после fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _path(self, file: str) -> str:
+        return os.path.join(self.directory, file[:2], file)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached thumbnail as {"content", "content_type", "etag", "created_at"}, or None"""
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT file, content_type, etag, created_at, accessed_at FROM thumbnails WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            file, content_type, etag, created_at, accessed_at = row
+            with open(self._path(file), "rb") as f:
+                content = f.read()
+            now = time.time()
+            if accessed_at + TOUCH_INTERVAL < now:
+                conn.execute("UPDATE thumbnails SET accessed_at = ? WHERE key = ?", (now, key))
+        except FileNotFoundError:
+            # Файл удалён соседним воркером при вытеснении
+            return None
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Error reading thumbnail %s from %s: %s", key, self.directory, e)
+            return None
+        return {"content": content, "content_type": content_type, "etag": etag, "created_at": created_at}
+
+    def put(self, key: str, content: bytes, content_type: str) -> Dict:
+        now = time.time()
+        file = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        etag = hashlib.sha1(content).hexdigest()[:20]
+        entry = {"content": content, "content_type": content_type, "etag": etag, "created_at": now}
+        path = self._path(file)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO thumbnails (key, file, content_type, size, etag, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET file = excluded.file, content_type = excluded.content_type,"
+                " size = excluded.size, etag = excluded.etag, created_at = excluded.created_at,"
+                " accessed_at = excluded.accessed_at",
+                (key, file, content_type, len(content), etag, now, now)
+            )
+            self._evict(conn)
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Error writing thumbnail %s to %s: %s", key, self.directory, e)
+        return entry
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT total FROM thumbnails_size").fetchone()[0]
+        while total > self.max_bytes:
+            # Удаляем давно не запрашивавшиеся миниатюры
+            rows = conn.execute(
+                "SELECT key, file, size FROM thumbnails ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, file, size in rows:
+                conn.execute("DELETE FROM thumbnails WHERE key = ?", (key,))
+                try:
+                    os.remove(self._path(file))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self) -> None:
+        conn = self._connect()
+        for (file,) in conn.execute("SELECT file FROM thumbnails").fetchall():
+            try:
+                os.remove(self._path(file))
+            except FileNotFoundError:
+                pass
+        conn.execute("DELETE FROM thumbnails")
+
+    def stats(self) -> Dict:
+        try:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM thumbnails"
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Error reading thumbnail cache stats %s: %s", self.directory, e)
+            return {}
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+
+class ThumbnailProxy:
+    """Sized thumbnails of Commons images, fetched once and served from a ThumbnailCache"""
+
+    def __init__(self, cache: ThumbnailCache, http, endpoint: str = FILE_PATH_ENDPOINT, offline: bool = False):
+        self.cache = cache
+        self.http = http
+        self.endpoint = endpoint
+        self.offline = offline
+        self.inflight = SingleFlight()
+
+    def get(self, file_name: str, width: int) -> Optional[Dict]:
+        """Thumbnail of file_name at width, or None if it can't be fetched now"""
+        key = f"{file_name}|{width}"
+        entry = self.cache.get(key)
+        if entry is not None:
+            record_upstream_call(self.endpoint, "thumbnail", 0, "hit", 0, 0.0)
+            return entry
+        if self.offline:
+            return None
+        # Одновременные запросы одной миниатюры в воркере ждут одну загрузку
+        return self.inflight.do(key, lambda: self._fetch(key, file_name, width))
+
+    def _fetch(self, key: str, file_name: str, width: int) -> Optional[Dict]:
+        started = time.perf_counter()
+        size = 0
+        outcome = "miss"
+        breaker = circuit_breaker(self.endpoint)
+        probe = False
+        try:
+            probe = breaker.check()
+            logger.info("Fetching thumbnail %s at %spx", file_name, width)
+            response = self.http.get(
+                self.endpoint + quote(file_name),
+                params={"width": width},
+                headers={"Accept": "image/*"},
+                timeout=upstream_timeout(THUMB_TIMEOUT)
+            )
+            size = len(response.content)
+            response.raise_for_status()
+            breaker.record_success()
+        except CircuitOpenError as e:
+            logger.warning("Skipping thumbnail request: %s", e)
+            outcome = "rejected"
+            return None
+        except requests.RequestException as e:
+            logger.error("Error fetching thumbnail %s: %s", file_name, e)
+            error_response = getattr(e, "response", None)
+            if is_upstream_failure(error_response.status_code if error_response is not None else None):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return None
+        finally:
+            # Проба, прерванная непредвиденным исключением, снова размыкает цепь
+            if probe:
+                breaker.abandon_probe()
+            record_upstream_call(self.endpoint, "thumbnail", 0, outcome, size, time.perf_counter() - started)
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        if not content_type.startswith("image/") or size > MAX_THUMB_BYTES:
+            logger.warning("Not caching thumbnail %s: %s, %s bytes", file_name, content_type, size)
+            return None
+        return self.cache.put(key, response.content, content_type)
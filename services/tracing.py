@@ -0,0 +1,178 @@
+import bisect
+import json
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Границы корзин гистограмм длительности (в секундах)
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Исход обращения к Wikidata: ответ из кэша, запрос в сеть,
+# ожидание такого же запроса в этом воркере или в соседнем,
+# истёкший ответ с обновлением в фоне, отказ без запроса (цепь разомкнута или бюджет исчерпан),
+# ответ из локального среза дампа
+CACHE_OUTCOMES = ("hit", "miss", "coalesced", "peer", "stale", "rejected", "offline")
+
+
+class UpstreamCall:
+    __slots__ = ("endpoint", "action", "ids", "cache", "bytes", "duration")
+
+    def __init__(self, endpoint: str, action: str, ids: int, cache: str, bytes: int, duration: float):
+        self.endpoint = endpoint
+        self.action = action
+        self.ids = ids
+        self.cache = cache
+        self.bytes = bytes
+        self.duration = duration
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RequestTrace:
+    """Upstream calls made while serving one incoming request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.calls: List[UpstreamCall] = []
+        self._lock = threading.Lock()
+
+    def add(self, call: UpstreamCall) -> None:
+        with self._lock:
+            self.calls.append(call)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def by_action(self) -> Dict[str, Dict]:
+        """Per-action totals: number of calls, cache hits, bytes and summed latency"""
+        summary: Dict[str, Dict] = {}
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            entry = summary.setdefault(call.action, {"calls": 0, "hits": 0, "bytes": 0, "duration": 0.0})
+            entry["calls"] += 1
+            entry["hits"] += call.cache not in ("miss", "rejected")
+            entry["bytes"] += call.bytes
+            entry["duration"] += call.duration
+        return summary
+
+    def server_timing(self) -> str:
+        """Value of the Server-Timing header: one metric per action plus the total"""
+        metrics = []
+        for action, entry in self.by_action().items():
+            metrics.append(
+                f'{action};dur={entry["duration"] * 1000:.1f};'
+                f'desc="{entry["calls"]} calls, {entry["hits"]} cached, {entry["bytes"]} B"'
+            )
+        metrics.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+# Трассировка текущего входящего запроса; вне запроса (фоновые потоки) — None
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+def describe_params(params_str: str) -> Tuple[str, int]:
+    """Return the API action and the number of entity ids of a request"""
+    params = json.loads(params_str)
+    if "ids" in params:
+        return params.get("action", "unknown"), len(params["ids"].split("|"))
+    return params.get("action", "unknown"), int("entity" in params)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """Process-wide counters and histograms exported in the Prometheus text format.
+
+    Values are kept per process: with several gunicorn workers each scrape
+    sees one worker, so scrape every worker or aggregate by instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._upstream: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self._upstream_bytes: Dict[str, int] = defaultdict(int)
+        self._upstream_ids: Dict[str, int] = defaultdict(int)
+        self._requests: Dict[Tuple[str, int], Histogram] = defaultdict(Histogram)
+        self._request_calls: Dict[str, int] = defaultdict(int)
+
+    def record_upstream(self, call: UpstreamCall) -> None:
+        with self._lock:
+            self._upstream[(call.action, call.cache)].observe(call.duration)
+            self._upstream_bytes[call.action] += call.bytes
+            self._upstream_ids[call.action] += call.ids
+
+    def record_request(self, endpoint: str, status: int, duration: float, upstream_calls: int) -> None:
+        with self._lock:
+            self._requests[(endpoint, status)].observe(duration)
+            self._request_calls[endpoint] += upstream_calls
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        lines = []
+        with self._lock:
+            lines.append("# HELP whoami_upstream_request_duration_seconds Wikidata API calls by action and cache outcome")
+            lines.append("# TYPE whoami_upstream_request_duration_seconds histogram")
+            for (action, cache), histogram in sorted(self._upstream.items()):
+                lines.extend(histogram.render("whoami_upstream_request_duration_seconds",
+                                              f'action="{action}",cache="{cache}"'))
+            lines.append("# HELP whoami_upstream_response_bytes_total Bytes received from Wikidata by action")
+            lines.append("# TYPE whoami_upstream_response_bytes_total counter")
+            for action, value in sorted(self._upstream_bytes.items()):
+                lines.append(f'whoami_upstream_response_bytes_total{{action="{action}"}} {value}')
+            lines.append("# HELP whoami_upstream_ids_total Entity ids requested from Wikidata by action")
+            lines.append("# TYPE whoami_upstream_ids_total counter")
+            for action, value in sorted(self._upstream_ids.items()):
+                lines.append(f'whoami_upstream_ids_total{{action="{action}"}} {value}')
+            lines.append("# HELP whoami_http_request_duration_seconds Incoming requests by endpoint and status")
+            lines.append("# TYPE whoami_http_request_duration_seconds histogram")
+            for (endpoint, status), histogram in sorted(self._requests.items()):
+                lines.extend(histogram.render("whoami_http_request_duration_seconds",
+                                              f'endpoint="{endpoint}",status="{status}"'))
+            lines.append("# HELP whoami_http_upstream_calls_total Wikidata calls made while serving each endpoint")
+            lines.append("# TYPE whoami_http_upstream_calls_total counter")
+            for endpoint, value in sorted(self._request_calls.items()):
+                lines.append(f'whoami_http_upstream_calls_total{{endpoint="{endpoint}"}} {value}')
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def record_upstream_call(endpoint: str, action: str, ids: int, cache: str,
+                         bytes: int, duration: float) -> None:
+    """Record an upstream call in the process metrics and in the current request trace"""
+    call = UpstreamCall(endpoint, action, ids, cache, bytes, duration)
+    metrics.record_upstream(call)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(call)
@@ -0,0 +1,133 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from services.wikipedia_service import WikipediaHelper
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних байт лога просматривать в поисках популярных запросов
+LOG_TAIL_BYTES = 20 * 1024 * 1024
+DEFAULT_WARMUP_WORKERS = 8
+
+SEARCH_LOG_PATTERN = re.compile(r"Search request - query: '(.*?)', entity_id: '(.*?)'")
+
+
+def mine_top_queries(log_path: str, limit: int) -> Tuple[List[str], List[str]]:
+    """Most frequent search queries and entity ids from the tail of app.log"""
+    queries, entity_ids = Counter(), Counter()
+    try:
+        with open(log_path, "rb") as f:
+            f.seek(max(0, os.path.getsize(log_path) - LOG_TAIL_BYTES))
+            for line in f:
+                match = SEARCH_LOG_PATTERN.search(line.decode("utf-8", errors="replace"))
+                if match is None:
+                    continue
+                query, entity_id = match.groups()
+                if entity_id:
+                    entity_ids[entity_id] += 1
+                elif query:
+                    queries[query] += 1
+    except OSError as e:
+        logger.warning("Cannot mine queries from %s: %s", log_path, e)
+    return ([query for query, _ in queries.most_common(limit)],
+            [entity_id for entity_id, _ in entity_ids.most_common(limit)])
+
+
+def read_query_list(path: str) -> List[str]:
+    """One query per line; empty lines and lines starting with # are skipped"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    except OSError as e:
+        logger.warning("Cannot read warm-up queries from %s: %s", path, e)
+        return []
+
+
+class Warmup:
+    """Preload entity pages and search results into the shared caches.
+
+    Entity ids go through get_entity_by_id and queries through
+    get_wikipedia_info, so the responses, their label lookups and the
+    built pages land in the response cache and the entity store. Items
+    are fetched in parallel; status() reports progress for readiness
+    checks.
+    """
+
+    def __init__(self, helper: WikipediaHelper, entity_ids: List[str], queries: List[str],
+                 workers: int = DEFAULT_WARMUP_WORKERS):
+        self.helper = helper
+        self.entity_ids = list(dict.fromkeys(entity_ids))
+        self.queries = list(dict.fromkeys(queries))
+        self.workers = workers
+        self.done = 0
+        self.failed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def total(self) -> int:
+        return len(self.entity_ids) + len(self.queries)
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    def start(self) -> None:
+        """Run the warm-up in a background thread (once)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the warm-up has finished; start it here if nobody did"""
+        if self._thread is None and not self.ready:
+            self.run()
+        return self._finished.wait(timeout)
+
+    def run(self) -> None:
+        self.started_at = time.time()
+        logger.info("Warming up %s entities and %s queries", len(self.entity_ids), len(self.queries))
+        tasks = [(self.helper.get_entity_by_id, entity_id) for entity_id in self.entity_ids]
+        tasks += [(self.helper.get_wikipedia_info, query) for query in self.queries]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="warmup") as executor:
+            for _ in executor.map(self._warm, tasks):
+                pass
+        self.finished_at = time.time()
+        self._finished.set()
+        logger.info("Warm-up finished in %.1f s: %s items, %s failed",
+                    self.finished_at - self.started_at, self.done, self.failed)
+
+    def _warm(self, task) -> None:
+        fetch, key = task
+        try:
+            result = fetch(key)
+            ok = bool(result) and result.get("status") != "error"
+        except Exception as e:
+            logger.warning("Warm-up of '%s' failed: %s", key, e)
+            ok = False
+        with self._lock:
+            self.done += 1
+            self.failed += not ok
+
+    def status(self) -> Dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "ready": self.ready,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "elapsed": elapsed
+        }
@@ -1,60 +1,341 @@
 import requests
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Iterator, Optional
 import time
-from functools import lru_cache
 import json
-import random
+import re
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+
+from services.cache import CacheBackend, MemoryCache
+from services.candidate_index import CandidateIndex
+from services.compact import compact_response
+from services.dump_store import DumpStore
+from services.entity_store import EntityStore
+from services.http_client import DEFAULT_USER_AGENT, PooledSession
+from services.logging_setup import log_response_body
+from services.resilience import (CircuitOpenError, circuit_breaker, is_upstream_failure, revalidator,
+                                 upstream_timeout)
+from services.singleflight import SingleFlight
+from services.suggest_index import DEFAULT_SUGGEST_LIMIT, SuggestIndex
+from services.tracing import describe_params, record_upstream_call
 
-# Настраиваем логирование
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+WIKIDATA_ENDPOINT = "https://www.wikidata.org/w/api.php"
+SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
+
+# wbgetentities принимает не более 50 идентификаторов за один вызов
+WBGETENTITIES_MAX_IDS = 50
+# Сколько пачек или поисков по имени пакетный запрос выполняет одновременно
+BATCH_WORKERS = 4
+
+QID_PATTERN = re.compile(r"Q\d+")
+# По сколько результатов поиска классифицировать за один запрос при потоковой выдаче
+STREAM_CHUNK_SIZE = 5
+
+FICTIONAL_TYPES = ["Q15632617", "Q15632618", "Q95074", "Q4167410"]
+
+# Время жизни закэшированных ответов (в секундах) для каждого действия API
+DEFAULT_CACHE_TTLS = {
+    "wbsearchentities": 6 * 60 * 60,
+    "wbgetclaims": 24 * 60 * 60,
+    "wbgetentities": 24 * 60 * 60,
+    "default": 60 * 60,
+}
+# Ошибки кэшируем ненадолго, чтобы не долбить упавший API, но и не хранить их вечно
+NEGATIVE_CACHE_TTL = 30
+
+# Сколько кандидатов для случайного выбора выгружать из SPARQL за одно обновление
+CANDIDATES_LIMIT = 20000
+# Случайная выборка элементов класса берётся с запасом: не у всех есть метка на нужном языке
+CANDIDATES_SAMPLE_FACTOR = 5
+CANDIDATES_SPARQL_TIMEOUT = 60
+
+# Сколько другие воркеры ждут результата запроса, который уже выполняет воркер-владелец
+LEASE_TTL = 15
+LEASE_POLL_INTERVAL = 0.05
+
+# Таймауты одного обращения к API и к SPARQL (в секундах); внутри запроса их урезает бюджет
+REQUEST_TIMEOUT = 5
+SPARQL_TIMEOUT = 10
+
+# Свойства, метки значений которых показываются на странице персонажа.
+# True означает, что используется только первое значение.
+LABEL_PROPERTIES = {
+    "P106": False,  # occupation
+    "P737": False,  # known for
+    "P27": False,   # nationality
+    "P21": True,    # gender
+    "P19": True,    # place of birth
+    "P20": True,    # place of death
+    "P1412": False, # languages spoken
+    "P166": False,  # awards
+}
+
+# Свойства, которые читаются из утверждений; остальные в кэш не попадают
+USED_PROPERTIES = ("P31", *LABEL_PROPERTIES, "P569", "P570", "P18")
+
+def _instance_of(claims: Dict) -> List[str]:
+    return [claim["mainsnak"]["datavalue"]["value"]["id"]
+            for claim in claims.get("P31", [])
+            if "datavalue" in claim["mainsnak"]]
+
+
+def classify_entity(entity_data: Dict) -> str:
+    """Classify a wbgetentities payload as real, fictional or other by its P31 (instance of) claims"""
+    # Q5 = human
+    # Q15632617 = fictional human
+    # Q15632618 = fictional character
+    # Q95074 = fictional character
+    # Q4167410 = fictional character
+    # Другие утверждения не учитываются: P179/P1441/P1191 есть и у фильмов, книг и эпизодов
+    instance_of = _instance_of(entity_data.get("claims", {}))
+
+    if "Q5" in instance_of:
+        return "real"
+    elif any(q in instance_of for q in FICTIONAL_TYPES):
+        return "fictional"
+    return "other"
+
+
 class WikipediaHelper:
-    def __init__(self, lang: str = "ru"):
+    def __init__(self, lang: str = "ru", languages: Optional[List[str]] = None,
+                 cache: Optional[CacheBackend] = None,
+                 cache_ttls: Optional[Dict[str, float]] = None,
+                 negative_cache_ttl: float = NEGATIVE_CACHE_TTL,
+                 http: Optional[PooledSession] = None, user_agent: str = DEFAULT_USER_AGENT,
+                 candidates_path: Optional[str] = None, candidates_limit: int = CANDIDATES_LIMIT,
+                 candidates: Optional[CandidateIndex] = None,
+                 inflight: Optional[SingleFlight] = None,
+                 suggestions: Optional[SuggestIndex] = None,
+                 entity_store: Optional[EntityStore] = None,
+                 offline: Optional[DumpStore] = None,
+                 wikidata_endpoint: str = WIKIDATA_ENDPOINT, sparql_endpoint: str = SPARQL_ENDPOINT):
         self.lang = lang
-        self.wikidata_endpoint = "https://www.wikidata.org/w/api.php"
+        # Все обслуживаемые языки: данные сущностей запрашиваются сразу для них,
+        # так что ответ wbgetentities один и тот же у помощников разных языков
+        self.languages = sorted(set(languages or []) | {lang})
+        self.wikidata_endpoint = wikidata_endpoint
         self.wikipedia_endpoint = f"https://{lang}.wikipedia.org/w/api.php"
-        self.sparql_endpoint = "https://query.wikidata.org/sparql"
-        
-    @lru_cache(maxsize=1000)
+        self.sparql_endpoint = sparql_endpoint
+        self.cache = cache if cache is not None else MemoryCache()
+        self.cache_ttls = dict(DEFAULT_CACHE_TTLS, **(cache_ttls or {}))
+        self.negative_cache_ttl = negative_cache_ttl
+        self.inflight = inflight if inflight is not None else SingleFlight()
+        # Пул keep-alive соединений к www.wikidata.org и query.wikidata.org
+        self.http = http if http is not None else PooledSession(user_agent=user_agent)
+        # Готовые страницы персонажей, переживают перезапуск и вытеснение из кэша ответов
+        self.entity_store = entity_store
+        # Локальный срез дампа Wikidata: если задан, API и SPARQL не вызываются вовсе
+        self.offline = offline
+        # Префиксный индекс меток для подсказок; пополняется результатами поиска и кандидатами
+        self.suggestions = suggestions if suggestions is not None else SuggestIndex()
+        # Локальный индекс кандидатов для случайного выбора; SPARQL нужен только для его обновления
+        self.candidates_limit = candidates_limit
+        if candidates is None:
+            candidates = CandidateIndex(self._load_candidates, path=candidates_path,
+                                        on_update=self._index_candidates)
+        self.candidates = candidates
+
+    def _cache_ttl(self, params: Dict, result: Dict) -> float:
+        """Choose how long a response may be cached"""
+        if "error" in result:
+            return self.negative_cache_ttl
+        return self.cache_ttls.get(params.get("action"), self.cache_ttls["default"])
+
+    def cache_stats(self) -> Dict:
+        """Return hit/miss counters of the response cache"""
+        return self.cache.stats()
+
     def _make_request(self, endpoint: str, params_str: str) -> Dict:
         """Make a cached request to the API endpoint"""
+        if self.offline is not None:
+            return self._offline_request(endpoint, params_str)
+        cache_key = f"{endpoint}?{params_str}"
+        started = time.perf_counter()
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self._record_call(endpoint, params_str, "hit", 0, started)
+            return cached
+
+        # Истёкший ответ отдаём сразу, а обновляем в фоне
+        stale = self._stale(cache_key)
+        if stale is not None:
+            self._revalidate(endpoint, params_str, cache_key)
+            self._record_call(endpoint, params_str, "stale", 0, started)
+            return stale
+
+        leader = False
+
+        def fetch() -> Dict:
+            nonlocal leader
+            leader = True
+            return self._fetch_shared(endpoint, params_str, cache_key)
+
+        # Одинаковые одновременные запросы внутри воркера выполняются один раз
+        result = self.inflight.do(cache_key, fetch)
+        if not leader:
+            self._record_call(endpoint, params_str, "coalesced", 0, started)
+        return result
+
+    def _offline_request(self, endpoint: str, params_str: str) -> Dict:
+        """Answer from the local dump subset; it is fast and fixed, so the response cache is skipped"""
+        started = time.perf_counter()
+        result = self.offline.respond(json.loads(params_str))
+        self._record_call(endpoint, params_str, "offline", 0, started)
+        return result
+
+    def _record_call(self, endpoint: str, params_str: str, cache: str, size: int, started: float) -> None:
+        action, ids = describe_params(params_str)
+        record_upstream_call(endpoint, action, ids, cache, size, time.perf_counter() - started)
+
+    def _stale(self, cache_key: str) -> Optional[Dict]:
+        """An expired but still servable response; expired errors are never served"""
+        stale = self.cache.peek_stale(cache_key)
+        return stale if stale is not None and "error" not in stale else None
+
+    def _revalidate(self, endpoint: str, params_str: str, cache_key: str) -> None:
+        revalidator.submit(cache_key, lambda: self._refresh_stale(endpoint, params_str, cache_key))
+
+    def _refresh_stale(self, endpoint: str, params_str: str, cache_key: str) -> None:
+        """Refetch an expired response in a background thread, once across workers"""
+        if not self.cache.acquire_lease(cache_key, LEASE_TTL):
+            return
+        try:
+            # Синхронная реализация вызывается явно, так что обновление работает
+            # и для асинхронного помощника, чей event loop к этому моменту завершён
+            result = WikipediaHelper._fetch(self, endpoint, params_str, cache_key)
+            if "error" in result:
+                logger.warning("Keeping stale response for %s: %s", cache_key, result["error"])
+        finally:
+            self.cache.release_lease(cache_key)
+
+    def _fetch_shared(self, endpoint: str, params_str: str, cache_key: str) -> Dict:
+        """Fetch a response once across workers, using a lease in the shared cache"""
+        leased = self.cache.acquire_lease(cache_key, LEASE_TTL)
+        if not leased:
+            started = time.perf_counter()
+            result = self._wait_for_peer(cache_key)
+            if result is not None:
+                self._record_call(endpoint, params_str, "peer", 0, started)
+                return result
+        try:
+            return self._fetch(endpoint, params_str, cache_key)
+        finally:
+            if leased:
+                self.cache.release_lease(cache_key)
+
+    def _wait_for_peer(self, cache_key: str) -> Optional[Dict]:
+        """Wait for another worker holding the lease to store the response"""
+        deadline = time.monotonic() + upstream_timeout(LEASE_TTL)
+        while time.monotonic() < deadline:
+            result = self.cache.peek(cache_key)
+            if result is not None or not self.cache.lease_active(cache_key):
+                return result
+            time.sleep(LEASE_POLL_INTERVAL)
+        return None
+
+    def _fetch(self, endpoint: str, params_str: str, cache_key: str) -> Dict:
+        """Send the request and store the response in the cache"""
+        params = json.loads(params_str)
+        started = time.perf_counter()
+        size = 0
+        breaker = circuit_breaker(endpoint)
         try:
-            params = json.loads(params_str)
-            logger.info(f"Making request to {endpoint} with params: {params}")
-            response = requests.get(endpoint, params=params, timeout=5)
+            probe = breaker.check()
+        except CircuitOpenError as e:
+            # Отказ без обращения к сети не кэшируется: это не ответ Wikidata
+            logger.warning("Skipping request to %s: %s", endpoint, e)
+            self._record_call(endpoint, params_str, "rejected", 0, started)
+            return {"error": str(e)}
+        try:
+            logger.info("Making request to %s with params: %s", endpoint, params)
+            response = self.http.get(endpoint, params=params, timeout=upstream_timeout(REQUEST_TIMEOUT))
+            size = len(response.content)
             response.raise_for_status()
             result = response.json()
-            logger.info(f"Response received: {json.dumps(result, indent=2)}")
-            return result
+            log_response_body(logger, "Response received", result)
+            result = self._compact(params, result)
+            breaker.record_success()
         except requests.RequestException as e:
-            logger.error(f"Error making request: {e}")
-            return {"error": str(e)}
+            logger.error("Error making request: %s", e)
+            self._record_failure(breaker, e)
+            result = {"error": str(e)}
+        finally:
+            # Проба, прерванная непредвиденным исключением, не должна оставить цепь полуоткрытой навсегда
+            if probe:
+                breaker.abandon_probe()
+        self._record_call(endpoint, params_str, "miss", size, started)
 
-    def _make_sparql_request(self, query: str) -> Dict:
+        if "error" in result and self._stale(cache_key) is not None:
+            # Ошибка не должна вытеснять устаревший, но годный ответ
+            return result
+        self.cache.set(cache_key, result, self._cache_ttl(params, result))
+        return result
+
+    def _record_failure(self, breaker, error: Exception) -> None:
+        response = getattr(error, "response", None)
+        if is_upstream_failure(response.status_code if response is not None else None):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def _compact(self, params: Dict, result: Dict) -> Dict:
+        """Drop the parts of a response that are never read before caching it"""
+        return compact_response(params.get("action"), result, USED_PROPERTIES, self.languages)
+
+    def _make_sparql_request(self, query: str, timeout: float = SPARQL_TIMEOUT) -> Dict:
         """Make a request to the SPARQL endpoint"""
+        started = time.perf_counter()
+        size = 0
+        outcome = "miss"
+        breaker = circuit_breaker(self.sparql_endpoint)
+        probe = False
         try:
-            logger.info(f"Making SPARQL request: {query}")
-            response = requests.get(
+            probe = breaker.check()
+            logger.info("Making SPARQL request: %s", query)
+            response = self.http.get(
                 self.sparql_endpoint,
                 params={"format": "json", "query": query},
-                timeout=10
+                timeout=upstream_timeout(timeout)
             )
+            size = len(response.content)
             response.raise_for_status()
             result = response.json()
-            logger.info(f"SPARQL response received: {json.dumps(result, indent=2)}")
+            log_response_body(logger, "SPARQL response received", result)
+            breaker.record_success()
             return result
+        except CircuitOpenError as e:
+            logger.warning("Skipping SPARQL request: %s", e)
+            outcome = "rejected"
+            return {"error": str(e)}
         except requests.RequestException as e:
-            logger.error(f"Error making SPARQL request: {e}")
+            logger.error("Error making SPARQL request: %s", e)
+            self._record_failure(breaker, e)
             return {"error": str(e)}
+        finally:
+            if probe:
+                breaker.abandon_probe()
+            record_upstream_call(self.sparql_endpoint, "sparql", 0, outcome, size, time.perf_counter() - started)
 
     def search(self, query: str) -> List[Dict]:
         """Search for entities using Wikidata"""
         if not query or not query.strip():
             logger.warning("Empty search query")
             return []
-            
+
+        results = self._make_request(self.wikidata_endpoint, self._search_params(query))
+        hit_ids = self._search_hit_ids(query, results)
+        if not hit_ids:
+            return []
+
+        # Классифицируем все найденные сущности пакетно, а не по одной
+        entity_types = self._get_entity_types(hit_ids)
+        return self._build_search_results(query, results, entity_types)
+
+    def _search_params(self, query: str) -> str:
+        """Build the cache key/params string for a wbsearchentities call"""
         search_params = {
             "action": "wbsearchentities",
             "format": "json",
@@ -63,85 +344,173 @@ class WikipediaHelper:
             "type": "item",
             "limit": 20  # Increase limit to get more results
         }
-        
-        results = self._make_request(self.wikidata_endpoint, json.dumps(search_params, sort_keys=True))
-        valid_results = []
-        
+        return json.dumps(search_params, sort_keys=True)
+
+    def _search_hit_ids(self, query: str, results: Dict) -> List[str]:
+        """Extract entity ids from a wbsearchentities response"""
         if "error" in results:
-            logger.error(f"Error in search results: {results['error']}")
-            return valid_results
-            
+            logger.error("Error in search results: %s", results['error'])
+            return []
+
         if "search" not in results:
-            logger.warning(f"No search results found for query: {query}")
-            return valid_results
+            logger.warning("No search results found for query: %s", query)
+            return []
+
+        return [item["id"] for item in results["search"]]
 
-        for item in results["search"]:
+    def _build_search_results(self, query: str, results: Dict, entity_types: Dict[str, str]) -> List[Dict]:
+        """Keep real and fictional hits of a wbsearchentities response"""
+        valid_results = []
+
+        for item in results.get("search", []):
             try:
-                entity_type = self._get_entity_type(item["id"])
+                entity_type = entity_types.get(item["id"], "other")
                 if entity_type in ["fictional", "real"]:
-                    # Ensure all required fields are present
-                    name = item.get("label", "Без имени")
-                    description = item.get("description", "")
-                    
-                    valid_results.append({
-                        "id": item["id"],
-                        "name": name,
-                        "type": entity_type,
-                        "description": description,
-                        "url": f"https://www.wikidata.org/wiki/{item['id']}"
-                    })
+                    valid_results.append(self._search_result(item, entity_type))
             except Exception as e:
-                logger.error(f"Error processing search result {item.get('id', 'unknown')}: {e}")
+                logger.error("Error processing search result %s: %s", item.get('id', 'unknown'), e)
                 continue
 
-        logger.info(f"Found {len(valid_results)} valid results for query: {query}")
+        logger.info("Found %s valid results for query: %s", len(valid_results), query)
+        self.suggestions.add_many(
+            (r["id"], r["name"], r["type"], r["description"], ()) for r in valid_results
+        )
         return valid_results
 
-    def _get_entity_type(self, entity_id: str) -> str:
-        """Determine if entity is fictional or real person"""
+    def _search_result(self, item: Dict, entity_type: str) -> Dict:
+        # Ensure all required fields are present
+        return {
+            "id": item["id"],
+            "name": item.get("label", "Без имени"),
+            "type": entity_type,
+            "description": item.get("description", ""),
+            "url": f"https://www.wikidata.org/wiki/{item['id']}"
+        }
+
+    def search_stream(self, query: str, max_workers: int = BATCH_WORKERS) -> Iterator[Dict]:
+        """Yield real and fictional search hits as soon as each one is classified.
+
+        Hits whose type is already known locally are yielded right after the
+        wbsearchentities call; the rest are classified in small chunks
+        fetched in parallel and yielded as chunks complete. Every result
+        carries its "rank" in the search response.
+        """
+        if not query or not query.strip():
+            logger.warning("Empty search query")
+            return
+
+        results = self._make_request(self.wikidata_endpoint, self._search_params(query))
+        hits = self._stream_hits(query, results)
+        if not hits:
+            return
+
+        known = self._known_types(list(hits))
+        yield from self._stream_results(hits, known)
+        pending = self._chunk_ids([entity_id for entity_id in hits if entity_id not in known], STREAM_CHUNK_SIZE)
+        if not pending:
+            return
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search-stream") as executor:
+            futures = [executor.submit(copy_context().run, self._get_entity_types, chunk) for chunk in pending]
+            for future in as_completed(futures):
+                yield from self._stream_results(hits, future.result())
+
+    def _stream_hits(self, query: str, results: Dict) -> Dict[str, tuple]:
+        """Map hit id -> (rank, search item), keeping the first occurrence of each id"""
+        hits = {}
+        if self._search_hit_ids(query, results):
+            for rank, item in enumerate(results["search"]):
+                hits.setdefault(item["id"], (rank, item))
+        return hits
+
+    def _known_types(self, entity_ids: List[str]) -> Dict[str, str]:
+        """Types available without a request: cached claims of the whole page of hits, or the suggestion index"""
+        if len(entity_ids) <= WBGETENTITIES_MAX_IDS:
+            cached = self.cache.peek(f"{self.wikidata_endpoint}?{self._entity_types_params(entity_ids)}")
+            if cached is not None and "error" not in cached:
+                return self._parse_entity_types(entity_ids, cached)
+        return self.suggestions.types(entity_ids)
+
+    def _stream_results(self, hits: Dict[str, tuple], entity_types: Dict[str, str]) -> List[Dict]:
+        streamed = []
+        for entity_id, entity_type in entity_types.items():
+            if entity_type not in ("fictional", "real"):
+                continue
+            rank, item = hits[entity_id]
+            streamed.append({**self._search_result(item, entity_type), "rank": rank})
+        self.suggestions.add_many(
+            (r["id"], r["name"], r["type"], r["description"], ()) for r in streamed
+        )
+        return streamed
+
+    def suggest(self, query: str, limit: int = DEFAULT_SUGGEST_LIMIT) -> List[Dict]:
+        """Autocomplete suggestions from the local index, or from one wbsearchentities call"""
+        suggestions = self.suggestions.lookup(query, limit)
+        if suggestions or not query.strip():
+            return suggestions
+        results = self._make_request(self.wikidata_endpoint, self._search_params(query.strip()))
+        return self._suggestions_from_search(query, results, limit)
+
+    def _suggestions_from_search(self, query: str, results: Dict, limit: int) -> List[Dict]:
+        """Index wbsearchentities hits without classifying them and answer from the index"""
+        self.suggestions.add_many(
+            (item["id"], item.get("label", ""), None, item.get("description", ""), item.get("aliases", ()))
+            for item in results.get("search", [])
+        )
+        return self.suggestions.lookup(query, limit)
+
+    def _index_candidates(self, type: str, entities: List[Dict]) -> None:
+        self.suggestions.add_many((e["id"], e["name"], type, "", ()) for e in entities)
+
+    def _get_entity_types(self, entity_ids: List[str]) -> Dict[str, str]:
+        """Determine types for many entities using batched wbgetentities calls"""
+        entity_types = {}
+        for chunk in self._chunk_ids(entity_ids):
+            result = self._make_request(self.wikidata_endpoint, self._entity_types_params(chunk))
+            entity_types.update(self._parse_entity_types(chunk, result))
+        return entity_types
+
+    def _chunk_ids(self, entity_ids: List[str], size: int = WBGETENTITIES_MAX_IDS) -> List[List[str]]:
+        """Deduplicate ids and split them into wbgetentities-sized chunks"""
+        # Убираем дубликаты, сохраняя порядок
+        entity_ids = list(dict.fromkeys(entity_ids))
+        return [entity_ids[i:i + size] for i in range(0, len(entity_ids), size)]
+
+    def _entity_types_params(self, chunk: List[str]) -> str:
+        """Build the params string for a batched claims lookup"""
         params = {
-            "action": "wbgetclaims",
+            "action": "wbgetentities",
             "format": "json",
-            "entity": entity_id,
-            "property": "P31"  # instance of
+            "ids": "|".join(chunk),
+            "props": "claims"
         }
-        
-        claims = self._make_request(self.wikidata_endpoint, json.dumps(params, sort_keys=True))
-        
-        if "error" in claims:
-            logger.error(f"Error getting claims for entity {entity_id}: {claims['error']}")
-            return "other"
+        return json.dumps(params, sort_keys=True)
 
-        if "claims" not in claims or "P31" not in claims["claims"]:
-            logger.warning(f"No claims found for entity {entity_id}")
-            return "other"
-            
-        # Q5 = human
-        # Q15632617 = fictional human
-        # Q15632618 = fictional character
-        # Q95074 = fictional character
-        # Q4167410 = fictional character
-        instance_of = [claim["mainsnak"]["datavalue"]["value"]["id"] 
-                      for claim in claims["claims"]["P31"]]
-        
-        logger.info(f"Entity {entity_id} instance_of: {instance_of}")
-                      
-        if "Q5" in instance_of:
-            return "real"
-        elif any(q in instance_of for q in ["Q15632617", "Q15632618", "Q95074", "Q4167410"]):
-            return "fictional"
-            
-        # Check for additional properties that might indicate a fictional character
-        if "claims" in claims:
-            # P1191 = date of first performance
-            # P1441 = present in work
-            # P179 = part of the series
-            fictional_indicators = ["P1191", "P1441", "P179"]
-            for indicator in fictional_indicators:
-                if indicator in claims["claims"]:
-                    return "fictional"
-            
-            return "other"
+    def _parse_entity_types(self, chunk: List[str], result: Dict) -> Dict[str, str]:
+        """Classify every entity of a batched claims response"""
+        if "error" in result or "entities" not in result:
+            logger.error("Error getting claims for entities %s: %s", chunk, result.get('error', 'Unknown error'))
+            return {entity_id: "other" for entity_id in chunk}
+
+        return {entity_id: self._entity_type(entity_id, result["entities"].get(entity_id, {}))
+                for entity_id in chunk}
+
+    def _entity_type(self, entity_id: str, entity_data: Dict) -> str:
+        """Classify an entity from its wbgetentities payload"""
+        claims = entity_data.get("claims", {})
+        if "P31" not in claims:
+            logger.warning("No claims found for entity %s", entity_id)
+        else:
+            logger.debug("Entity %s instance_of: %s", entity_id, _instance_of(claims))
+        return classify_entity(entity_data)
+
+    def _base_entity(self, entity_id: str, entity_data: Dict) -> Dict:
+        """Entity dict for _get_entity_details, typed from the same payload"""
+        return {
+            "id": entity_id,
+            "name": "",  # Будет заполнено из ответа API
+            "type": self._entity_type(entity_id, entity_data),
+            "description": ""
+        }
 
     def get_wikipedia_info(self, query: str) -> Dict:
         """Get detailed information about an entity"""
@@ -156,7 +525,7 @@ class WikipediaHelper:
         search_results = self.search(query)
 
         if not search_results:
-            logger.warning(f"No results found for query: {query}")
+            logger.warning("No results found for query: %s", query)
             return {
                 "status": "not_found",
                 "name": query,
@@ -167,7 +536,7 @@ class WikipediaHelper:
             try:
                 return self._get_entity_details(search_results[0])
             except Exception as e:
-                logger.error(f"Error getting entity details: {e}")
+                logger.error("Error getting entity details: %s", e)
                 return {
                     "status": "error",
                     "name": search_results[0].get("name", query),
@@ -226,7 +595,7 @@ class WikipediaHelper:
             return str(year)
             
         except (ValueError, IndexError) as e:
-            logger.error(f"Error formatting date {date_str}: {e}")
+            logger.error("Error formatting date %s: %s", date_str, e)
             # Try to extract just the year if possible
             try:
                 if date_str.startswith('-'):
@@ -235,28 +604,191 @@ class WikipediaHelper:
             except:
                 return None
 
-    def _get_entity_details(self, entity: Dict) -> Dict:
+    def _get_entity_details(self, entity: Dict, result: Optional[Dict] = None) -> Dict:
         """Get detailed information about a specific entity"""
+        if result is None:
+            stored = self._stored_details(entity["id"])
+            if stored is not None:
+                return stored
+            result = self._make_request(self.wikidata_endpoint, self._entity_details_params(entity["id"]))
+        entity_data = self._entity_data(entity, result)
+        if entity_data is None:
+            return self._details_error(entity)
+
+        # Собираем все упомянутые в утверждениях QID и получаем их метки за один проход
+        referenced_ids = self._collect_label_ids(entity_data.get("claims", {}))
+        labels = self._get_labels_map([entity_id for ids in referenced_ids.values() for entity_id in ids])
+        return self._remember_details(entity_data, self._build_entity_details(entity, entity_data, referenced_ids, labels))
+
+    def _entity_details_params(self, entity_id: str) -> str:
+        """Build the params string for a full entity fetch (ids may be joined with "|")"""
         params = {
             "action": "wbgetentities",
             "format": "json",
-            "ids": entity["id"],
-            "languages": self.lang,
-            "props": "labels|descriptions|claims|sitelinks|aliases"
+            "ids": entity_id,
+            "languages": "|".join(self.languages),
+            "props": "info|labels|descriptions|claims|sitelinks|aliases"
         }
-        
-        result = self._make_request(self.wikidata_endpoint, json.dumps(params, sort_keys=True))
-        
+        return json.dumps(params, sort_keys=True)
+
+    def _stored_details(self, entity_id: str) -> Optional[Dict]:
+        if self.entity_store is None:
+            return None
+        return self.entity_store.get(entity_id, self.lang)
+
+    def _remember_details(self, entity_data: Dict, details: Dict) -> Dict:
+        """Keep successfully built details in the entity store with their revision id"""
+        if self.entity_store is not None and details.get("status") == "ok" and "lastrevid" in entity_data:
+            self.entity_store.put(details["wikidata_id"], self.lang, details, entity_data["lastrevid"])
+        return details
+
+    def _revisions_params(self, entity_ids: List[str]) -> str:
+        return json.dumps({
+            "action": "wbgetentities",
+            "format": "json",
+            "ids": "|".join(entity_ids),
+            "props": "info"
+        }, sort_keys=True)
+
+    def get_revisions(self, entity_ids: List[str]) -> Dict[str, Optional[int]]:
+        """Current lastrevid of up to 50 entities (None for deleted ones), bypassing the cache"""
+        params_str = self._revisions_params(entity_ids)
+        result = self._fetch(self.wikidata_endpoint, params_str, f"{self.wikidata_endpoint}?{params_str}")
+        return self._parse_revisions(result)
+
+    def _parse_revisions(self, result: Dict) -> Dict[str, Optional[int]]:
         if "error" in result or "entities" not in result:
-            logger.error(f"Error getting entity details for {entity['id']}: {result.get('error', 'Unknown error')}")
-            return {
-                "status": "error",
-                "name": entity["name"],
-                "summary": "Ошибка при получении данных."
-            }
-            
-        entity_data = result["entities"][entity["id"]]
-        
+            logger.error("Error getting revisions: %s", result.get("error", "Unknown error"))
+            return {}
+        return {
+            entity_id: entity_data.get("lastrevid")
+            for entity_id, entity_data in result["entities"].items()
+        }
+
+    def refresh_entities(self, entity_ids: List[str]) -> int:
+        """Rebuild stored details of up to 50 changed entities with one batched fetch"""
+        params_str = self._entity_details_params("|".join(entity_ids))
+        result = self._fetch(self.wikidata_endpoint, params_str, f"{self.wikidata_endpoint}?{params_str}")
+        entities = self._chunk_entities(entity_ids, result)
+        self._chunk_details(entities, self._get_labels_map(self._chunk_label_ids(entities)))
+        return len(entities)
+
+    def get_entities_by_ids(self, items: List[str], max_workers: int = BATCH_WORKERS) -> Iterator[Dict]:
+        """Resolve QIDs or names, yielding one result per distinct input as soon as it is ready.
+
+        Entities are fetched 50 per wbgetentities call and classified from the
+        same claims, labels are resolved per chunk, and up to max_workers
+        chunks (or name searches) run concurrently.
+        """
+        entity_ids, names = self._batch_inputs(items)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch") as executor:
+            futures = [executor.submit(copy_context().run, self._resolve_name, name) for name in names]
+            for future in as_completed(futures):
+                name, entity_id = future.result()
+                if entity_id is None:
+                    yield self._batch_not_found(name)
+                else:
+                    entity_ids.setdefault(entity_id, []).append(name)
+
+            pending = []
+            for entity_id in list(entity_ids):
+                stored = self._stored_details(entity_id)
+                if stored is not None:
+                    yield from self._batch_results(entity_ids.pop(entity_id), stored)
+            for chunk in self._chunk_ids(list(entity_ids)):
+                pending.append(executor.submit(copy_context().run, self._fetch_chunk_details, chunk))
+            for future in as_completed(pending):
+                chunk, details = future.result()
+                for entity_id in chunk:
+                    yield from self._batch_results(entity_ids[entity_id], details.get(entity_id))
+
+    def _batch_inputs(self, items: List[str]):
+        """Split inputs into a QID -> inputs map and a list of names, dropping duplicates"""
+        entity_ids: Dict[str, List[str]] = {}
+        names = []
+        for item in dict.fromkeys(item.strip() for item in items if item and item.strip()):
+            if QID_PATTERN.fullmatch(item.upper()):
+                entity_ids.setdefault(item.upper(), []).append(item)
+            else:
+                names.append(item)
+        return entity_ids, names
+
+    def _batch_results(self, inputs: List[str], details: Optional[Dict]) -> List[Dict]:
+        if details is not None and details.get("status") == "error":
+            return [dict(details, input=item) for item in inputs]
+        if details is None or details.get("status") != "ok":
+            return [self._batch_not_found(item) for item in inputs]
+        return [dict(details, input=item) for item in inputs]
+
+    def _batch_not_found(self, item: str) -> Dict:
+        return {"input": item, "status": "not_found"}
+
+    def _resolve_name(self, name: str):
+        """Best real or fictional match for a name, as (name, QID or None)"""
+        results = self.search(name)
+        return name, results[0]["id"] if results else None
+
+    def _fetch_chunk_details(self, chunk: List[str]):
+        result = self._make_request(self.wikidata_endpoint, self._entity_details_params("|".join(chunk)))
+        entities = self._chunk_entities(chunk, result)
+        if self._chunk_failed(result):
+            return chunk, self._chunk_errors(chunk)
+        return chunk, self._chunk_details(entities, self._get_labels_map(self._chunk_label_ids(entities)))
+
+    def _chunk_failed(self, result: Dict) -> bool:
+        return "error" in result or "entities" not in result
+
+    def _chunk_errors(self, chunk: List[str]) -> Dict[str, Dict]:
+        # Сбой вызова не означает, что сущностей нет: каждая получает статус error, а не not_found
+        return {entity_id: self._details_error({"name": entity_id}) for entity_id in chunk}
+
+    def _chunk_entities(self, chunk: List[str], result: Dict) -> Dict[str, tuple]:
+        """Entity, payload and referenced label ids of every found entity of a batched fetch"""
+        entities = {}
+        for entity_id in chunk:
+            entity_data = result.get("entities", {}).get(entity_id)
+            if entity_data is None or "missing" in entity_data:
+                continue
+            entity = self._base_entity(entity_id, entity_data)
+            entities[entity_id] = (entity, entity_data, self._collect_label_ids(entity_data.get("claims", {})))
+        if self._chunk_failed(result):
+            logger.error("Error getting entities %s: %s", chunk, result.get("error", "Unknown error"))
+        return entities
+
+    def _chunk_label_ids(self, entities: Dict[str, tuple]) -> List[str]:
+        return [label_id for _, _, referenced_ids in entities.values()
+                for ids in referenced_ids.values() for label_id in ids]
+
+    def _chunk_details(self, entities: Dict[str, tuple], labels: Dict[str, str]) -> Dict[str, Dict]:
+        """Build and store the details of every entity of a chunk"""
+        return {
+            entity_id: self._remember_details(entity_data, self._build_entity_details(entity, entity_data, referenced_ids, labels))
+            for entity_id, (entity, entity_data, referenced_ids) in entities.items()
+        }
+
+    def _details_error(self, entity: Dict) -> Dict:
+        return {
+            "status": "error",
+            "name": entity["name"],
+            "summary": "Ошибка при получении данных."
+        }
+
+    def _entity_data(self, entity: Dict, result: Dict) -> Optional[Dict]:
+        """Extract the entity payload from a wbgetentities response"""
+        if "error" in result or "entities" not in result:
+            logger.error("Error getting entity details for %s: %s", entity['id'], result.get('error', 'Unknown error'))
+            return None
+        entity_data = result["entities"].get(entity["id"], {"missing": ""})
+        if "missing" in entity_data:
+            logger.warning("Entity %s is missing", entity["id"])
+            return None
+        return entity_data
+
+    def _build_entity_details(self, entity: Dict, entity_data: Dict,
+                              referenced_ids: Dict[str, List[str]], labels: Dict[str, str]) -> Dict:
+        """Build the character dict from an entity payload and resolved labels"""
+        claims = entity_data.get("claims", {})
+
         # Get name from labels or aliases
         name = None
         if "labels" in entity_data and self.lang in entity_data["labels"]:
@@ -265,7 +797,13 @@ class WikipediaHelper:
             name = entity_data["aliases"][self.lang][0]["value"]
         else:
             name = entity["name"]  # Fallback to original name
-            
+
+        # Occupation (P106)
+        occupation = self._join_labels(referenced_ids["P106"], labels)
+
+        # Known for (P737)
+        known_for = self._join_labels(referenced_ids["P737"], labels)
+
         # Get description from multiple sources
         description = None
         
@@ -275,24 +813,6 @@ class WikipediaHelper:
             
         # 2. Try to get from claims
         if not description:
-            claims = entity_data.get("claims", {})
-            
-            # Occupation (P106)
-            occupation = None
-            if "P106" in claims:
-                occupation_ids = [claim["mainsnak"]["datavalue"]["value"]["id"] for claim in claims["P106"]]
-                occupation_labels = self._get_entity_labels(occupation_ids)
-                if occupation_labels:
-                    occupation = ", ".join(occupation_labels)
-                    
-            # Known for (P737)
-            known_for = None
-            if "P737" in claims:
-                known_for_ids = [claim["mainsnak"]["datavalue"]["value"]["id"] for claim in claims["P737"]]
-                known_for_labels = self._get_entity_labels(known_for_ids)
-                if known_for_labels:
-                    known_for = ", ".join(known_for_labels)
-                    
             # Create description from claims
             description_parts = []
             if occupation:
@@ -316,17 +836,6 @@ class WikipediaHelper:
         if "sitelinks" in entity_data and f"{self.lang}wiki" in entity_data["sitelinks"]:
             wiki_url = f"https://{self.lang}.wikipedia.org/wiki/{entity_data['sitelinks'][f'{self.lang}wiki']['title'].replace(' ', '_')}"
             
-        # Extract additional information from claims
-        claims = entity_data.get("claims", {})
-        
-        # Occupation (P106)
-        occupation = None
-        if "P106" in claims:
-            occupation_ids = [claim["mainsnak"]["datavalue"]["value"]["id"] for claim in claims["P106"]]
-            occupation_labels = self._get_entity_labels(occupation_ids)
-            if occupation_labels:
-                occupation = ", ".join(occupation_labels)
-        
         # Birth date (P569)
         birth_date = None
         if "P569" in claims:
@@ -340,20 +849,7 @@ class WikipediaHelper:
             death_date = self._format_date(death_date)
         
         # Nationality (P27)
-        nationality = None
-        if "P27" in claims:
-            nationality_ids = [claim["mainsnak"]["datavalue"]["value"]["id"] for claim in claims["P27"]]
-            nationality_labels = self._get_entity_labels(nationality_ids)
-            if nationality_labels:
-                nationality = ", ".join(nationality_labels)
-        
-        # Known for (P737)
-        known_for = None
-        if "P737" in claims:
-            known_for_ids = [claim["mainsnak"]["datavalue"]["value"]["id"] for claim in claims["P737"]]
-            known_for_labels = self._get_entity_labels(known_for_ids)
-            if known_for_labels:
-                known_for = ", ".join(known_for_labels)
+        nationality = self._join_labels(referenced_ids["P27"], labels)
         
         # Get images (P18)
         images = []
@@ -365,46 +861,21 @@ class WikipediaHelper:
         
         # Additional fields for more comprehensive information
         # Gender (P21)
-        gender = None
-        if "P21" in claims:
-            gender_id = claims["P21"][0]["mainsnak"]["datavalue"]["value"]["id"]
-            gender_labels = self._get_entity_labels([gender_id])
-            if gender_labels:
-                gender = gender_labels[0]
+        gender = self._join_labels(referenced_ids["P21"], labels)
         
         # Place of birth (P19)
-        place_of_birth = None
-        if "P19" in claims:
-            place_id = claims["P19"][0]["mainsnak"]["datavalue"]["value"]["id"]
-            place_labels = self._get_entity_labels([place_id])
-            if place_labels:
-                place_of_birth = place_labels[0]
+        place_of_birth = self._join_labels(referenced_ids["P19"], labels)
         
         # Place of death (P20)
-        place_of_death = None
-        if "P20" in claims:
-            place_id = claims["P20"][0]["mainsnak"]["datavalue"]["value"]["id"]
-            place_labels = self._get_entity_labels([place_id])
-            if place_labels:
-                place_of_death = place_labels[0]
+        place_of_death = self._join_labels(referenced_ids["P20"], labels)
         
         # Languages spoken (P1412)
-        languages = None
-        if "P1412" in claims:
-            language_ids = [claim["mainsnak"]["datavalue"]["value"]["id"] for claim in claims["P1412"]]
-            language_labels = self._get_entity_labels(language_ids)
-            if language_labels:
-                languages = ", ".join(language_labels)
+        languages = self._join_labels(referenced_ids["P1412"], labels)
         
         # Awards (P166)
-        awards = None
-        if "P166" in claims:
-            award_ids = [claim["mainsnak"]["datavalue"]["value"]["id"] for claim in claims["P166"]]
-            award_labels = self._get_entity_labels(award_ids)
-            if award_labels:
-                awards = ", ".join(award_labels)
+        awards = self._join_labels(referenced_ids["P166"], labels)
         
-        logger.info(f"Got details for entity {entity['id']}: {description[:100]}...")
+        logger.info("Got details for entity %s: %s...", entity['id'], description[:100])
         
         # Always provide a fallback URL to Wikidata
         wikidata_url = f"https://www.wikidata.org/wiki/{entity['id']}"
@@ -429,123 +900,154 @@ class WikipediaHelper:
             "awards": awards
         }
         
-    def _get_entity_labels(self, entity_ids: List[str]) -> List[str]:
-        """Get labels for multiple entities"""
-        if not entity_ids:
-            return []
-            
+    def _collect_label_ids(self, claims: Dict) -> Dict[str, List[str]]:
+        """Collect entity ids referenced by the claims whose labels are displayed"""
+        referenced_ids = {}
+        for prop, first_only in LABEL_PROPERTIES.items():
+            ids = [claim["mainsnak"]["datavalue"]["value"]["id"]
+                   for claim in claims.get(prop, [])
+                   if "datavalue" in claim["mainsnak"]]
+            referenced_ids[prop] = ids[:1] if first_only else ids
+        return referenced_ids
+
+    def _join_labels(self, entity_ids: List[str], labels: Dict[str, str]) -> Optional[str]:
+        """Join resolved labels for the given ids, skipping unresolved ones"""
+        resolved = [labels[entity_id] for entity_id in entity_ids if entity_id in labels]
+        if not resolved:
+            return None
+        return ", ".join(resolved)
+
+    def _get_labels_map(self, entity_ids: List[str]) -> Dict[str, str]:
+        """Fetch labels for all given ids in chunks of 50 and return an id -> label map"""
+        labels = {}
+        for chunk in self._chunk_ids(entity_ids):
+            result = self._make_request(self.wikidata_endpoint, self._labels_params(chunk))
+            labels.update(self._parse_labels(chunk, result))
+        return labels
+
+    def _labels_params(self, chunk: List[str]) -> str:
+        """Build the params string for a batched labels lookup"""
         params = {
             "action": "wbgetentities",
             "format": "json",
-            "ids": "|".join(entity_ids),
+            "ids": "|".join(chunk),
             "languages": self.lang,
             "props": "labels"
         }
-        
-        result = self._make_request(self.wikidata_endpoint, json.dumps(params, sort_keys=True))
-        
+        return json.dumps(params, sort_keys=True)
+
+    def _parse_labels(self, chunk: List[str], result: Dict) -> Dict[str, str]:
+        """Extract an id -> label map from a batched labels response"""
         if "error" in result or "entities" not in result:
-            return []
-            
-        labels = []
-        for entity_id in entity_ids:
-            if entity_id in result["entities"]:
-                entity = result["entities"][entity_id]
-                if "labels" in entity and self.lang in entity["labels"]:
-                    labels.append(entity["labels"][self.lang]["value"])
-                    
+            logger.error("Error getting labels for entities %s: %s", chunk, result.get('error', 'Unknown error'))
+            return {}
+
+        labels = {}
+        for entity_id in chunk:
+            entity = result["entities"].get(entity_id, {})
+            if "labels" in entity and self.lang in entity["labels"]:
+                labels[entity_id] = entity["labels"][self.lang]["value"]
         return labels
 
     def get_random(self, type: str) -> Optional[Dict]:
         """Get a random entity of specified type"""
-        logger.info(f"Getting random entity of type: {type}")
+        logger.info("Getting random entity of type: %s", type)
         
-        if type not in ["fictional", "real"]:
-            logger.error(f"Invalid entity type: {type}")
+        entities = self.get_random_entities(type, 1)
+        if not entities:
             return None
-        
-        # Используем SPARQL для получения случайной сущности нужного типа
-        if type == "real":
-            # Для реальных людей
-            sparql_query = """
-            SELECT ?item ?itemLabel WHERE {
-              ?item wdt:P31 wd:Q5 .
-              SERVICE wikibase:label { bd:serviceParam wikibase:language "ru,en". }
-              ?item rdfs:label ?itemLabel .
-              FILTER(LANG(?itemLabel) = "ru")
-            }
-            ORDER BY RAND()
-            LIMIT 10
-            """
-        else:
-            # Для вымышленных персонажей
-            sparql_query = """
-            SELECT ?item ?itemLabel WHERE {
-              ?item wdt:P31 ?type .
-              VALUES ?type { wd:Q15632617 wd:Q15632618 wd:Q95074 wd:Q4167410 }
-              SERVICE wikibase:label { bd:serviceParam wikibase:language "ru,en". }
-              ?item rdfs:label ?itemLabel .
-              FILTER(LANG(?itemLabel) = "ru")
-            }
-            ORDER BY RAND()
-            LIMIT 10
-            """
-        
-        result = self._make_sparql_request(sparql_query)
-        
+
+        entity = entities[0]
+        logger.info("Found random entity: %s (%s)", entity['name'], entity['id'])
+
+        # Получаем детали сущности
+        return self._get_entity_details(entity)
+
+    def get_random_entities(self, type: str, count: int = 10) -> List[Dict]:
+        """Sample up to count random entities of specified type from the candidate index"""
+        if type not in ["fictional", "real"]:
+            logger.error("Invalid entity type: %s", type)
+            return []
+
+        return self.candidates.sample(type, count)
+
+    def _load_candidates(self, type: str) -> List[Dict]:
+        """Dump all candidates of the given type with one SPARQL query"""
+        if self.offline is not None:
+            return self.offline.candidates(type, self.lang, self.candidates_limit)
+        # Индекс вызывает загрузчик синхронно в своём потоке, поэтому синхронная
+        # реализация вызывается явно и для асинхронного помощника
+        result = WikipediaHelper._make_sparql_request(self, self._candidates_sparql_query(type),
+                                                      timeout=CANDIDATES_SPARQL_TIMEOUT)
+        return self._parse_random_entities(type, result)
+
+    def _candidates_sparql_query(self, type: str) -> str:
+        """Build the SPARQL query that lists a fresh uniform random sample of candidates of the given type"""
+        # ORDER BY RAND() сортирует весь класс и не укладывается в таймаут, а LIMIT без сортировки
+        # отдаёт всегда один и тот же произвольный срез. Сервис bd:sample выбирает случайные
+        # утверждения P31 без полного перебора, поэтому каждое обновление берёт новую выборку
+        class_ids = ["Q5"] if type == "real" else FICTIONAL_TYPES
+        limit = self.candidates_limit // len(class_ids)
+        branches = " UNION ".join(self._candidates_sample(class_id, limit) for class_id in class_ids)
+        return "SELECT ?item ?itemLabel WHERE { %s }" % branches
+
+    def _candidates_sample(self, class_id: str, limit: int) -> str:
+        return """{
+              SELECT ?item ?itemLabel WHERE {
+                SERVICE bd:sample {
+                  ?item wdt:P31 wd:%s .
+                  bd:serviceParam bd:sample.limit %d .
+                  bd:serviceParam bd:sample.sampleType "RANDOM" .
+                }
+                ?item rdfs:label ?itemLabel .
+                FILTER(LANG(?itemLabel) = "%s")
+              }
+              LIMIT %d
+            }""" % (class_id, limit * CANDIDATES_SAMPLE_FACTOR, self.lang, limit)
+
+    def _parse_random_entities(self, type: str, result: Dict) -> List[Dict]:
+        """Extract entities from the SPARQL response"""
         if "error" in result:
-            logger.error(f"Error in SPARQL query: {result['error']}")
-            return None
+            logger.error("Error in SPARQL query: %s", result['error'])
+            return []
             
         if "results" not in result or "bindings" not in result["results"] or not result["results"]["bindings"]:
             logger.warning("No results from SPARQL query")
-            return None
-            
-        # Выбираем случайный результат
-        bindings = result["results"]["bindings"]
-        if not bindings:
-            logger.warning("Empty bindings from SPARQL query")
-            return None
+            return []
             
-        random_item = random.choice(bindings)
-        entity_id = random_item["item"]["value"].split("/")[-1]
-        entity_name = random_item["itemLabel"]["value"]
-        
-        logger.info(f"Found random entity: {entity_name} ({entity_id})")
-        
-        # Получаем детали сущности
-        return self._get_entity_details({
-            "id": entity_id,
-            "name": entity_name,
-            "type": type,
-            "description": ""
-        })
+        return [
+            {
+                "id": binding["item"]["value"].split("/")[-1],
+                "name": binding["itemLabel"]["value"],
+                "type": type,
+                "description": ""
+            }
+            for binding in result["results"]["bindings"]
+        ]
 
     def get_entity_by_id(self, entity_id: str) -> Optional[Dict]:
         """Get detailed information about an entity by its ID"""
-        logger.info(f"Getting entity details by ID: {entity_id}")
+        logger.info("Getting entity details by ID: %s", entity_id)
         
         try:
-            # Определяем тип сущности
-            entity_type = self._get_entity_type(entity_id)
-            
-            # Создаем объект с базовой информацией
-            entity = {
-                "id": entity_id,
-                "name": "",  # Будет заполнено из ответа API
-                "type": entity_type,
-                "description": ""
-            }
+            stored = self._stored_details(entity_id)
+            if stored is not None:
+                return stored
+
+            # Тип определяется по утверждениям из того же ответа wbgetentities, отдельный запрос не нужен
+            result = self._make_request(self.wikidata_endpoint, self._entity_details_params(entity_id))
+            entity = self._base_entity(entity_id, result.get("entities", {}).get(entity_id, {}))
             
             # Получаем детали сущности
-            result = self._get_entity_details(entity)
+            result = self._get_entity_details(entity, result)
             
             if result and result.get("status") == "ok":
+                self.suggestions.add(entity_id, result["name"], entity["type"], result.get("description", ""))
                 return result
             else:
-                logger.warning(f"Failed to get entity details for ID: {entity_id}")
+                logger.warning("Failed to get entity details for ID: %s", entity_id)
                 return None
 
         except Exception as e:
-            logger.error(f"Error getting entity by ID: {e}")
+            logger.error("Error getting entity by ID: %s", e)
             return None
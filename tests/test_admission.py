@@ -0,0 +1,80 @@
+import threading
+import time
+import unittest
+
+from services.admission import ConcurrencyLimiter
+
+
+def acquire_in_thread(limiter):
+    """Start acquire() in a thread; the returned list gets its result"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(limiter.acquire()))
+    thread.start()
+    return thread, result
+
+
+def wait_for(predicate, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+class ConcurrencyLimiterTest(unittest.TestCase):
+    def test_queued_request_gets_the_released_slot(self):
+        limiter = ConcurrencyLimiter("test", limit=1, queue_size=1, queue_timeout=1)
+        self.assertTrue(limiter.acquire())
+        thread, result = acquire_in_thread(limiter)
+        wait_for(lambda: limiter.waiting == 1)
+        limiter.release()
+        thread.join(1)
+        self.assertEqual(result, [True])
+        self.assertEqual((limiter.active, limiter.waiting, limiter.shed), (1, 0, 0))
+
+    def test_full_queue_sheds_at_once(self):
+        limiter = ConcurrencyLimiter("test", limit=1, queue_size=1, queue_timeout=1)
+        self.assertTrue(limiter.acquire())
+        thread, result = acquire_in_thread(limiter)
+        wait_for(lambda: limiter.waiting == 1)
+        started = time.monotonic()
+        self.assertFalse(limiter.acquire())
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(limiter.shed, 1)
+        limiter.release()
+        thread.join(1)
+        self.assertEqual(result, [True])
+
+    def test_wait_times_out(self):
+        limiter = ConcurrencyLimiter("test", limit=1, queue_size=1, queue_timeout=0.05)
+        self.assertTrue(limiter.acquire())
+        started = time.monotonic()
+        self.assertFalse(limiter.acquire())
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual((limiter.active, limiter.waiting, limiter.shed), (1, 0, 1))
+
+    def test_slots_are_not_lost_when_waits_time_out(self):
+        # Ожидания истекают одновременно с освобождением слотов; после нагрузки слоты должны быть свободны
+        limiter = ConcurrencyLimiter("test", limit=2, queue_size=16, queue_timeout=0.003)
+        admitted = []
+
+        def worker():
+            for _ in range(50):
+                if limiter.acquire():
+                    admitted.append(1)
+                    time.sleep(0.001)
+                    limiter.release()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual((limiter.active, limiter.waiting), (0, 0))
+        self.assertEqual(len(admitted) + limiter.shed, 8 * 50)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from benchmarks.fixture_server import FixtureServer, synthetic_fixtures
+from services.async_wikipedia_service import AsyncWikipediaHelper
+from services.cache import MemoryCache
+from services.entity_store import EntityStore
+
+
+class StandaloneAsyncHelperTest(unittest.TestCase):
+    """AsyncWikipediaHelper built on its own, without indexes injected by app.py"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fixtures = synthetic_fixtures(count=40)
+        cls.server = FixtureServer(cls.fixtures).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.helper = AsyncWikipediaHelper(
+            "ru",
+            cache=MemoryCache(),
+            entity_store=EntityStore(os.path.join(self.workdir.name, "entities.sqlite3")),
+            wikidata_endpoint=self.server.wikidata_endpoint,
+            sparql_endpoint=self.server.sparql_endpoint,
+        )
+        self.entity_ids = [qid for qid, entity in self.fixtures["entities"].items() if "claims" in entity][:3]
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def run_helper(self, method, *args):
+        # Клиент httpx привязан к event loop, поэтому закрываем его в том же цикле
+        async def call():
+            async with self.helper:
+                return await method(*args)
+        return asyncio.run(call())
+
+    def test_get_random_loads_candidates(self):
+        result = self.run_helper(self.helper.get_random, "real")
+        self.assertEqual(result["status"], "ok")
+        self.assertEqual(result["type"], "real")
+
+    def test_get_revisions(self):
+        revisions = self.run_helper(self.helper.get_revisions, self.entity_ids)
+        self.assertEqual(set(revisions), set(self.entity_ids))
+        self.assertTrue(all(isinstance(revision, int) for revision in revisions.values()))
+
+    def test_refresh_entities(self):
+        self.assertEqual(self.run_helper(self.helper.refresh_entities, self.entity_ids), len(self.entity_ids))
+        for entity_id in self.entity_ids:
+            self.assertEqual(self.helper.entity_store.get(entity_id, "ru")["status"], "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from services import cache as cache_module
+from services.cache import TOUCH_INTERVAL, SQLiteCache
+
+
+class FakeClock:
+    """Stands in for the time module of services.cache"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class SQLiteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        patcher = mock.patch.object(cache_module, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **kwargs):
+        return SQLiteCache(os.path.join(self.directory, "cache.sqlite3"), **kwargs)
+
+    def stored_size(self, cache):
+        return cache._connect().execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def test_expired_value_is_served_stale_until_stale_for(self):
+        cache = self.make_cache(stale_for=100)
+        cache.set("key", {"value": 1}, ttl=10)
+        self.assertEqual(cache.get("key"), {"value": 1})
+        self.clock.now += 11
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.peek_stale("key"), {"value": 1})
+        self.clock.now += 100
+        self.assertIsNone(cache.peek_stale("key"))
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_size_total_follows_inserts_updates_and_deletes(self):
+        cache = self.make_cache()
+        cache.set("a", "x" * 10, ttl=60)
+        cache.set("b", "y" * 20, ttl=60)
+        cache.set("a", "x" * 30, ttl=60)
+        self.assertEqual(cache.stats()["bytes"], self.stored_size(cache))
+        self.assertEqual(cache.stats()["entries"], 2)
+        cache.clear()
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+    def test_total_is_rebuilt_for_a_cache_created_without_triggers(self):
+        cache = self.make_cache()
+        cache.set("a", "x" * 10, ttl=60)
+        cache._connect().execute("DROP TABLE cache_size")
+        reopened = self.make_cache()
+        self.assertEqual(reopened.stats()["bytes"], self.stored_size(reopened))
+
+    def test_least_recently_used_entry_is_evicted_first(self):
+        entry_size = len('"' + "x" * 100 + '"')
+        cache = self.make_cache(max_bytes=entry_size * 2)
+        cache.set("a", "x" * 100, ttl=3600)
+        self.clock.now += 1
+        cache.set("b", "x" * 100, ttl=3600)
+        # Чтение обновляет время обращения не чаще раза в TOUCH_INTERVAL
+        self.clock.now += TOUCH_INTERVAL + 1
+        self.assertIsNotNone(cache.get("a"))
+        cache.set("c", "x" * 100, ttl=3600)
+        self.assertIsNotNone(cache.peek("a"))
+        self.assertIsNone(cache.peek("b"))
+        self.assertIsNotNone(cache.peek("c"))
+        self.assertLessEqual(cache.stats()["bytes"], cache.max_bytes)
+
+    def test_entries_past_stale_for_are_evicted_before_fresh_ones(self):
+        entry_size = len('"' + "x" * 100 + '"')
+        cache = self.make_cache(max_bytes=entry_size * 2, stale_for=10)
+        cache.set("fresh", "x" * 100, ttl=3600)
+        self.clock.now += 1
+        cache.set("expired", "x" * 100, ttl=1)
+        self.clock.now += 20
+        cache.set("new", "x" * 100, ttl=3600)
+        self.assertIsNotNone(cache.peek("fresh"))
+        self.assertIsNotNone(cache.peek("new"))
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_value_larger_than_the_cache_is_not_stored(self):
+        cache = self.make_cache(max_bytes=10)
+        cache.set("big", "x" * 100, ttl=60)
+        self.assertIsNone(cache.peek("big"))
+
+    def test_lease_is_exclusive_until_released_or_expired(self):
+        cache = self.make_cache()
+        other = self.make_cache()
+        self.assertTrue(cache.acquire_lease("key", ttl=15))
+        self.assertFalse(other.acquire_lease("key", ttl=15))
+        self.assertTrue(other.lease_active("key"))
+        cache.release_lease("key")
+        self.assertFalse(other.lease_active("key"))
+        self.assertTrue(other.acquire_lease("key", ttl=15))
+        # Владелец упал: по истечении аренды её забирает другой процесс
+        self.clock.now += 16
+        self.assertFalse(cache.lease_active("key"))
+        self.assertTrue(cache.acquire_lease("key", ttl=15))
+
+
+if __name__ == "__main__":
+    unittest.main()
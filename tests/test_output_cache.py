@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+# app читает настройки при импорте: кэши во временном каталоге, без прогрева и фоновых потоков
+DATA_DIR = tempfile.mkdtemp()
+os.environ.update({
+    "WHOAMI_CACHE_PATH": os.path.join(DATA_DIR, "cache.sqlite3"),
+    "WHOAMI_CANDIDATES_PATH": os.path.join(DATA_DIR, "candidates.json"),
+    "WHOAMI_ENTITY_STORE_PATH": os.path.join(DATA_DIR, "entities.sqlite3"),
+    "WHOAMI_THUMBNAIL_DIR": os.path.join(DATA_DIR, "thumbnails"),
+    "WHOAMI_LOG_FILE": "",
+    "WHOAMI_LOG_LEVEL": "WARNING",
+    "WHOAMI_WARMUP": "0",
+    "WHOAMI_DEFER_BACKGROUND": "1",
+})
+
+import app  # noqa: E402
+
+ENTITY = {
+    "id": "Q42",
+    "lastrevid": 1,
+    "labels": {"ru": {"language": "ru", "value": "Дуглас Адамс"}},
+    "descriptions": {"ru": {"language": "ru", "value": "писатель"}},
+    "claims": {"P31": [{"mainsnak": {"datavalue": {"value": {"id": "Q5"}}}}]},
+    "sitelinks": {},
+}
+
+
+class CachedPageTest(unittest.TestCase):
+    """/search?id= goes through cached_page: ETag, Last-Modified and 304 on revalidation"""
+
+    def setUp(self):
+        self.helper = app.wikipedia_helpers.get("ru")
+        self.helper.cache.clear()
+        self.calls = []
+        self.helper._make_request = self.fake_request
+        self.addCleanup(vars(self.helper).pop, "_make_request")
+        self.client = app.app.test_client()
+
+    def fake_request(self, endpoint, params_str):
+        self.calls.append(params_str)
+        if '"ids": "Q42"' in params_str:
+            return {"entities": {"Q42": ENTITY}}
+        return {"entities": {"Q404": {"id": "Q404", "missing": ""}}}
+
+    def test_page_is_cached_with_validators(self):
+        first = self.client.get("/search?id=Q42")
+        self.assertEqual(first.status_code, 200)
+        self.assertIsNotNone(first.headers.get("ETag"))
+        self.assertIsNotNone(first.headers.get("Last-Modified"))
+        self.assertIn("public", first.headers["Cache-Control"])
+
+        calls = len(self.calls)
+        second = self.client.get("/search?id=Q42")
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.headers["ETag"], first.headers["ETag"])
+        self.assertEqual(len(self.calls), calls)
+
+    def test_matching_etag_gets_304(self):
+        etag = self.client.get("/search?id=Q42").headers["ETag"]
+        response = self.client.get("/search?id=Q42", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_changed_etag_gets_the_page(self):
+        self.client.get("/search?id=Q42")
+        response = self.client.get("/search?id=Q42", headers={"If-None-Match": '"outdated"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Дуглас Адамс", response.get_data(as_text=True))
+
+    def test_not_found_page_is_not_cached(self):
+        response = self.client.get("/search?id=Q404")
+        self.assertIsNone(response.headers.get("ETag"))
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        self.assertIsNone(app.output_cache.lookup(app.output_cache.key("ru", "id", "Q404")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import time
+import unittest
+
+from services.resilience import CircuitBreaker, CircuitOpenError
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def open_breaker(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.06)
+        return breaker
+
+    def test_single_probe_when_half_open(self):
+        breaker = self.open_breaker()
+        self.assertTrue(breaker.check())
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+        breaker.record_success()
+        self.assertFalse(breaker.check())
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_abandoned_probe_reopens_the_circuit(self):
+        breaker = self.open_breaker()
+        self.assertTrue(breaker.check())
+        breaker.abandon_probe()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.06)
+        self.assertTrue(breaker.check())
+
+    def test_abandon_after_outcome_is_a_no_op(self):
+        breaker = self.open_breaker()
+        self.assertTrue(breaker.check())
+        breaker.record_success()
+        breaker.abandon_probe()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
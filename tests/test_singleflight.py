@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from services.singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    def run_followers(self, flight, fn, count=4):
+        """Call flight.do from count threads while the leader is blocked; returns their outcomes"""
+        outcomes = []
+        lock = threading.Lock()
+
+        def call():
+            try:
+                outcome = flight.do("key", fn)
+            except Exception as e:
+                outcome = e
+            with lock:
+                outcomes.append(outcome)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+
+    def wait_for_leader(self, started):
+        self.assertTrue(started.wait(1))
+        # Последователи успевают присоединиться к уже идущему вызову
+        time.sleep(0.05)
+
+    def test_followers_get_the_leader_result(self):
+        flight = SingleFlight()
+        started, finish = threading.Event(), threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            finish.wait(1)
+            return {"value": 42}
+
+        threads, outcomes = self.run_followers(flight, fn)
+        self.wait_for_leader(started)
+        self.assertEqual(flight.in_flight(), 1)
+        finish.set()
+        for thread in threads:
+            thread.join(1)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [{"value": 42}] * 4)
+        self.assertTrue(all(outcome is outcomes[0] for outcome in outcomes))
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_followers_get_the_leader_exception(self):
+        flight = SingleFlight()
+        started, finish = threading.Event(), threading.Event()
+        error = ValueError("upstream failed")
+
+        def fn():
+            started.set()
+            finish.wait(1)
+            raise error
+
+        threads, outcomes = self.run_followers(flight, fn)
+        self.wait_for_leader(started)
+        finish.set()
+        for thread in threads:
+            thread.join(1)
+        self.assertEqual(outcomes, [error] * 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_next_call_after_a_flight_runs_again(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+        self.assertEqual(flight.do("key", lambda: 2), 2)
+
+    def test_async_follower_joins_a_sync_leader(self):
+        flight = SingleFlight()
+        started, finish = threading.Event(), threading.Event()
+
+        def fn():
+            started.set()
+            finish.wait(1)
+            return "shared"
+
+        async def not_called():
+            raise AssertionError("follower must not run the function")
+
+        threads, outcomes = self.run_followers(flight, fn, count=1)
+        self.wait_for_leader(started)
+
+        async def follow():
+            follower = asyncio.ensure_future(flight.do_async("key", not_called))
+            await asyncio.sleep(0.01)
+            finish.set()
+            return await follower
+
+        self.assertEqual(asyncio.run(follow()), "shared")
+        threads[0].join(1)
+        self.assertEqual(outcomes, ["shared"])
+
+
+if __name__ == "__main__":
+    unittest.main()
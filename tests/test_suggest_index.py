@@ -0,0 +1,33 @@
+import unittest
+
+from services.suggest_index import SuggestIndex
+
+
+class SuggestIndexTest(unittest.TestCase):
+    def test_batch_merge_keeps_keys_sorted(self):
+        index = SuggestIndex()
+        index.add_many((f"Q{i}", f"Персонаж {i:03d} Фамилия", "real", "", ()) for i in range(0, 100, 2))
+        index.add_many((f"Q{i}", f"Персонаж {i:03d} Фамилия", "fictional", "", ()) for i in range(1, 100, 2))
+        self.assertEqual(index._keys, sorted(index._keys))
+        self.assertEqual([s["id"] for s in index.lookup("персонаж 01", 20)],
+                         [f"Q{i}" for i in range(10, 20)])
+
+    def test_lookup_matches_any_word(self):
+        index = SuggestIndex()
+        index.add("Q937", "Альберт Эйнштейн", "real")
+        self.assertEqual(index.lookup("эйнш")[0]["id"], "Q937")
+
+    def test_least_recently_seen_entities_are_evicted(self):
+        index = SuggestIndex(max_entities=100)
+        index.add_many((f"Q{i}", f"Имя {i}", "real", "", ()) for i in range(100))
+        # Подсказанная сущность становится недавней и переживает вытеснение
+        self.assertEqual(index.lookup("имя 0", 1)[0]["id"], "Q0")
+        index.add("Q100", "Имя 100", "real")
+        self.assertLessEqual(len(index), 100)
+        self.assertTrue(index.types(["Q0"]))
+        self.assertFalse(index.types(["Q1"]))
+        self.assertFalse(any(entity_id == "Q1" for _, entity_id in index._keys))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from services.cache import MemoryCache
+from services.wikipedia_service import FICTIONAL_TYPES, WikipediaHelper, classify_entity
+
+
+def instance_of(*ids):
+    return [{"mainsnak": {"datavalue": {"value": {"id": qid}}}} for qid in ids]
+
+
+class ClassifyEntityTest(unittest.TestCase):
+    """classify_entity gets every claim from wbgetentities but classifies by P31 only"""
+
+    def test_human_is_real(self):
+        self.assertEqual(classify_entity({"claims": {"P31": instance_of("Q5")}}), "real")
+
+    def test_fictional_human(self):
+        self.assertEqual(classify_entity({"claims": {"P31": instance_of("Q15632617")}}), "fictional")
+
+    def test_work_with_series_and_performance_claims_is_other(self):
+        film = {"claims": {"P31": instance_of("Q11424"), "P179": [{}], "P1191": [{}], "P1441": [{}]}}
+        self.assertEqual(classify_entity(film), "other")
+
+    def test_no_instance_of_is_other(self):
+        self.assertEqual(classify_entity({"claims": {"P1441": [{}]}}), "other")
+
+
+class CandidatesQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.helper = WikipediaHelper("ru", cache=MemoryCache(), candidates_limit=1000)
+
+    def test_real_candidates_are_randomly_sampled(self):
+        query = self.helper._candidates_sparql_query("real")
+        self.assertIn("SERVICE bd:sample", query)
+        self.assertIn('bd:sample.sampleType "RANDOM"', query)
+        self.assertIn("wd:Q5 .", query)
+        self.assertNotIn("ORDER BY", query)
+
+    def test_every_fictional_class_gets_its_own_sample(self):
+        query = self.helper._candidates_sparql_query("fictional")
+        for class_id in FICTIONAL_TYPES:
+            self.assertIn(f"wd:{class_id} .", query)
+        self.assertEqual(query.count("LIMIT 250"), len(FICTIONAL_TYPES))
+
+
+class BatchErrorTest(unittest.TestCase):
+    """A failed wbgetentities call is an error for its ids, not proof they do not exist"""
+
+    def setUp(self):
+        self.helper = WikipediaHelper("ru", cache=MemoryCache())
+
+    def test_failed_chunk_yields_errors(self):
+        self.helper._make_request = lambda endpoint, params_str: {"error": "timeout"}
+        results = list(self.helper.get_entities_by_ids(["Q42", "q42"]))
+        self.assertEqual(sorted(result["input"] for result in results), ["Q42", "q42"])
+        for result in results:
+            self.assertEqual(result["status"], "error")
+            self.assertEqual(result["summary"], "Ошибка при получении данных.")
+
+    def test_missing_entity_is_not_found(self):
+        self.helper._make_request = lambda endpoint, params_str: {"entities": {"Q42": {"id": "Q42", "missing": ""}}}
+        self.assertEqual(list(self.helper.get_entities_by_ids(["Q42"])), [{"input": "Q42", "status": "not_found"}])
+
+
+if __name__ == "__main__":
+    unittest.main()